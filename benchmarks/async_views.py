@@ -0,0 +1,69 @@
+"""
+Sync vs async views under uvicorn at high concurrency, against a local SQLite stand-in for postgres.
+
+    pip install uvicorn
+    python -m benchmarks.async_views --clients 500 --duration 20
+
+Both modes serve the same seeded dataset; the async mode is the same server started with ASYNC_VIEWS=1.
+Every query pays --db-latency-ms of simulated network round trip; with raw SQLite (0) the work is CPU bound
+and there is nothing for async views to overlap.
+Prints requests per second and latency percentiles for each mode
+"""
+import argparse
+import asyncio
+import json
+from urllib.parse import urlencode
+
+from benchmarks.common import setup_django, seed, start_uvicorn, drive_http
+
+
+def make_request_factory(users: int, write_ratio: float):
+    def make_request(rng):
+        sender, receiver = f'user-{rng.randrange(users)}', f'user-{rng.randrange(users)}'
+        roll = rng.random()
+        if roll < write_ratio:
+            body = json.dumps(dict(sender=sender, message='benchmark message')).encode()
+            return 'POST', f'/message/send/{receiver}', body, 'application/json'
+        if roll < 0.6:
+            body = urlencode(dict(sender=sender, receiver=receiver)).encode()
+            return 'GET', '/message/retrieve/?per_page=20&cursor=', body, 'application/x-www-form-urlencoded'
+        if roll < 0.8:
+            return 'GET', '/message/retrieve/all/?per_page=20&cursor=', b'', ''
+        return 'GET', f'/user/get-user/{sender}', b'', ''
+
+    return make_request
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=500)
+    parser.add_argument('--duration', type=float, default=20.0, help='seconds per mode')
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--messages', type=int, default=20000)
+    parser.add_argument('--write-ratio', type=float, default=0.05)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--db-latency-ms', type=float, default=2.0,
+                        help='simulated round trip per query, 0 for raw SQLite')
+    args = parser.parse_args()
+
+    setup_django()
+    seed(users=args.users, messages=args.messages)
+
+    results = {}
+    for mode, async_views in (('sync', '0'), ('async', '1')):
+        server = start_uvicorn(args.port, dict(ASYNC_VIEWS=async_views, DJANGO_SETTINGS_MODULE='benchmarks.settings',
+                                               BENCHMARK_DB_LATENCY_MS=str(args.db_latency_ms)))
+        try:
+            results[mode] = asyncio.run(drive_http(args.port, make_request_factory(args.users, args.write_ratio),
+                                                   clients=args.clients, duration=args.duration))
+        finally:
+            server.terminate()
+            server.wait()
+        print(mode, json.dumps(results[mode]))
+
+    print(f"async/sync throughput: {results['async']['rps'] / max(results['sync']['rps'], 0.1):.2f}x, "
+          f"p99 {results['sync']['p99_ms']}ms -> {results['async']['p99_ms']}ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""
+Bytes and serialization time of the json and columnar page formats of the retrieve endpoints.
+
+    python -m benchmarks.columnar --rows 100 1000 5000
+
+Reads the newest --rows messages of retrieve/all/ both ways, the json format as values() dicts with an
+isoformat() per row, the columnar format as values_list() tuples through columnar_columns, and encodes each
+like JsonResponse does. Prints the median milliseconds to fetch, build and encode, and the encoded size
+"""
+import argparse
+import json
+import time
+
+from benchmarks.common import setup_django, seed
+
+FIELDS = ('sender', 'date_sent', 'message', 'receiver')
+
+
+def json_page(queryset, rows: int) -> list:
+    from chatApplication.models.MessageRecords import with_usernames
+
+    page_records = with_usernames(list(queryset.values(*FIELDS)[:rows]))
+    for obj in page_records:
+        obj['date_sent'] = obj['date_sent'].isoformat()
+    return page_records
+
+
+def columnar_page(queryset, rows: int) -> dict:
+    from chatApplication.apis.message_api import columnar_columns
+
+    page_rows = list(queryset.values_list(*FIELDS)[:rows])
+    users, columns = columnar_columns(page_rows, FIELDS)
+    return dict(format='columnar', count=len(page_rows), users=users, columns=columns)
+
+
+def measure(build, queryset, rows: int, repeat: int) -> dict:
+    from django.core.serializers.json import DjangoJSONEncoder
+
+    build_ms, encode_ms = [], []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        data = build(queryset, rows)
+        built = time.perf_counter()
+        content = json.dumps(data, cls=DjangoJSONEncoder).encode()
+        build_ms.append((built - started) * 1000)
+        encode_ms.append((time.perf_counter() - built) * 1000)
+    return dict(fetch_and_build_ms=round(sorted(build_ms)[repeat // 2], 2),
+                encode_ms=round(sorted(encode_ms)[repeat // 2], 2),
+                bytes=len(content))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[100, 1000, 5000])
+    parser.add_argument('--repeat', type=int, default=15)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--messages', type=int, default=20000)
+    args = parser.parse_args()
+
+    setup_django()
+    seed(users=args.users, messages=args.messages)
+    from chatApplication.models import MessageRecord
+
+    queryset = MessageRecord.objects.order_by('-id')
+    for rows in args.rows:
+        results = dict(json=measure(json_page, queryset, rows, args.repeat),
+                       columnar=measure(columnar_page, queryset, rows, args.repeat))
+        for name, result in results.items():
+            print(rows, name, json.dumps(result))
+        plain, columnar = results['json'], results['columnar']
+        plain_ms = plain['fetch_and_build_ms'] + plain['encode_ms']
+        columnar_ms = columnar['fetch_and_build_ms'] + columnar['encode_ms']
+        print(f"{rows} rows: columnar is {columnar['bytes'] / plain['bytes'] * 100:.0f}% of the bytes, "
+              f"{columnar_ms / plain_ms * 100:.0f}% of the time")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,229 @@
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+from itertools import accumulate
+from typing import Callable, List, Tuple
+
+import pytz
+
+Request = Tuple[str, str, bytes, str]  # method, path, body, content type
+
+
+def setup_django():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.settings')
+    import django
+    django.setup()
+
+
+def seed(users: int = 100, messages: int = 20000, days: int = 30, seed_value: int = 0,
+         conversations: int = 0, skew: float = 0.0):
+    """
+    Creates a fresh schema and fills it with a synthetic dataset
+    :param conversations: distinct (sender, receiver) pairs messages are spread over, 0 for any pair
+    :param skew: zipf exponent of the message volume per conversation, 0 for uniform
+    """
+    from django.core.management import call_command
+    from django.db import connection, transaction
+    from chatApplication.models import MessageRecord
+    from chatApplication.models.Users import User
+
+    connection.close()
+    db_path = connection.settings_dict['NAME']
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    call_command('migrate', verbosity=0)
+
+    rng = random.Random(seed_value)
+    user_objects = list(User.objects.bulk_get_or_create(f'user-{i}' for i in range(users)).values())
+    now = datetime.now(pytz.UTC)
+    pairs = [(rng.choice(user_objects), rng.choice(user_objects)) for _ in range(conversations)]
+    cum_weights = list(accumulate(1 / (rank + 1) ** skew for rank in range(len(pairs))))
+
+    def pick_pair():
+        if pairs:
+            return rng.choices(pairs, cum_weights=cum_weights)[0]
+        return rng.choice(user_objects), rng.choice(user_objects)
+
+    records = []
+    for i in range(messages):
+        sender, receiver = pick_pair()
+        records.append(MessageRecord(sender=sender, receiver=receiver, message=f'synthetic message {i}',
+                                     date_sent=now - timedelta(seconds=rng.randint(0, days * 24 * 3600))))
+    # Oldest first, as messages arrive: the id generator only remembers the last milliseconds it used
+    records.sort(key=lambda record: record.date_sent)
+    for start in range(0, len(records), 1000):
+        with transaction.atomic():
+            MessageRecord.objects.bulk_send(records[start:start + 1000])
+    connection.close()
+
+
+def percentile(latencies: List[float], pct: float) -> float:
+    ordered = sorted(latencies)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))] if ordered else 0.0
+
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> dict:
+    return dict(requests=len(latencies), errors=errors, rps=round(len(latencies) / elapsed, 1),
+                p50_ms=round(percentile(latencies, 50) * 1000, 2),
+                p95_ms=round(percentile(latencies, 95) * 1000, 2),
+                p99_ms=round(percentile(latencies, 99) * 1000, 2))
+
+
+"""
+#############################
+Server based (uvicorn) load #
+#############################
+"""
+
+
+def start_uvicorn(port: int, env: dict) -> subprocess.Popen:
+    """Requires uvicorn (pip install uvicorn)"""
+    process = subprocess.Popen([sys.executable, '-m', 'uvicorn', 'chatApplication.asgi:application',
+                                '--port', str(port), '--log-level', 'warning', '--no-access-log'],
+                               env={**os.environ, **env})
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            asyncio.run(http_request('127.0.0.1', port, ('GET', '/health-check/', b'', '')))
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError('uvicorn did not start')
+
+
+async def http_request(host: str, port: int, request: Request, connection=None):
+    """
+    Minimal HTTP/1.1 client over a kept-alive connection, enough for benchmarking without extra dependencies
+    :return: (status, body, connection)
+    """
+    if connection is None:
+        connection = await asyncio.open_connection(host, port)
+    reader, writer = connection
+    method, path, body, content_type = request
+    head = f'{method} {path} HTTP/1.1\r\nHost: {host}\r\nContent-Length: {len(body)}\r\n'
+    if content_type:
+        head += f'Content-Type: {content_type}\r\n'
+    writer.write(head.encode('latin1') + b'\r\n' + body)
+    await writer.drain()
+
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError('connection closed')
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    if 'content-length' in headers:
+        response_body = await reader.readexactly(int(headers['content-length']))
+    else:
+        response_body = b''
+        while True:
+            size = int((await reader.readline()).strip() or b'0', 16)
+            chunk = await reader.readexactly(size + 2)
+            if size == 0:
+                break
+            response_body += chunk[:-2]
+    return int(status_line.split()[1]), response_body, connection
+
+
+async def drive_http(port: int, make_request: Callable[[random.Random], Request], clients: int,
+                     duration: float) -> dict:
+    """
+    clients concurrent keep-alive clients, each sending requests back to back for duration seconds
+    """
+    latencies, errors = [], 0
+    deadline = time.monotonic() + duration
+
+    async def client(index: int):
+        nonlocal errors
+        rng = random.Random(index)
+        connection = None
+        while time.monotonic() < deadline:
+            started = time.monotonic()
+            try:
+                status, _, connection = await http_request('127.0.0.1', port, make_request(rng), connection)
+                if status >= 400:
+                    errors += 1
+                latencies.append(time.monotonic() - started)
+            except (OSError, ConnectionError, asyncio.IncompleteReadError):
+                errors += 1
+                connection = None
+        if connection is not None:
+            connection[1].close()
+
+    started = time.monotonic()
+    await asyncio.gather(*(client(i) for i in range(clients)))
+    return summarize(latencies, errors, time.monotonic() - started)
+
+
+"""
+#############################
+In-process ASGI load        #
+#############################
+"""
+
+
+async def asgi_request(application, request: Request):
+    """
+    Calls the ASGI application directly, without a server or sockets
+    :return: (status, body)
+    """
+    method, path, body, content_type = request
+    path, _, query_string = path.partition('?')
+    headers = [(b'content-length', str(len(body)).encode())]
+    if content_type:
+        headers.append((b'content-type', content_type.encode()))
+    scope = dict(type='http', asgi=dict(version='3.0'), http_version='1.1', method=method, scheme='http',
+                 path=path, raw_path=path.encode(), query_string=query_string.encode(), root_path='',
+                 headers=headers, client=('127.0.0.1', 0), server=('testserver', 80))
+    received = False
+    status, chunks = 0, []
+
+    async def receive():
+        nonlocal received
+        if received:
+            return dict(type='http.disconnect')
+        received = True
+        return dict(type='http.request', body=body, more_body=False)
+
+    async def send(message):
+        nonlocal status
+        if message['type'] == 'http.response.start':
+            status = message['status']
+        elif message['type'] == 'http.response.body':
+            chunks.append(message.get('body', b''))
+
+    await application(scope, receive, send)
+    return status, b''.join(chunks)
+
+
+async def drive_asgi(application, make_request: Callable[[random.Random], Request], clients: int,
+                     requests: int) -> dict:
+    """
+    clients concurrent clients sharing requests requests between them, each sending back to back
+    """
+    latencies, errors = [], 0
+    remaining = requests
+
+    async def client(index: int):
+        nonlocal errors, remaining
+        rng = random.Random(index)
+        while remaining > 0:
+            remaining -= 1
+            started = time.monotonic()
+            status, _ = await asgi_request(application, make_request(rng))
+            latencies.append(time.monotonic() - started)
+            if status >= 400:
+                errors += 1
+
+    started = time.monotonic()
+    await asyncio.gather(*(client(i) for i in range(clients)))
+    return summarize(latencies, errors, time.monotonic() - started)
@@ -0,0 +1,63 @@
+"""
+Overhead of the instrumentation middleware, in process through the ASGI application.
+
+    python -m benchmarks.instrumentation --requests 5000
+
+Serves the same requests with two handlers, one with settings.MIDDLEWARE and one without
+InstrumentationMiddleware, alternating which goes first every round so both see the same cache and database
+state. Prints the median requests per second and p50 latency of each, and the added cost per request
+"""
+import argparse
+import asyncio
+import json
+
+from benchmarks.common import setup_django, seed, drive_asgi
+
+INSTRUMENTATION = 'chatApplication.metrics.middleware.InstrumentationMiddleware'
+
+
+def make_request_factory(users: int):
+    def make_request(rng):
+        return 'GET', f'/user/get-user/user-{rng.randrange(users)}', b'', ''
+
+    return make_request
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=5000, help='requests per handler and round')
+    parser.add_argument('--rounds', type=int, default=6)
+    parser.add_argument('--clients', type=int, default=10)
+    parser.add_argument('--users', type=int, default=100)
+    args = parser.parse_args()
+
+    setup_django()
+    seed(users=args.users, messages=0)
+    from django.conf import settings
+    from django.core.handlers.asgi import ASGIHandler
+    from django.test.utils import override_settings
+
+    handlers = dict(instrumented=ASGIHandler())
+    with override_settings(MIDDLEWARE=[name for name in settings.MIDDLEWARE if name != INSTRUMENTATION]):
+        handlers['plain'] = ASGIHandler()
+
+    results = {name: [] for name in handlers}
+    make_request = make_request_factory(args.users)
+    for round_number in range(args.rounds):
+        order = list(handlers.items()) if round_number % 2 == 0 else list(handlers.items())[::-1]
+        for name, handler in order:
+            results[name].append(asyncio.run(drive_asgi(handler, make_request, clients=args.clients,
+                                                        requests=args.requests)))
+
+    summary = {}
+    for name, runs in results.items():
+        summary[name] = dict(rps=sorted(run['rps'] for run in runs)[len(runs) // 2],
+                             p50_ms=sorted(run['p50_ms'] for run in runs)[len(runs) // 2])
+        print(name, json.dumps(summary[name]))
+    per_request_us = (1 / summary['instrumented']['rps'] - 1 / summary['plain']['rps']) * 1e6
+    print(f"overhead: {per_request_us:.1f}us per request "
+          f"({(1 - summary['instrumented']['rps'] / summary['plain']['rps']) * 100:.1f}% of throughput)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+"""
+Load test of the HTTP API through the ASGI application, in process (no server, no sockets),
+against a seeded local SQLite stand-in for postgres.
+
+    python -m benchmarks.load run --output before.json
+    python -m benchmarks.load run --output after.json --baseline before.json --threshold 10
+    python -m benchmarks.load compare before.json after.json --threshold 10
+
+Every scenario sends --requests requests from --clients concurrent clients and reports requests per second,
+p50/p95/p99 latency, database queries per request and memory. With a baseline, a scenario regresses when its
+throughput drops, or its p95/p99 latency or queries per request grow, by more than --threshold percent;
+any regression makes the command exit with status 1
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import sys
+import threading
+import tracemalloc
+from datetime import datetime
+from urllib.parse import urlencode
+
+import pytz
+
+from benchmarks.common import setup_django, seed, drive_asgi
+
+# metric -> True when higher is better
+COMPARED_METRICS = dict(rps=True, p95_ms=False, p99_ms=False, queries_per_request=False)
+
+
+def scenarios(users: int):
+    def send_message(rng):
+        sender, receiver = f'user-{rng.randrange(users)}', f'user-{rng.randrange(users)}'
+        body = json.dumps(dict(sender=sender, message='benchmark message')).encode()
+        return 'POST', f'/message/send/{receiver}', body, 'application/json'
+
+    def retrieve_messages(rng):
+        sender, receiver = f'user-{rng.randrange(users)}', f'user-{rng.randrange(users)}'
+        body = urlencode(dict(sender=sender, receiver=receiver)).encode()
+        return 'GET', '/message/retrieve/?per_page=20&cursor=', body, 'application/x-www-form-urlencoded'
+
+    def retrieve_all_messages(rng):
+        return 'GET', '/message/retrieve/all/?per_page=20&cursor=', b'', ''
+
+    def all_users(rng):
+        return 'GET', '/user/all-users/', b'', ''
+
+    return dict(send_message=send_message, retrieve_messages=retrieve_messages,
+                retrieve_all_messages=retrieve_all_messages, all_users=all_users)
+
+
+class QueryCounter:
+    """Counts the queries of every database connection, whichever thread runs it"""
+
+    def __init__(self):
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        with self.lock:
+            self.count += 1
+        return execute(sql, params, many, context)
+
+    def install(self):
+        from django.db.backends.signals import connection_created
+
+        def install_on(sender, connection, **kwargs):
+            # Fired on every reconnect of the same connection wrapper
+            if self not in connection.execute_wrappers:
+                connection.execute_wrappers.append(self)
+
+        connection_created.connect(install_on, weak=False)
+
+
+def max_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def run(args) -> dict:
+    os.environ['ASYNC_VIEWS'] = '1' if args.async_views else '0'
+    os.environ['BENCHMARK_DB_LATENCY_MS'] = str(args.db_latency_ms)
+    counter = QueryCounter()
+    setup_django()
+    counter.install()
+    seed(users=args.users, messages=args.messages, days=args.days, conversations=args.conversations,
+         skew=args.skew)
+
+    from chatApplication.asgi import application
+    results = dict(meta=dict(vars(args), python=platform.python_version(),
+                             started=datetime.now(pytz.UTC).isoformat()),
+                   scenarios={})
+    for name, make_request in scenarios(args.users).items():
+        if args.scenarios and name not in args.scenarios:
+            continue
+        if args.trace_memory:
+            tracemalloc.start()
+        queries_before = counter.count
+        result = asyncio.run(drive_asgi(application, make_request, clients=args.clients, requests=args.requests))
+        result['queries_per_request'] = round((counter.count - queries_before) / max(result['requests'], 1), 2)
+        result['max_rss_mb'] = max_rss_mb()
+        if args.trace_memory:
+            result['peak_traced_mb'] = round(tracemalloc.get_traced_memory()[1] / (1024 * 1024), 1)
+            tracemalloc.stop()
+        results['scenarios'][name] = result
+        print(name, json.dumps(result))
+    return results
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> list:
+    """
+    Prints every compared metric of the scenarios both runs have
+    :return: the regressions, as (scenario, metric, change in percent)
+    """
+    regressions = []
+    for name, result in current['scenarios'].items():
+        if name not in baseline['scenarios']:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            before, after = baseline['scenarios'][name].get(metric), result.get(metric)
+            if not before or after is None:
+                continue
+            change = (after - before) / before * 100
+            regressed = (-change if higher_is_better else change) > threshold
+            if regressed:
+                regressions.append((name, metric, round(change, 1)))
+            print(f'{name:<24}{metric:<22}{before:>12}{after:>12}{change:>+9.1f}%'
+                  f'{"  REGRESSION" if regressed else ""}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='seed, load and report')
+    run_parser.add_argument('--clients', type=int, default=50)
+    run_parser.add_argument('--requests', type=int, default=2000, help='requests per scenario')
+    run_parser.add_argument('--scenarios', nargs='*', choices=sorted(scenarios(1)), help='default: all')
+    run_parser.add_argument('--users', type=int, default=1000)
+    run_parser.add_argument('--conversations', type=int, default=5000, help='distinct sender/receiver pairs')
+    run_parser.add_argument('--messages', type=int, default=100000)
+    run_parser.add_argument('--days', type=int, default=30, help='messages are spread over this many days')
+    run_parser.add_argument('--skew', type=float, default=1.0,
+                            help='zipf exponent of messages per conversation, 0 for uniform')
+    run_parser.add_argument('--async-views', action='store_true', help='serve with ASYNC_VIEWS on')
+    run_parser.add_argument('--db-latency-ms', type=float, default=0.0, help='simulated round trip per query')
+    run_parser.add_argument('--trace-memory', action='store_true',
+                            help='also report peak python allocations per scenario (slower)')
+    run_parser.add_argument('--output', help='write the results to this JSON file')
+    run_parser.add_argument('--baseline', help='results JSON of an earlier run to compare with')
+    run_parser.add_argument('--threshold', type=float, default=10.0, help='allowed regression in percent')
+
+    compare_parser = commands.add_parser('compare', help='compare two results files')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=10.0, help='allowed regression in percent')
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        current = run(args)
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(current, f, indent=2)
+        baseline_path = args.baseline
+    else:
+        with open(args.current) as f:
+            current = json.load(f)
+        baseline_path = args.baseline
+
+    if baseline_path:
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, current, args.threshold)
+        if regressions:
+            print(f'{len(regressions)} regression(s) over {args.threshold}%: {regressions}')
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+"""
+Settings for the benchmarks: the application settings with a local SQLite file standing in for postgres
+"""
+import os
+
+from chatApplication.settings import *  # noqa: F401,F403
+
+DEBUG = False
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ.get('BENCHMARK_DB', str(BASE_DIR / 'benchmark.sqlite3')),  # noqa: F405
+        'OPTIONS': {'timeout': 30},
+    }
+}
+
+# Benchmarks measure capacity: a few synthetic senders behind one address would be rate limited,
+# and shedding would answer overload with cheap 503s
+SEND_RATE_PER_SENDER = 0
+SEND_RATE_PER_CLIENT = 0
+SHED_QUEUE_DELAY_MS = 0
+
+# The benchmark and the one server it starts never write messages at the same time
+MESSAGE_ID_WORKER_ID = 0
+
+# Simulated network round trip per query (BENCHMARK_DB_LATENCY_MS), so the local stand-in behaves like a remote
+# database server where request threads spend most of their time waiting on I/O
+BENCHMARK_DB_LATENCY_MS = float(os.environ.get('BENCHMARK_DB_LATENCY_MS', '0'))
+
+if BENCHMARK_DB_LATENCY_MS:
+    import time
+
+    from django.db.backends.signals import connection_created
+
+    def _add_latency(execute, sql, params, many, context):
+        time.sleep(BENCHMARK_DB_LATENCY_MS / 1000)
+        return execute(sql, params, many, context)
+
+    def _install_latency(sender, connection, **kwargs):
+        # Fired on every reconnect of the same connection wrapper
+        if _add_latency not in connection.execute_wrappers:
+            connection.execute_wrappers.append(_add_latency)
+
+    connection_created.connect(_install_latency, weak=False)
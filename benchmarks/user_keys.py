@@ -0,0 +1,169 @@
+"""
+Index size and query time of the message table with usernames as its sender and receiver keys (migration 0008)
+and with user ids (0010), on the same synthetic messages.
+
+    python -m benchmarks.user_keys --messages 200000
+
+Fills the database at 0008, measures, migrates to the latest schema (timing the batched backfill of 0009 and the
+switch of 0010) and measures again. Sizes are the bytes of the message table and each of its indexes, from SQLite's
+dbstat table. Times are median milliseconds of the queries the user keys serve: the newest messages to a receiver,
+the messages a user sent, and a retrieve/all/ page with usernames, read from the rows before and through a join
+or the cached id -> username map (User.objects.usernames) after
+"""
+import argparse
+import json
+import os
+import random
+import time
+from datetime import datetime, timedelta
+
+import pytz
+
+from benchmarks.common import setup_django
+
+BEFORE = '0008_time_ordered_message_ids'
+TABLE = 'chatApplication_messagerecord'
+USERS = 'chatApplication_user'
+
+
+def seed_with_usernames(users: int, messages: int, days: int, seed_value: int = 0):
+    """Creates a fresh schema at BEFORE and fills it, messages referencing their users by username"""
+    from django.core.management import call_command
+    from django.db import connection, transaction
+    from chatApplication.storage import ids
+
+    connection.close()
+    db_path = connection.settings_dict['NAME']
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    call_command('migrate', 'chatApplication', BEFORE, verbosity=0)
+
+    rng = random.Random(seed_value)
+    usernames = [f'user-{i:08d}' for i in range(users)]
+    now = datetime.now(pytz.UTC)
+    conversations = {}  # (sender, receiver) -> conversation id
+    rows = []
+    for i in range(messages):
+        sender, receiver = rng.randrange(users), rng.randrange(users)
+        conversation_id = conversations.setdefault((sender, receiver), len(conversations) + 1)
+        rows.append((now - timedelta(seconds=rng.randint(0, days * 24 * 3600)), sender, receiver, conversation_id))
+    # Oldest first, as messages arrive, see benchmarks.common.seed
+    rows.sort()
+    message_ids = ids.next_ids(date_sent for date_sent, _, _, _ in rows)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.executemany(f'INSERT INTO "{USERS}" (id, username) VALUES (%s, %s)',
+                           [(index + 1, username) for index, username in enumerate(usernames)])
+        cursor.executemany('INSERT INTO "chatApplication_conversation" (id, sender_id, receiver_id) '
+                           'VALUES (%s, %s, %s)',
+                           [(conversation_id, sender + 1, receiver + 1)
+                            for (sender, receiver), conversation_id in conversations.items()])
+        cursor.executemany(f'INSERT INTO "{TABLE}" (id, date_sent, message, sender_username, receiver_username, '
+                           f'conversation_id) VALUES (%s, %s, %s, %s, %s, %s)',
+                           [(message_id, connection.ops.adapt_datetimefield_value(date_sent),
+                             f'synthetic message {index}', usernames[sender], usernames[receiver], conversation_id)
+                            for index, (message_id, (date_sent, sender, receiver, conversation_id))
+                            in enumerate(zip(message_ids, rows))])
+
+
+def sizes() -> dict:
+    """Bytes of the message table and of each of its indexes, after a VACUUM so both schemas are measured compact"""
+    from django.db import connection
+
+    with connection.cursor() as cursor:
+        cursor.execute('VACUUM')
+        cursor.execute('SELECT name FROM sqlite_master WHERE type = %s AND tbl_name = %s', ['index', TABLE])
+        names = sorted(name for name, in cursor.fetchall())
+        cursor.execute('SELECT name, SUM(pgsize) FROM dbstat GROUP BY name')
+        pages = dict(cursor.fetchall())
+    return dict(table=pages[TABLE], indexes={name: pages.get(name, 0) for name in names})
+
+
+def median_ms(run, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        times.append((time.perf_counter() - started) * 1000)
+    return round(sorted(times)[repeat // 2], 3)
+
+
+def query_times(sender: str, receiver: str, user, repeat: int, user_ids: bool) -> dict:
+    """
+    :param sender: sender key column
+    :param receiver: receiver key column
+    :param user: key of the user the per user queries are about
+    :param user_ids: the keys are user ids, pages map them to usernames
+    """
+    from django.db import connection
+    from chatApplication.models.Users import User
+
+    def fetch(sql: str, params=()):
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+    page_sql = f'SELECT id, {sender}, date_sent, message, {receiver} FROM "{TABLE}" ORDER BY id DESC LIMIT 100'
+
+    def page_with_cached_usernames():
+        rows = fetch(page_sql)
+        usernames = User.objects.usernames(user_id for row in rows for user_id in (row[1], row[4]))
+        return [(row[0], usernames[row[1]], row[2], row[3], usernames[row[4]]) for row in rows]
+
+    times = {
+        'newest 100 to a receiver': median_ms(lambda: fetch(
+            f'SELECT id, {sender}, date_sent, message FROM "{TABLE}" WHERE {receiver} = %s ORDER BY id DESC LIMIT 100',
+            [user]), repeat),
+        'count sent by a user': median_ms(lambda: fetch(f'SELECT COUNT(*) FROM "{TABLE}" WHERE {sender} = %s', [user]),
+                                          repeat),
+    }
+    if not user_ids:
+        times['page with usernames'] = median_ms(lambda: fetch(page_sql), repeat)
+        return times
+    times['page with usernames, join'] = median_ms(lambda: fetch(
+        f'SELECT m.id, s.username, m.date_sent, m.message, r.username FROM "{TABLE}" m '
+        f'JOIN "{USERS}" s ON s.id = m.sender_id JOIN "{USERS}" r ON r.id = m.receiver_id '
+        f'ORDER BY m.id DESC LIMIT 100'), repeat)
+    page_with_cached_usernames()  # fills the user cache
+    times['page with usernames, cached map'] = median_ms(page_with_cached_usernames, repeat)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--messages', type=int, default=200000)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--repeat', type=int, default=25)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.core.management import call_command
+    from chatApplication.caches.lru_cache import clear_caches
+
+    seed_with_usernames(args.users, args.messages, args.days)
+    username = 'user-00000001'
+    before = dict(sizes=sizes(), times=query_times('sender_username', 'receiver_username', username, args.repeat,
+                                                   user_ids=False))
+    print('usernames', json.dumps(before))
+
+    started = time.perf_counter()
+    call_command('migrate', verbosity=0)
+    migrate_seconds = time.perf_counter() - started
+    clear_caches()
+    after = dict(sizes=sizes(), times=query_times('sender_id', 'receiver_id', 2, args.repeat, user_ids=True))
+    print('user ids', json.dumps(after))
+
+    indexes_before, indexes_after = sum(before['sizes']['indexes'].values()), sum(after['sizes']['indexes'].values())
+    print(f"{args.messages} messages: migrated in {migrate_seconds:.1f}s; "
+          f"indexes {indexes_before} -> {indexes_after} bytes ({indexes_after / indexes_before * 100:.0f}%), "
+          f"table {before['sizes']['table']} -> {after['sizes']['table']} bytes "
+          f"({after['sizes']['table'] / before['sizes']['table'] * 100:.0f}%)")
+    for name in ('newest 100 to a receiver', 'count sent by a user'):
+        print(f"{name}: {before['times'][name]} -> {after['times'][name]} ms")
+    print(f"page with usernames: {before['times']['page with usernames']} ms from the rows, "
+          f"{after['times']['page with usernames, join']} ms joined, "
+          f"{after['times']['page with usernames, cached map']} ms through the cached map")
+
+
+if __name__ == '__main__':
+    main()
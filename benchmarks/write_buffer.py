@@ -0,0 +1,71 @@
+"""
+Commits per second vs messages per second, with and without the group commit write buffer.
+
+    python -m benchmarks.write_buffer --threads 32 --messages 2000
+
+Each mode sends the same number of messages from concurrent threads through create_message (the body of
+send_message) against a local SQLite stand-in with --db-latency-ms of simulated round trip per statement.
+Unbuffered, every message is its own transaction; buffered, messages share one commit per flushed batch
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import pytz
+
+
+def run(mode: str, threads: int, messages: int) -> dict:
+    from django.conf import settings
+    from django.db import close_old_connections
+    from django.test.utils import override_settings
+    from chatApplication.apis.message_api import create_message
+    from chatApplication.ingest import write_buffer
+
+    write_buffer._write_buffer = None
+
+    def send(i):
+        try:
+            create_message(f'user-{i % 50}', f'user-{(i * 7) % 50}', f'benchmark message {i}', datetime.now(pytz.UTC))
+        finally:
+            close_old_connections()
+
+    with override_settings(MESSAGE_WRITE_BUFFER=mode == 'buffered'):
+        # Warm the user and conversation caches so the timed sends are pure writes
+        for i in range(50):
+            send(i)
+        write_buffer._write_buffer = None
+
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            list(executor.map(send, range(messages)))
+        elapsed = time.monotonic() - started
+        commits = write_buffer.get_write_buffer().stats()['flushes'] if settings.MESSAGE_WRITE_BUFFER else messages
+        stats = write_buffer.get_write_buffer().stats() if settings.MESSAGE_WRITE_BUFFER else {}
+
+    return dict(messages=messages, seconds=round(elapsed, 2), messages_per_second=round(messages / elapsed, 1),
+                commits=commits, commits_per_second=round(commits / elapsed, 1),
+                messages_per_commit=round(messages / commits, 1),
+                mean_flush_ms=round(stats['flush_seconds_total'] / stats['flushes'] * 1000, 2) if stats else None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--messages', type=int, default=2000)
+    parser.add_argument('--db-latency-ms', type=float, default=1.0)
+    args = parser.parse_args()
+
+    os.environ['BENCHMARK_DB_LATENCY_MS'] = str(args.db_latency_ms)
+    from benchmarks.common import setup_django, seed
+    setup_django()
+    seed(users=50, messages=0)
+
+    for mode in ('unbuffered', 'buffered'):
+        print(mode, json.dumps(run(mode, args.threads, args.messages)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+from datetime import datetime
+
+import pytz
+from django.core.handlers.asgi import ASGIRequest
+
+from chatApplication.apis.db_executor import run_in_db_executor
+from chatApplication.apis.decorators import admission_control, idempotent, require_POST, require_GET
+from chatApplication.apis.group_api import members_extractor, get_or_create_group, update_members, \
+    create_group_message, member_extractor, mark_read, group_entries, feed_params_extractor, feed_page, \
+    group_send_result
+from chatApplication.apis.message_api import content_extractor, send_costs
+from chatApplication.apis.responses import JsonResponse
+from chatApplication.errors.decorators import api_exception_handler
+from chatApplication.storage.routers import replica_reads
+
+"""
+Native async versions of the group_api views, served when settings.ASYNC_VIEWS is on
+"""
+
+
+@require_POST
+@api_exception_handler
+async def create_group(request: ASGIRequest, name: str):
+    members, = members_extractor(request, 'members')
+    group, created, added = await run_in_db_executor(get_or_create_group, name, members)
+    return JsonResponse(dict(id=group.id, name=group.name, added=added), status=201 if created else 200)
+
+
+@require_POST
+@api_exception_handler
+async def update_group_members(request: ASGIRequest, name: str):
+    added, removed = await run_in_db_executor(update_members, name, *members_extractor(request, 'add', 'remove'))
+    return JsonResponse(dict(status='success', added=added, removed=removed))
+
+
+@require_POST
+@api_exception_handler
+@admission_control(send_costs)
+@idempotent(send_costs)
+async def send_group_message(request: ASGIRequest, name: str):
+    date_time_sent_utc = datetime.now(pytz.UTC)
+    sender_username, message = content_extractor(request)
+    record = await run_in_db_executor(create_group_message, name, sender_username, message, date_time_sent_utc)
+    return JsonResponse(group_send_result(record))
+
+
+@require_POST
+@api_exception_handler
+async def mark_group_read(request: ASGIRequest, name: str):
+    read_id = await run_in_db_executor(mark_read, name, member_extractor(request))
+    return JsonResponse(dict(status='success', read_id=read_id))
+
+
+@require_GET
+@api_exception_handler
+async def user_groups(request: ASGIRequest, username: str):
+    return JsonResponse(dict(results=await run_in_db_executor(group_entries, username)))
+
+
+@require_GET
+@api_exception_handler
+@replica_reads
+async def message_feed(request: ASGIRequest):
+    return JsonResponse(await run_in_db_executor(feed_page, *feed_params_extractor(request)))
@@ -0,0 +1,120 @@
+import asyncio
+from datetime import datetime
+
+import pytz
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+
+from chatApplication.apis.db_executor import run_in_db_executor
+from chatApplication.apis.decorators import admission_control, idempotent, require_POST, require_GET
+from chatApplication.apis.message_api import content_extractor, create_message, batch_content_extractor, \
+    create_message_batch, retrieve_content_extractor, conversation_records, cached_message_page_response, \
+    create_filter_range, sync_params_extractor, sync_page, sync_response, submit_to_write_buffer, \
+    WRITE_BUFFER_TIMEOUT_ERROR, inbox_entries, read_marker_extractor, mark_read, search_params_extractor, search_page, \
+    send_costs, batch_send_costs, send_result
+from chatApplication.apis.responses import JsonResponse
+from chatApplication.caches.versions import ALL_MESSAGES_KEY, conversation_key
+from chatApplication.errors.api_errors import APIError
+from chatApplication.errors.decorators import api_exception_handler
+from chatApplication.ingest import idempotency
+from chatApplication.models import MessageRecord
+from chatApplication.models.MessageRecords import sent_within
+from chatApplication.realtime.waiters import waiters
+from chatApplication.storage import shards
+from chatApplication.storage.routers import replica_reads
+
+"""
+Native async versions of the message_api views, served when settings.ASYNC_VIEWS is on.
+Request parsing runs on the event loop, ORM work runs through run_in_db_executor
+"""
+
+
+@require_POST
+@api_exception_handler
+@admission_control(send_costs)
+@idempotent(send_costs)
+async def send_message(request: ASGIRequest, receiver_username: str):
+    date_time_sent_utc = datetime.now(pytz.UTC)
+    sender_username, message = content_extractor(request)
+    if settings.MESSAGE_WRITE_BUFFER and not idempotency.claimed():
+        future = submit_to_write_buffer(sender_username, receiver_username, message, date_time_sent_utc)
+        try:
+            await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), settings.MESSAGE_WRITE_BUFFER_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise APIError(message=WRITE_BUFFER_TIMEOUT_ERROR, status=503)
+    else:
+        await run_in_db_executor(create_message, sender_username, receiver_username, message, date_time_sent_utc)
+    return JsonResponse(send_result(date_time_sent_utc))
+
+
+@require_POST
+@api_exception_handler
+@admission_control(batch_send_costs)
+@idempotent(batch_send_costs)
+async def send_message_batch(request: ASGIRequest):
+    items = batch_content_extractor(request)
+    results = await run_in_db_executor(create_message_batch, items, datetime.now(pytz.UTC))
+    return JsonResponse(dict(results=results))
+
+
+@require_GET
+@api_exception_handler
+@replica_reads
+async def retrieve_messages(request: ASGIRequest):
+    sender_username, receiver_username = retrieve_content_extractor(request)
+    records = conversation_records(sender_username, receiver_username)
+    return await run_in_db_executor(cached_message_page_response, request,
+                                    conversation_key(sender_username, receiver_username), records,
+                                    ('date_sent', 'message'))
+
+
+@require_GET
+@api_exception_handler
+@replica_reads
+async def retrieve_all_messages(request: ASGIRequest):
+    records = shards.all_shards(MessageRecord.objects.filter(sent_within(create_filter_range())))
+    return await run_in_db_executor(cached_message_page_response, request, ALL_MESSAGES_KEY, records,
+                                    ('sender', 'date_sent', 'message', 'receiver'))
+
+
+@require_GET
+@api_exception_handler
+async def sync_messages(request: ASGIRequest):
+    """
+    Parks on the event loop instead of a thread while waiting for new messages
+    """
+    receiver_username, since, wait, per_page = sync_params_extractor(request)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + wait
+    with waiters.waiter(receiver_username, loop=loop) as waiter:
+        records, has_more, cursor, settles_in = await run_in_db_executor(sync_page, receiver_username, since,
+                                                                         per_page)
+        if not records and wait:
+            if settles_in is None and await waiter.async_wait(wait):
+                settles_in = settings.SYNC_SETTLE_MS / 1000  # the message that woke the request was just sent
+            if settles_in is not None and settles_in <= deadline - loop.time():
+                await asyncio.sleep(settles_in)
+                records, has_more, cursor, settles_in = await run_in_db_executor(sync_page, receiver_username,
+                                                                                 since, per_page)
+    return sync_response(records, has_more, cursor)
+
+
+@require_GET
+@api_exception_handler
+async def inbox(request: ASGIRequest, username: str):
+    return JsonResponse(dict(results=await run_in_db_executor(inbox_entries, username)))
+
+
+@require_POST
+@api_exception_handler
+async def mark_inbox_read(request: ASGIRequest, username: str):
+    counterpart_username = read_marker_extractor(request)
+    read_at = datetime.now(pytz.UTC)
+    await run_in_db_executor(mark_read, username, counterpart_username, read_at)
+    return JsonResponse(dict(status='success', read_at=read_at.isoformat()))
+
+
+@require_GET
+@api_exception_handler
+async def search_messages(request: ASGIRequest):
+    return await run_in_db_executor(search_page, *search_params_extractor(request))
@@ -0,0 +1,26 @@
+from django.core.handlers.asgi import ASGIRequest
+
+from chatApplication.apis.db_executor import run_in_db_executor
+from chatApplication.apis.decorators import require_GET
+from chatApplication.apis.responses import JsonResponse
+from chatApplication.apis.stats_api import volume_params_extractor, top_params_extractor, volume_stats, top_stats
+from chatApplication.errors.decorators import api_exception_handler
+from chatApplication.storage.routers import replica_reads
+
+"""
+Native async versions of the stats_api views, served when settings.ASYNC_VIEWS is on
+"""
+
+
+@require_GET
+@api_exception_handler
+@replica_reads
+async def message_volume(request: ASGIRequest, username: str):
+    return JsonResponse(await run_in_db_executor(volume_stats, username, *volume_params_extractor(request)))
+
+
+@require_GET
+@api_exception_handler
+@replica_reads
+async def top_users(request: ASGIRequest):
+    return JsonResponse(await run_in_db_executor(top_stats, *top_params_extractor(request)))
@@ -0,0 +1,39 @@
+from chatApplication.apis.db_executor import run_in_db_executor
+from chatApplication.apis.decorators import require_POST, require_GET
+from chatApplication.apis.responses import JsonResponse
+from chatApplication.apis.streaming import streaming_json_response
+from chatApplication.apis.user_api import all_users_rows
+from chatApplication.errors.api_errors import APIError
+from chatApplication.errors.decorators import api_exception_handler
+from chatApplication.models.Users import User
+from chatApplication.storage.routers import replica_reads
+
+"""
+Native async versions of the user_api views, served when settings.ASYNC_VIEWS is on
+"""
+
+
+@require_POST
+@api_exception_handler
+async def create_user(request, username):
+    user, created = await run_in_db_executor(User.objects.api_get_or_create, username=username)
+    return JsonResponse(dict(id=user.id, username=user.username), status=201 if created else 200)
+
+
+@require_GET
+@api_exception_handler
+@replica_reads
+async def get_user(request, username):
+    try:
+        user = await run_in_db_executor(User.objects.get_user, username)
+        return JsonResponse(dict(id=user.id, username=username))
+    except User.DoesNotExist:
+        raise APIError(message='User does not exist', status=404)
+
+
+@require_GET
+@api_exception_handler
+@replica_reads
+async def all_users(request):
+    users = await run_in_db_executor(all_users_rows)
+    return streaming_json_response(users)
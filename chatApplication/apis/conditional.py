@@ -0,0 +1,81 @@
+"""
+Conditional GET and response caching for pages derived from versioned content (see caches.versions).
+A page's ETag and cache key hash the version token of its content, the day the default date range starts on
+and the request's query string and body, so sending a message (which bumps the version) invalidates both
+and answering an unchanged page needs no database query.
+A page rendered from a replica, which may lag the version, or rendered without a version store (a store each
+process keeps apart would miss the other processes' bumps) is tagged with a hash of its content instead and not
+cached: answering it unchanged still takes a render, but not the body
+"""
+import hashlib
+from typing import Optional, Tuple
+
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags
+
+from chatApplication.caches.response_cache import get_response_cache
+from chatApplication.caches.versions import get_version_store
+
+
+def versioned() -> bool:
+    """Whether pages can be versioned, i.e. a version store is configured"""
+    return get_version_store() is not None
+
+
+def page_key(request, version_key: str, range_start) -> Tuple[str, str]:
+    """
+    :return: response cache key, ETag
+    """
+    token = get_version_store().token(version_key)
+    raw = '\n'.join((version_key, token, range_start.date().isoformat(), request.path,
+                     '&'.join(f'{k}={v}' for k, v in sorted(request.GET.lists())),
+                     request.body.decode('utf8', 'replace')))
+    digest = hashlib.sha1(raw.encode('utf8')).hexdigest()
+    return f'page:{digest}', f'"{digest}"'
+
+
+def etag_matches(request, etag: str) -> bool:
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if not if_none_match:
+        return False
+    etags = parse_etags(if_none_match)
+    # Weak comparison, as If-None-Match requires
+    return '*' in etags or etag in (tag[2:] if tag.startswith('W/') else tag for tag in etags)
+
+
+def lookup(request, version_key: str, range_start) -> Tuple[str, str, Optional[HttpResponse]]:
+    """
+    :return: cache key, ETag and, when the client's copy is current or the page is cached, the response
+    """
+    key, etag = page_key(request, version_key, range_start)
+    if etag_matches(request, etag):
+        response = HttpResponseNotModified()
+    else:
+        body = get_response_cache().get(key)
+        if body is None:
+            return key, etag, None
+        response = HttpResponse(body, content_type='application/json')
+    response['ETag'] = etag
+    return key, etag, response
+
+
+def store(key: str, etag: str, response: HttpResponse) -> HttpResponse:
+    """Caches a freshly rendered page and tags it with its ETag"""
+    if response.status_code == 200 and not response.streaming:
+        get_response_cache().set(key, response.content)
+        response['ETag'] = etag
+    return response
+
+
+def tag_content(request, response: HttpResponse) -> HttpResponse:
+    """
+    Tags a page that can't be versioned with a hash of its content
+    :return: the response, or 304 when the client's copy is the same
+    """
+    if response.status_code != 200 or response.streaming:
+        return response
+    etag = f'"{hashlib.sha1(response.content).hexdigest()}"'
+    if etag_matches(request, etag):
+        response = HttpResponseNotModified()
+    response['ETag'] = etag
+    return response
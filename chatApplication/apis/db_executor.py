@@ -0,0 +1,52 @@
+import asyncio
+import contextvars
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+from chatApplication.ingest.admission import observe_queue_delay
+from chatApplication.storage.connections import check_connections
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_db_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.ASYNC_DB_POOL_SIZE, thread_name_prefix='db')
+        return _executor
+
+
+def _run_with_connection_cleanup(submitted: float, func, *args, **kwargs):
+    observe_queue_delay(time.monotonic() - submitted)
+    # Worker threads outlive requests, so they retire stale connections like the request cycle would
+    close_old_connections()
+    check_connections()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+async def run_in_db_executor(func, *args, **kwargs):
+    """
+    Runs blocking ORM work for async views.
+    With ASYNC_DB_POOL_SIZE > 0 it runs on a bounded pool of database threads, which caps the number of
+    connections a worker opens no matter how many requests are in flight.
+    With ASYNC_DB_POOL_SIZE = 0 it falls back to Django's thread sensitive sync_to_async
+    (the only option that shares the caller's connection, e.g. inside a test transaction)
+    """
+    if not settings.ASYNC_DB_POOL_SIZE:
+        return await sync_to_async(func, thread_sensitive=True)(*args, **kwargs)
+    loop = asyncio.get_running_loop()
+    # Carries context variables (e.g. the request's metrics) into the worker thread, like sync_to_async does
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(get_db_executor(), functools.partial(
+        context.run, _run_with_connection_cleanup, time.monotonic(), func, *args, **kwargs))
@@ -0,0 +1,123 @@
+import asyncio
+import functools
+
+from django.http import HttpResponse, HttpResponseNotAllowed
+from django.utils.log import log_response
+from django.views.decorators import http
+
+from chatApplication.apis.db_executor import run_in_db_executor
+from chatApplication.errors.api_errors import APIError
+from chatApplication.ingest.admission import get_admission_control
+from chatApplication.ingest.idempotency import get_idempotency_keys, idempotency_key, key_scope, request_fingerprint, \
+    running
+
+
+def require_http_methods(request_method_list):
+    """
+    django.views.decorators.http.require_http_methods for sync and async views.
+    Django's own decorator wraps views in a sync function, which would hide a coroutine from the ASGI handler
+    """
+
+    def decorator(func):
+        if not asyncio.iscoroutinefunction(func):
+            return http.require_http_methods(request_method_list)(func)
+
+        @functools.wraps(func)
+        async def inner(request, *args, **kwargs):
+            if request.method not in request_method_list:
+                response = HttpResponseNotAllowed(request_method_list)
+                log_response(
+                    'Method Not Allowed (%s): %s', request.method, request.path,
+                    response=response,
+                    request=request,
+                )
+                return response
+            return await func(request, *args, **kwargs)
+
+        return inner
+
+    return decorator
+
+
+require_GET = require_http_methods(['GET'])
+require_POST = require_http_methods(['POST'])
+
+
+def admission_control(costs):
+    """
+    Refuses requests over their sender's or client's rate limit (429) and sheds them while the process is
+    overloaded (503), see chatApplication.ingest.admission. Goes below api_exception_handler
+    :param costs: request -> {sender username: messages the request sends for them}
+    """
+
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_inner(request, *args, **kwargs):
+                get_admission_control().admit(request, costs(request))
+                return await func(request, *args, **kwargs)
+
+            return async_inner
+
+        @functools.wraps(func)
+        def inner(request, *args, **kwargs):
+            get_admission_control().admit(request, costs(request))
+            return func(request, *args, **kwargs)
+
+        return inner
+
+    return decorator
+
+
+def idempotent(costs):
+    """
+    Answers a request repeating the Idempotency-Key header of an earlier one with the earlier response instead of
+    running the view again, see chatApplication.ingest.idempotency. Goes below api_exception_handler and
+    admission_control: refused and shed requests never claim their key
+    :param costs: request -> {sender username: messages the request sends for them}, the senders scope the key
+    """
+
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_inner(request, *args, **kwargs):
+                key = idempotency_key(request)
+                if key is None:
+                    return await func(request, *args, **kwargs)
+                keys = get_idempotency_keys()
+                claim = await run_in_db_executor(keys.claim, key_scope(costs(request)), key,
+                                                 request_fingerprint(request))
+                if isinstance(claim, HttpResponse):
+                    return claim
+                try:
+                    with running(claim):
+                        response = await func(request, *args, **kwargs)
+                except APIError as e:
+                    await run_in_db_executor(keys.finish, claim, e.status)
+                    raise
+                await run_in_db_executor(keys.finish, claim, response.status_code, response.content)
+                return response
+
+            return async_inner
+
+        @functools.wraps(func)
+        def inner(request, *args, **kwargs):
+            key = idempotency_key(request)
+            if key is None:
+                return func(request, *args, **kwargs)
+            keys = get_idempotency_keys()
+            claim = keys.claim(key_scope(costs(request)), key, request_fingerprint(request))
+            if isinstance(claim, HttpResponse):
+                return claim
+            try:
+                with running(claim):
+                    response = func(request, *args, **kwargs)
+            except APIError as e:
+                keys.finish(claim, e.status)
+                raise
+            keys.finish(claim, response.status_code, response.content)
+            return response
+
+        return inner
+
+    return decorator
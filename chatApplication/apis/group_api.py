@@ -0,0 +1,270 @@
+import json
+import logging
+from datetime import datetime
+from json import JSONDecodeError
+from typing import Dict, List, Optional, Tuple
+
+import pytz
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.db.models import F
+from django.views.decorators.http import require_POST, require_GET
+
+from chatApplication.apis.decorators import admission_control, idempotent
+from chatApplication.apis.message_api import content_extractor, create_filter_range, decode_cursor, encode_cursor, \
+    inbox_owner, parse_per_page, send_costs
+from chatApplication.apis.responses import JsonResponse
+from chatApplication.errors.api_errors import APIError
+from chatApplication.errors.decorators import api_exception_handler
+from chatApplication.ingest import idempotency
+from chatApplication.models import Group, GroupMembership, GroupMessage
+from chatApplication.models.MessageRecords import with_usernames
+from chatApplication.models.Users import User
+from chatApplication.storage import feeds, ids
+from chatApplication.storage.routers import replica_reads
+
+"""
+Group conversations (see models/Groups.py): a message sent to a group is stored once, whatever the number of members,
+and read by each member through their feed
+"""
+
+"""
+#########
+APIS    #
+#########
+"""
+
+
+@require_POST
+@api_exception_handler
+def create_group(request: ASGIRequest, name: str):
+    """
+    Creates the group if needed and adds the members, creating the users if needed
+    :param request: {"members": [str, ...]}, optional
+    """
+    members, = members_extractor(request, 'members')
+    group, created, added = get_or_create_group(name, members)
+    return JsonResponse(dict(id=group.id, name=group.name, added=added), status=201 if created else 200)
+
+
+@require_POST
+@api_exception_handler
+def update_group_members(request: ASGIRequest, name: str):
+    """
+    New members see the messages sent from when they join, removed members no longer see any
+    :param request: {"add": [str, ...], "remove": [str, ...]}, both optional
+    """
+    added, removed = update_members(name, *members_extractor(request, 'add', 'remove'))
+    return JsonResponse(dict(status='success', added=added, removed=removed))
+
+
+@require_POST
+@api_exception_handler
+@admission_control(send_costs)
+@idempotent(send_costs)
+def send_group_message(request: ASGIRequest, name: str):
+    """
+    One INSERT however many members the group has; the sender must be one of them
+    :param request: {"sender": str, "message": str}
+    """
+    date_time_sent_utc = datetime.now(pytz.UTC)
+    sender_username, message = content_extractor(request)
+    record = create_group_message(name, sender_username, message, date_time_sent_utc)
+    return JsonResponse(group_send_result(record))
+
+
+@require_POST
+@api_exception_handler
+def mark_group_read(request: ASGIRequest, name: str):
+    """
+    Read marker: moves the member's read cursor to the group's last message
+    :param request: {"member": str}
+    """
+    read_id = mark_read(name, member_extractor(request))
+    return JsonResponse(dict(status='success', read_id=read_id))
+
+
+@require_GET
+@api_exception_handler
+def user_groups(request: ASGIRequest, username: str):
+    """
+    The user's groups, most recently active first, with when their last message was sent and whether it is past
+    the user's read cursor. Read from the memberships and groups alone, never from the messages
+    """
+    return JsonResponse(dict(results=group_entries(username)))
+
+
+@require_GET
+@api_exception_handler
+@replica_reads
+def message_feed(request: ASGIRequest):
+    """
+    The messages a user received directly and through their groups within the default date range, newest first,
+    paginated with a cursor. Group messages have the group's name as group, direct ones a null group
+    """
+    return JsonResponse(feed_page(*feed_params_extractor(request)))
+
+
+"""
+#########
+Helpers #
+#########
+"""
+
+
+def members_extractor(request, *keys: str) -> List[List[str]]:
+    """
+    :return: the validated usernames of each key of the body, [] for missing keys and empty bodies
+    """
+    try:
+        content = json.loads(request.body) if request.body else {}
+        members = [content.get(key, []) for key in keys]
+    except JSONDecodeError:
+        raise APIError(message="Content-Type must be application/json")
+    except AttributeError:
+        raise APIError(message=f"{' and '.join(keys)} must be lists of usernames")
+    for key, usernames in zip(keys, members):
+        if not isinstance(usernames, list) or not all(isinstance(username, str) for username in usernames):
+            raise APIError(message=f"{key} must be a list of usernames")
+        if len(usernames) > settings.MAX_BATCH_SIZE:
+            raise APIError(message=f"{key} must have at most {settings.MAX_BATCH_SIZE} usernames")
+        try:
+            for username in usernames:
+                User.objects.validate_username(username)
+        except ValidationError as e:
+            raise APIError(e.messages)
+    return members
+
+
+def member_extractor(request) -> str:
+    try:
+        return str(json.loads(request.body)['member'])
+    except (KeyError, TypeError):
+        raise APIError(message="member is required")
+    except JSONDecodeError:
+        raise APIError(message="Content-Type must be application/json")
+
+
+def feed_params_extractor(request) -> Tuple[str, Optional[int], int]:
+    """
+    :return: username, id the page starts before (None for the first page), per_page
+    """
+    try:
+        username = request.GET['user']
+    except KeyError:
+        raise APIError(message="query param user is required")
+    before = None
+    cursor = request.GET.get('cursor')
+    if cursor:
+        try:
+            before, = decode_cursor(cursor)
+            before = int(before)
+        except (ValueError, TypeError):
+            raise APIError(message="query param cursor is invalid")
+    return username, before, parse_per_page(request.GET.get('per_page', settings.DEFAULT_MAX_DATA_PER_PAGE))
+
+
+def get_group(name: str) -> Group:
+    try:
+        return Group.objects.get(name=name)
+    except Group.DoesNotExist:
+        raise APIError(message='Group does not exist', status=404)
+
+
+def get_membership(name: str, username: str) -> GroupMembership:
+    """
+    :return: the user's membership of the group, with the group; 404 for an unknown group, 403 for a non member
+    """
+    try:
+        return GroupMembership.objects.select_related('group').get(group__name=name, member__username=username)
+    except GroupMembership.DoesNotExist:
+        get_group(name)
+        raise APIError(message='Not a member of the group', status=403)
+
+
+def get_or_create_group(name: str, members: List[str]) -> Tuple[Group, bool, int]:
+    """
+    :return: the group, whether it was created, members added
+    """
+    try:
+        Group.objects.validate_name(name)
+    except ValidationError as e:
+        raise APIError(e.messages)
+    with transaction.atomic():
+        group, created = Group.objects.get_or_create(name=name)
+        added = GroupMembership.objects.add_members(group, User.objects.bulk_get_or_create(members).values())
+    return group, created, added
+
+
+def update_members(name: str, add: List[str], remove: List[str]) -> Tuple[int, int]:
+    """
+    :return: members added, members removed
+    """
+    group = get_group(name)
+    with transaction.atomic():
+        added = GroupMembership.objects.add_members(group, User.objects.bulk_get_or_create(add).values())
+        removed, _ = GroupMembership.objects.filter(group=group, member__username__in=remove).delete()
+    return added, removed
+
+
+def create_group_message(name: str, sender_username: str, message: str,
+                         date_time_sent_utc: datetime) -> GroupMessage:
+    """Saves the message, with the response of the request's Idempotency-Key"""
+    membership = get_membership(name, sender_username)
+    record = GroupMessage(group_id=membership.group_id, sender_id=membership.member_id, message=message,
+                          date_sent=date_time_sent_utc)
+    with transaction.atomic():
+        record.save()
+        Group.objects.message_sent(record.group_id, record.id)
+        idempotency.store_response(group_send_result(record))
+    logging.debug(f'{date_time_sent_utc}:\nSent by: {sender_username}\nSent to group {name}\n{message}')
+    return record
+
+
+def group_send_result(record: GroupMessage) -> dict:
+    """The response of a successful send_group_message"""
+    return dict(status='success', id=record.id, date_sent=record.date_sent.isoformat())
+
+
+def mark_read(name: str, username: str) -> int:
+    """
+    :return: the member's read cursor
+    """
+    membership = get_membership(name, username)
+    read_id = membership.group.last_message_id
+    if read_id is None or read_id <= membership.read_id:
+        return membership.read_id
+    # Never moves back, should an older read marker arrive last
+    GroupMembership.objects.filter(id=membership.id, read_id__lt=read_id).update(read_id=read_id)
+    return read_id
+
+
+def last_date_sent(last_message_id: Optional[int]) -> Optional[str]:
+    return None if last_message_id is None else ids.id_time(last_message_id).isoformat()
+
+
+def group_entries(username: str) -> List[dict]:
+    """
+    :return: the user's groups, most recently active first, groups without messages last
+    """
+    memberships = GroupMembership.objects.filter(member=inbox_owner(username)).order_by(
+        F('group__last_message_id').desc(nulls_last=True)).values_list('group__name', 'group__last_message_id',
+                                                                       'read_id')
+    return [dict(group=name, last_date_sent=last_date_sent(last_message_id),
+                 unread=last_message_id is not None and last_message_id > read_id)
+            for name, last_message_id, read_id in memberships]
+
+
+def feed_page(username: str, before: Optional[int], per_page: int) -> Dict[str, object]:
+    """
+    :return: {"results": [...], "next_cursor": str or null}
+    """
+    # One extra row tells whether another page exists
+    rows = feeds.feed_rows(inbox_owner(username).id, before, create_filter_range(), per_page + 1)
+    next_cursor = encode_cursor(rows[per_page - 1]['id']) if len(rows) > per_page else None
+    rows = with_usernames(rows[:per_page])
+    for row in rows:
+        row['date_sent'] = row['date_sent'].isoformat()
+    return dict(results=rows, next_cursor=next_cursor)
@@ -1,22 +1,69 @@
 import json
 import logging
+import time
+from collections import Counter
+from concurrent.futures import Future, TimeoutError
+from base64 import urlsafe_b64decode, urlsafe_b64encode
 from datetime import datetime, timedelta
+from itertools import chain
 from json import JSONDecodeError
-from typing import Union, List
+from typing import Callable, Dict, List, Optional, Tuple, Union
 from urllib.parse import parse_qsl
 
 import pytz
 from django.conf import settings
+from django.core.exceptions import ValidationError
 from django.core.handlers.asgi import ASGIRequest
 from django.core.paginator import Paginator
-from django.db.models import QuerySet
-from django.http import JsonResponse
+from django.db.models import Q, QuerySet, Subquery
+from django.http import HttpResponse
 from django.views.decorators.http import require_POST, require_GET
 
+from chatApplication.apis import conditional
+from chatApplication.apis.decorators import admission_control, idempotent
+from chatApplication.apis.responses import JsonResponse
+from chatApplication.caches.versions import ALL_MESSAGES_KEY, conversation_key
 from chatApplication.errors.api_errors import APIError
 from chatApplication.errors.decorators import api_exception_handler
-from chatApplication.models import MessageRecord
+from chatApplication.ingest import idempotency
+from chatApplication.ingest.write_buffer import get_write_buffer
+from chatApplication.models import Conversation, InboxEntry, MessageRecord
+from chatApplication.models.MessageRecords import sent_within, with_usernames
+from chatApplication.models.SearchTokens import tokenize
 from chatApplication.models.Users import User
+from chatApplication.realtime.waiters import waiters
+from chatApplication.signals import messages_sent
+from chatApplication.storage import ids, search, shards
+from chatApplication.storage.routers import replica_alias, replica_reads
+
+WRITE_BUFFER_TIMEOUT_ERROR = 'Timed out waiting for the message to be committed, it may still be saved'
+
+
+def send_costs(request) -> Dict[str, int]:
+    """
+    Admission cost of a send_message request, read leniently: content_extractor reports malformed bodies
+    :return: {sender username: 1}
+    """
+    try:
+        return {str(json.loads(request.body)['sender']): 1}
+    except (ValueError, KeyError, TypeError):
+        return {}
+
+
+def batch_send_costs(request) -> Dict[str, int]:
+    """
+    Admission cost of a send_message_batch request, read leniently: batch_content_extractor reports malformed
+    and oversized bodies
+    :return: {sender username: messages in the batch}
+    """
+    try:
+        items = json.loads(request.body)['messages']
+        if len(items) > settings.MAX_BATCH_SIZE:
+            return {}
+        return Counter(str(item['sender']) for item in items if isinstance(item, dict) and 'sender' in item)
+    except (ValueError, KeyError, TypeError):
+        return {}
+
 
 """
 #########
@@ -27,70 +74,128 @@ APIS    #
 
 @require_POST
 @api_exception_handler
-def send_message(request: ASGIRequest, receiver_username: str, date_time_sent_utc=datetime.now(pytz.UTC)):
+@admission_control(send_costs)
+@idempotent(send_costs)
+def send_message(request: ASGIRequest, receiver_username: str):
     """
     :param request:
     :param receiver_username: user to send message to
-    :param date_time_sent_utc: current time (when the request invoked this function)
     :return:
     """
+    date_time_sent_utc = datetime.now(pytz.UTC)
     sender_username, message = content_extractor(request)
-    sender, _ = User.objects.api_get_or_create(username=sender_username)
-    receiver, _ = User.objects.api_get_or_create(username=receiver_username)
+    create_message(sender_username, receiver_username, message, date_time_sent_utc)
+    return JsonResponse(send_result(date_time_sent_utc))
 
-    record = MessageRecord(sender=sender, receiver=receiver, message=message, date_sent=date_time_sent_utc)
-    record.save()
-    logging.debug(f'{date_time_sent_utc}:\nSent by: {sender}\nSent to {receiver}\n{message}')
-    return JsonResponse(dict(status='success', date_sent=date_time_sent_utc.isoformat()))
+
+@require_POST
+@api_exception_handler
+@admission_control(batch_send_costs)
+@idempotent(batch_send_costs)
+def send_message_batch(request: ASGIRequest):
+    """
+    Sends up to MAX_BATCH_SIZE messages in one request.
+    Users are resolved in bulk and all valid messages are inserted with a single INSERT (per message shard)
+    in one transaction, so the number of database round trips does not grow with the batch size.
+    Invalid items are reported and skipped
+    :param request: {"messages": [{"sender": str, "receiver": str, "message": str}, ...]}
+    :return: {"results": [per item status, in request order]}
+    """
+    items = batch_content_extractor(request)
+    results = create_message_batch(items, datetime.now(pytz.UTC))
+    return JsonResponse(dict(results=results))
 
 
 @require_GET
 @api_exception_handler
+@replica_reads
 def retrieve_messages(request: ASGIRequest):
     """
     Retrieves Messages sent to the the request user by the sender_id
     Range is handled in this entry function
-    Pagination is handled in the paginated_response
+    Pagination is handled in the paginated_response (or keyset_paginated_response when a cursor is given)
+    Pages carry an ETag and are cached until the conversation gets a new message
     utc_today_max: 1 second before tomorrow
     """
-
-    try:
-        content = dict(parse_qsl(request.body.decode('utf8').strip()))
-        sender_username = str(content['sender'])
-        receiver_username = str(content['receiver'])
-    except (KeyError, ValueError):
-        raise APIError(["sender is required and must be a username string",
-                        "receiver is required and must be a username string",
-                        "Content-Type must be application/x-www-form-urlencoded"])
-
-    records = MessageRecord.objects.values('date_sent', 'message').filter(
-        date_sent__range=create_filter_range(),
-        sender__username=sender_username,
-        receiver__username=receiver_username
-    ).order_by('-date_sent')
-    return paginated_response(record_queryset=records,
-                              page=request.GET.get('page', 1),
-                              per_page=request.GET.get('per_page', settings.DEFAULT_MAX_DATA_PER_PAGE)
-                              )
+    sender_username, receiver_username = retrieve_content_extractor(request)
+    records = conversation_records(sender_username, receiver_username)
+    return cached_message_page_response(request, conversation_key(sender_username, receiver_username),
+                                        record_queryset=records, fields=('date_sent', 'message'))
 
 
 @require_GET
 @api_exception_handler
+@replica_reads
 def retrieve_all_messages(request: ASGIRequest):
     """
     All Senders
     Range is handled in this entry function
-    Pagination is handled in the paginated_response
+    Pagination is handled in the paginated_response (or keyset_paginated_response when a cursor is given)
+    Pages carry an ETag and are cached until any new message is sent.
+    With several message shards every page is read from all of them and merged.
+    Messages reference users by id, the usernames returned come from the user cache (with_usernames)
     """
+    records = shards.all_shards(MessageRecord.objects.filter(sent_within(create_filter_range())))
+    return cached_message_page_response(request, ALL_MESSAGES_KEY, record_queryset=records,
+                                        fields=('sender', 'date_sent', 'message', 'receiver'))
 
-    records = MessageRecord.objects.values('sender', 'date_sent', 'message', 'receiver'
-                                           ).filter(date_sent__range=create_filter_range()
-                                                    ).order_by('-date_sent')
 
-    return paginated_response(record_queryset=records,
-                              page=request.GET.get('page', 1),
-                              per_page=request.GET.get('per_page', settings.DEFAULT_MAX_DATA_PER_PAGE)
-                              )
+@require_GET
+@api_exception_handler
+def sync_messages(request: ASGIRequest):
+    """
+    Incremental sync: messages sent to the receiver after the since cursor, oldest first, with a new cursor.
+    With wait={seconds} and nothing new, the request parks until a message is sent to the receiver
+    (by this process) or the wait runs out, so idle clients cost one query per wait period.
+    A message sync_page holds back is returned once it settled, if that is within the wait
+    """
+    receiver_username, since, wait, per_page = sync_params_extractor(request)
+    deadline = time.monotonic() + wait
+    with waiters.waiter(receiver_username) as waiter:
+        records, has_more, cursor, settles_in = sync_page(receiver_username, since, per_page)
+        if not records and wait:
+            if settles_in is None and waiter.wait(wait):
+                settles_in = settings.SYNC_SETTLE_MS / 1000  # the message that woke the request was just sent
+            if settles_in is not None and settles_in <= deadline - time.monotonic():
+                time.sleep(settles_in)
+                records, has_more, cursor, settles_in = sync_page(receiver_username, since, per_page)
+    return sync_response(records, has_more, cursor)
+
+
+@require_GET
+@api_exception_handler
+def inbox(request: ASGIRequest, username: str):
+    """
+    One row per counterpart the user has exchanged messages with, most recent first:
+    the last message, when it was sent, whether the user sent it and how many messages from the counterpart are unread.
+    Read from the InboxEntry summary, so the cost follows the number of conversations, not messages
+    """
+    return JsonResponse(dict(results=inbox_entries(username)))
+
+
+@require_POST
+@api_exception_handler
+def mark_inbox_read(request: ASGIRequest, username: str):
+    """
+    Read marker: resets the unread count of the user's conversation with the counterpart
+    :param request: {"counterpart": str}
+    """
+    counterpart_username = read_marker_extractor(request)
+    read_at = datetime.now(pytz.UTC)
+    mark_read(username, counterpart_username, read_at)
+    return JsonResponse(dict(status='success', read_at=read_at.isoformat()))
+
+
+@require_GET
+@api_exception_handler
+def search_messages(request: ASGIRequest):
+    """
+    Full-text search of the messages a user sent or received, served from an index (see storage.search).
+    Every term of q must match; results are ranked, then newest first, and paginated with a cursor.
+    Optionally scoped to the conversations with one counterpart and to a start/end date range
+    (the default date range otherwise)
+    """
+    return search_page(*search_params_extractor(request))
 
 
 """
@@ -115,6 +220,303 @@ def content_extractor(request):
         raise APIError(message="Content-Type must be application/json")
 
 
+def retrieve_content_extractor(request):
+    try:
+        content = dict(parse_qsl(request.body.decode('utf8').strip()))
+        sender_username = str(content['sender'])
+        receiver_username = str(content['receiver'])
+        return sender_username, receiver_username
+    except (KeyError, ValueError):
+        raise APIError(["sender is required and must be a username string",
+                        "receiver is required and must be a username string",
+                        "Content-Type must be application/x-www-form-urlencoded"])
+
+
+def read_marker_extractor(request) -> str:
+    try:
+        return str(json.loads(request.body)['counterpart'])
+    except (KeyError, TypeError):
+        raise APIError(message="counterpart is required")
+    except JSONDecodeError:
+        raise APIError(message="Content-Type must be application/json")
+
+
+def date_range_extractor(request) -> List[datetime]:
+    """
+    :return: [start, end] from the start and end query params, each defaulting to the default date range's
+    """
+    try:
+        date_range = [datetime.fromisoformat(request.GET[param]) if param in request.GET else default
+                      for param, default in zip(('start', 'end'), create_filter_range())]
+        return [moment if moment.tzinfo else pytz.UTC.localize(moment) for moment in date_range]
+    except ValueError:
+        raise APIError(message="query params start and end must be ISO 8601 dates")
+
+
+def search_params_extractor(request) -> tuple:
+    """
+    :return: user, terms, counterpart (or None), date range, keyset position (or None), per page
+    """
+    username = request.GET.get('user')
+    terms = tokenize(request.GET.get('q', ''))
+    if not username or not terms:
+        raise APIError(["query param user is required", "query param q must contain at least one word"])
+    date_range = date_range_extractor(request)
+    after = None
+    cursor = request.GET.get('cursor')
+    if cursor:
+        try:
+            rank, record_id = decode_cursor(cursor)
+            after = float(rank), int(record_id)
+        except (ValueError, TypeError):
+            raise APIError(message="query param cursor is invalid")
+    per_page = parse_per_page(request.GET.get('per_page', settings.DEFAULT_MAX_DATA_PER_PAGE))
+    return username, terms, request.GET.get('counterpart'), date_range, after, per_page
+
+
+def sync_params_extractor(request) -> Tuple[str, List[int], float, int]:
+    """
+    :return: receiver username, id to sync after on every message shard, seconds to wait, per page
+    """
+    receiver_username = request.GET.get('receiver')
+    if not receiver_username:
+        raise APIError(message="query param receiver is required")
+    since = request.GET.get('since')
+    since_ids = [0] * len(settings.MESSAGE_SHARDS)
+    if since:
+        try:
+            since_ids = [int(since_id) for since_id in decode_cursor(since)]
+            if len(since_ids) != len(settings.MESSAGE_SHARDS):
+                raise ValueError(since_ids)
+        except (ValueError, TypeError):
+            raise APIError(message="query param since is invalid")
+    try:
+        wait = min(float(request.GET.get('wait', 0)), settings.SYNC_MAX_WAIT_SECONDS)
+    except ValueError:
+        raise APIError(message="query param wait must be a number of seconds")
+    per_page = parse_per_page(request.GET.get('per_page', settings.DEFAULT_MAX_DATA_PER_PAGE))
+    return receiver_username, since_ids, max(wait, 0), per_page
+
+
+def batch_content_extractor(request) -> List[Union[tuple, str, list]]:
+    """
+    :param request:
+    :return: per item, either a valid (sender, receiver, message) tuple or the validation error(s)
+    """
+    try:
+        items = json.loads(request.body)['messages']
+    except (KeyError, TypeError):
+        raise APIError(message="messages is required")
+    except JSONDecodeError:
+        raise APIError(message="Content-Type must be application/json")
+    if not isinstance(items, list) or not items:
+        raise APIError(message="messages must be a non-empty list")
+    if len(items) > settings.MAX_BATCH_SIZE:
+        raise APIError(f'Max batch size({settings.MAX_BATCH_SIZE}) exceeded')
+
+    extracted = []
+    for item in items:
+        try:
+            sender, receiver, message = str(item['sender']), str(item['receiver']), str(item['message'])
+            if len(message) > settings.MAX_MESSAGE_LENGTH:
+                extracted.append(f'Max message length({settings.MAX_MESSAGE_LENGTH}) exceeded')
+                continue
+            User.objects.validate_username(sender)
+            User.objects.validate_username(receiver)
+            extracted.append((sender, receiver, message))
+        except (KeyError, TypeError):
+            extracted.append("message is required; sender is required; receiver is required")
+        except ValidationError as e:
+            extracted.append(e.messages)
+    return extracted
+
+
+def create_message(sender_username: str, receiver_username: str, message: str,
+                   date_time_sent_utc: datetime) -> MessageRecord:
+    """
+    Creates the users if needed and saves the message, with the response of the request's Idempotency-Key.
+    With MESSAGE_WRITE_BUFFER on, the message is committed by the write buffer's next group commit instead, unless the
+    request claimed a key: the buffer's transaction could not store its response
+    :return: the saved record
+    """
+    if settings.MESSAGE_WRITE_BUFFER and not idempotency.claimed():
+        future = submit_to_write_buffer(sender_username, receiver_username, message, date_time_sent_utc)
+        try:
+            return future.result(timeout=settings.MESSAGE_WRITE_BUFFER_TIMEOUT)
+        except TimeoutError:
+            raise APIError(message=WRITE_BUFFER_TIMEOUT_ERROR, status=503)
+
+    sender, _ = User.objects.api_get_or_create(username=sender_username)
+    receiver, _ = User.objects.api_get_or_create(username=receiver_username)
+
+    record = MessageRecord(sender=sender, receiver=receiver, message=message, date_sent=date_time_sent_utc)
+    shard = shards.shard_for(sender_username, receiver_username)
+    with shards.atomic(shard):
+        shards.replicate_users(shard, (sender, receiver))
+        record.save(using=shards.using(shard))
+        messages_sent.send(sender=MessageRecord, records=[record])
+        idempotency.store_response(send_result(date_time_sent_utc))
+    logging.debug(f'{date_time_sent_utc}:\nSent by: {sender}\nSent to {receiver}\n{message}')
+    return record
+
+
+def send_result(date_time_sent_utc: datetime) -> dict:
+    """The response of a successful send_message"""
+    return dict(status='success', date_sent=date_time_sent_utc.isoformat())
+
+
+def submit_to_write_buffer(sender_username: str, receiver_username: str, message: str,
+                           date_time_sent_utc: datetime) -> Future:
+    """
+    :return: Future resolved with the saved record once its batch has committed
+    """
+    try:
+        User.objects.validate_username(sender_username)
+        User.objects.validate_username(receiver_username)
+    except ValidationError as e:
+        raise APIError(e.messages)
+    return get_write_buffer().submit((sender_username, receiver_username, message, date_time_sent_utc))
+
+
+def create_message_batch(items: List[Union[tuple, str, list]], date_time_sent_utc: datetime) -> List[dict]:
+    """
+    :param items: output of batch_content_extractor
+    :param date_time_sent_utc: send time of every message in the batch
+    :return: per item status, in request order
+    """
+    valid_items = [item for item in items if isinstance(item, tuple)]
+    results = [dict(status='success', date_sent=date_time_sent_utc.isoformat()) if isinstance(item, tuple)
+               else dict(status='error', error=item)
+               for item in items]
+    if valid_items:
+        with shards.atomic(*shards.shards_for(valid_items)):
+            users = User.objects.bulk_get_or_create(username for sender_username, receiver_username, _ in valid_items
+                                                    for username in (sender_username, receiver_username))
+            records = shards.bulk_send([MessageRecord(sender=users[sender_username],
+                                                      receiver=users[receiver_username],
+                                                      message=message,
+                                                      date_sent=date_time_sent_utc)
+                                        for sender_username, receiver_username, message in valid_items])
+            messages_sent.send(sender=MessageRecord, records=records)
+            idempotency.store_response(dict(results=results))
+        logging.debug(f'{date_time_sent_utc}: Sent batch of {len(valid_items)} messages')
+    return results
+
+
+def conversation_records(sender_username: str, receiver_username: str) -> QuerySet:
+    """
+    Messages from sender to receiver within the default date range, on the conversation's shard.
+    Lazy, evaluating it queries the database
+    """
+    shard = shards.using(shards.shard_for(sender_username, receiver_username))
+    conversation = Conversation.objects.db_manager(shard).cached_for_usernames(sender_username, receiver_username)
+    if conversation is None:
+        conversation = Subquery(Conversation.objects.filter(sender__username=sender_username,
+                                                            receiver__username=receiver_username).values('id')[:1])
+    return MessageRecord.objects.using(shard).filter(sent_within(create_filter_range()), conversation=conversation)
+
+
+def inbox_owner(username: str) -> User:
+    try:
+        return User.objects.get_user(username)
+    except User.DoesNotExist:
+        raise APIError(message='User does not exist', status=404)
+
+
+def inbox_entries(username: str) -> List[dict]:
+    """
+    :return: the user's inbox entries, most recent first
+    """
+    entries = InboxEntry.objects.filter(owner=inbox_owner(username)).order_by('-last_date_sent').values_list(
+        'counterpart__username', 'last_message', 'last_date_sent', 'last_sent_by_owner', 'unread_count')
+    return [dict(counterpart=counterpart, last_message=last_message, last_date_sent=last_date_sent.isoformat(),
+                 last_sent_by_me=last_sent_by_owner, unread_count=unread_count)
+            for counterpart, last_message, last_date_sent, last_sent_by_owner, unread_count in entries]
+
+
+def mark_read(username: str, counterpart_username: str, read_at: datetime):
+    owner = inbox_owner(username)
+    try:
+        counterpart = User.objects.get_user(counterpart_username)
+    except User.DoesNotExist:
+        raise APIError(message='Counterpart does not exist', status=404)
+    if not InboxEntry.objects.mark_read(owner, counterpart, read_at):
+        raise APIError(message='No conversation with counterpart', status=404)
+
+
+def search_page(username: str, terms: List[str], counterpart_username: str, date_range: List[datetime],
+                after: tuple, per_page: int) -> JsonResponse:
+    """
+    :return: JsonResponse: {"results": [...], "next_cursor": str or null}
+    """
+    conversations = Conversation.objects.filter(Q(sender__username=username) | Q(receiver__username=username))
+    if counterpart_username:
+        conversations = conversations.filter(Q(sender__username=counterpart_username) |
+                                             Q(receiver__username=counterpart_username))
+    # Fetch one extra row to learn whether another page exists, from every shard
+    records = shards.merge(shards.scatter(lambda shard: search.search_messages(
+        terms, conversations.values('id'), date_range, after, per_page + 1, using=shards.using(shard))),
+        key=lambda record: (record['rank'], record['id']), limit=per_page + 1)
+    next_cursor = None
+    if len(records) > per_page:
+        records = records[:per_page]
+        last = records[-1]
+        next_cursor = encode_cursor(last['rank'], last['id'])
+    for obj in with_usernames(records):
+        obj['date_sent'] = obj['date_sent'].isoformat()
+    return JsonResponse(dict(results=records, next_cursor=next_cursor))
+
+
+def sync_page(receiver_username: str, since_ids: List[int],
+              per_page: int) -> Tuple[List[dict], bool, List[int], Optional[float]]:
+    """
+    The sync position is the last id taken from every message shard: ids are time ordered, and kept per shard
+    a message a shard commits after another shard's newer one is not skipped.
+    Ids are not made in commit order though: an id stands for its message's date_sent, taken when the send started,
+    and a slow send, a write buffer batch or a worker whose clock is behind commits it after newer ones. Messages
+    of the last SYNC_SETTLE_MS are held back, so the position never passes an id that may still be committed.
+    A message committed later than that after its date_sent, e.g. an import (storage.transfer) of past messages,
+    is behind positions already handed out: clients that synced past it never receive it
+    :param since_ids: id to sync after, per shard
+    :return: up to per_page messages sent to receiver after since_ids within the default date range,
+    oldest first, whether more are waiting, the new position and the seconds until the oldest message held back
+    settles (None if none is)
+    """
+    date_range = create_filter_range()
+    settled = ids.first_id(date_range[1] - timedelta(milliseconds=settings.SYNC_SETTLE_MS))
+    since = dict(zip(settings.MESSAGE_SHARDS, since_ids))
+    receiver = User.objects.cached(receiver_username)
+    receiver_id = receiver.id if receiver else Subquery(User.objects.filter(username=receiver_username).values('id'))
+
+    def shard_page(shard: str) -> List[tuple]:
+        return [(shard, record) for record in MessageRecord.objects.using(shards.using(shard)).filter(
+            sent_within(date_range),
+            receiver_id=receiver_id,
+            id__gt=since[shard],
+        ).values('id', 'sender', 'date_sent', 'message').order_by('id')[:per_page + 1]]
+
+    pages = shards.scatter(shard_page)
+    held_back = [record['id'] for page in pages for _, record in page if record['id'] >= settled]
+    pages = [[row for row in page if row[1]['id'] < settled] for page in pages]
+    taken = shards.merge(pages, key=lambda row: row[1]['id'], limit=per_page, reverse=False)
+    for shard, record in taken:
+        since[shard] = record['id']
+    settles_in = None
+    if held_back:
+        settles_in = (ids.id_time(min(held_back)) - ids.id_time(settled) + ids.MILLISECOND).total_seconds()
+    return (with_usernames([record for _, record in taken]), sum(map(len, pages)) > per_page, list(since.values()),
+            settles_in)
+
+
+def sync_response(records: List[dict], has_more: bool, cursor: List[int]) -> JsonResponse:
+    """
+    :param cursor: sync position, see sync_page
+    """
+    for obj in records:
+        obj['date_sent'] = obj['date_sent'].isoformat()
+    return JsonResponse(dict(results=records, cursor=encode_cursor(*cursor), has_more=has_more))
+
+
 def utc_today_max() -> datetime:
     return datetime.now(pytz.UTC).replace(hour=23, minute=59, second=59, microsecond=999999)
 
@@ -130,6 +532,153 @@ def create_filter_range(date_range=settings.DEFAULT_DATE_RANGE) -> List[datetime
     return [start, end]
 
 
+def encode_cursor(*position) -> str:
+    """
+    Encode a position in an ordered result set into an opaque, url safe token
+    :param position: json serializable values identifying the last row returned
+    :return: cursor string
+    """
+    raw = json.dumps(position, separators=(',', ':')).encode('utf8')
+    return urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str) -> list:
+    """
+    Inverse of encode_cursor
+    :param cursor: token previously handed out as next_cursor
+    :return: the list of position values
+    """
+    try:
+        position = json.loads(urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if not isinstance(position, list):
+            raise ValueError(position)
+        return position
+    except (ValueError, TypeError):
+        raise APIError(message="query param cursor is invalid")
+
+
+def message_page_response(request: ASGIRequest, record_queryset: QuerySet, fields: tuple) -> JsonResponse:
+    """
+    Offset pagination (page/per_page) by default; keyset pagination when the cursor query param is present.
+    An empty cursor requests the first page. format=columnar returns the page as parallel arrays instead of objects.
+    :param request:
+    :param record_queryset: filtered, unordered MessageRecord query set, or a ShardedQuerySet over every shard
+    :param fields: MessageRecord fields to return for every record
+    :return: JsonResponse
+    """
+    per_page = request.GET.get('per_page', settings.DEFAULT_MAX_DATA_PER_PAGE)
+    cursor = request.GET.get('cursor')
+    response_format = request.GET.get('format', 'json')
+    if response_format == 'columnar':
+        return columnar_page_response(record_queryset=record_queryset, fields=fields, cursor=cursor,
+                                      page=request.GET.get('page', 1), per_page=per_page)
+    if response_format != 'json':
+        raise APIError("query param format must be json or columnar")
+    if cursor is not None:
+        return keyset_paginated_response(record_queryset=record_queryset.values('id', *fields),
+                                         cursor=cursor,
+                                         per_page=per_page)
+    return paginated_response(record_queryset=record_queryset.values(*fields).order_by('-id'),
+                              page=request.GET.get('page', 1),
+                              per_page=per_page)
+
+
+def cached_message_page_response(request: ASGIRequest, version_key: str, record_queryset: QuerySet,
+                                 fields: tuple) -> HttpResponse:
+    """
+    message_page_response behind a conditional GET (If-None-Match) and the response cache.
+    The version of version_key is read before the page is rendered, so a cached page is never older than its ETag.
+    That only holds on the primary: a lagging replica could render content older than the version, so a page
+    rendered from a replica is neither cached nor versioned, its ETag hashes its content (conditional.tag_content).
+    Likewise every page without a version store
+    """
+    if not conditional.versioned():
+        return conditional.tag_content(request, message_page_response(request, record_queryset, fields))
+    key, etag, response = conditional.lookup(request, version_key, create_filter_range()[0])
+    if response is None:
+        response = message_page_response(request, record_queryset, fields)
+        if replica_alias() is None:
+            response = conditional.store(key, etag, response)
+        else:
+            response = conditional.tag_content(request, response)
+    return response
+
+
+def parse_per_page(per_page: Union[int, str]) -> int:
+    """
+    :return: per_page as a positive int, capped at DEFAULT_MAX_DATA_PER_PAGE
+    """
+    try:
+        per_page = int(per_page)
+        per_page = settings.DEFAULT_MAX_DATA_PER_PAGE if per_page > settings.DEFAULT_MAX_DATA_PER_PAGE else per_page
+    except ValueError:
+        raise APIError("query param per_page must be int")
+    if per_page < 1:
+        raise APIError("query param per_page must be positive")
+    return per_page
+
+
+def parse_page(page: Union[int, str]) -> int:
+    """
+    :return: page as a positive int
+    """
+    try:
+        page = int(page)
+    except ValueError:
+        raise APIError("query param page must be int")
+    if page < 1:
+        raise APIError("query param page must be positive")
+    return page
+
+
+def after_cursor(record_queryset: Union[QuerySet, shards.ShardedQuerySet], cursor: str):
+    """
+    :param record_queryset: MessageRecord query set, or one over every shard
+    :param cursor: next_cursor of the previous page, empty for the first page
+    :return: the records past the id in the cursor, older ones since ids are time ordered
+    """
+    if not cursor:
+        return record_queryset
+    try:
+        record_id, = decode_cursor(cursor)
+        record_id = int(record_id)
+    except (ValueError, TypeError):
+        raise APIError(message="query param cursor is invalid")
+    return record_queryset.filter(id__lt=record_id)
+
+
+def keyset_page(record_queryset, cursor: str, per_page: int, position: Callable) -> Tuple[list, Optional[str]]:
+    """
+    :param record_queryset: values or values_list MessageRecord query set (or one over every shard)
+    :param cursor: next_cursor of the previous page, empty for the first page
+    :param position: id of a row
+    :return: the per_page rows past the cursor, newest first, and the cursor of the next page (None on the last)
+    """
+    # Fetch one extra row to learn whether another page exists without a COUNT(*)
+    rows = list(after_cursor(record_queryset, cursor).order_by('-id')[:per_page + 1])
+    if len(rows) <= per_page:
+        return rows, None
+    return rows[:per_page], encode_cursor(position(rows[per_page - 1]))
+
+
+def keyset_paginated_response(record_queryset: QuerySet, cursor: str, per_page: Union[int, str]) -> JsonResponse:
+    """
+    Seeks past the id in the cursor instead of counting and offsetting,
+    so every page costs one index range read no matter how deep it is.
+    Messages that arrive between requests are newer than the cursor and never shift later pages.
+    :param record_queryset: MessageRecord values query set, must include id and date_sent
+                            (or one over every shard)
+    :param cursor: next_cursor of the previous page, empty for the first page
+    :param per_page: items per page
+    :return: JsonResponse: {"results": [...], "next_cursor": str or null}
+    """
+    page_records, next_cursor = keyset_page(record_queryset, cursor, parse_per_page(per_page),
+                                            position=lambda record: record['id'])
+    for obj in with_usernames(page_records):
+        obj['date_sent'] = obj['date_sent'].isoformat()
+    return JsonResponse(dict(results=page_records, next_cursor=next_cursor))
+
+
 def paginated_response(record_queryset: QuerySet, page: Union[int, str], per_page: Union[int, str]) -> JsonResponse:
     """
     :param record_queryset: The query set to paginate
@@ -151,7 +700,56 @@ def paginated_response(record_queryset: QuerySet, page: Union[int, str], per_pag
 
     # Prep response and return
     page_records = []  # Collect formatted data here
-    for obj in paginated_records.page(page).object_list:
+    for obj in with_usernames(list(paginated_records.page(page).object_list)):
         obj['date_sent'] = obj['date_sent'].isoformat()
         page_records.append(obj)
     return JsonResponse(page_records, safe=False)
+
+
+def columnar_page_response(record_queryset: QuerySet, fields: tuple, cursor: Union[str, None],
+                           page: Union[int, str], per_page: Union[int, str]) -> JsonResponse:
+    """
+    Same pages as keyset_paginated_response (cursor given) or paginated_response, read as values_list tuples
+    and returned column by column, see columnar_columns
+    :return: JsonResponse: {"format": "columnar", "count": int, "users": [...], "columns": {...}}
+             plus "next_cursor" with a cursor, or "num_pages" without
+    """
+    if cursor is not None:
+        names = ('id', *fields)
+        rows, next_cursor = keyset_page(record_queryset.values_list(*names), cursor, parse_per_page(per_page),
+                                        position=lambda row: row[0])
+        paging = dict(next_cursor=next_cursor)
+    else:
+        names = fields
+        page = parse_page(page)
+        paginated_records = Paginator(record_queryset.values_list(*names).order_by('-id'),
+                                      per_page=parse_per_page(per_page))
+        rows = []
+        if page < paginated_records.page_range.stop:
+            rows = list(paginated_records.page(page).object_list)
+        paging = dict(num_pages=paginated_records.num_pages)
+
+    users, columns = columnar_columns(rows, names)
+    return JsonResponse(dict(format='columnar', count=len(rows), users=users, columns=columns, **paging))
+
+
+def columnar_columns(rows: List[tuple], names: tuple) -> Tuple[list, dict]:
+    """
+    Transposes rows into one list per field without building a dict per row.
+    date_sent becomes integer epoch milliseconds; sender and receiver (user ids) become indexes into the returned
+    users list, so every username is sent once per page
+    :param rows: values_list tuples
+    :param names: field name of every tuple position
+    :return: users, {field: [value per row]}
+    """
+    columns = dict(zip(names, map(list, zip(*rows)))) if rows else {name: [] for name in names}
+    if 'date_sent' in columns:
+        columns['date_sent'] = [round(date_sent.timestamp() * 1000) for date_sent in columns['date_sent']]
+    user_columns = [name for name in ('sender', 'receiver') if name in columns]
+    # dict.fromkeys keeps first-seen order, so the same page always gets the same table
+    user_ids = list(dict.fromkeys(chain.from_iterable(columns[name] for name in user_columns)))
+    user_index = {user_id: index for index, user_id in enumerate(user_ids)}
+    for name in user_columns:
+        columns[name] = [user_index[user_id] for user_id in columns[name]]
+    usernames = User.objects.usernames(user_ids)
+    return [usernames[user_id] for user_id in user_ids], columns
@@ -0,0 +1,11 @@
+from django import http
+
+from chatApplication.metrics.instrumentation import serialization_timer
+
+
+class JsonResponse(http.JsonResponse):
+    """django's JsonResponse, with the encoding timed as the request's serialization time"""
+
+    def __init__(self, *args, **kwargs):
+        with serialization_timer():
+            super().__init__(*args, **kwargs)
@@ -0,0 +1,107 @@
+from datetime import datetime
+from typing import List, Optional
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.views.decorators.http import require_GET
+
+from chatApplication.apis.message_api import date_range_extractor
+from chatApplication.apis.responses import JsonResponse
+from chatApplication.errors.api_errors import APIError
+from chatApplication.errors.decorators import api_exception_handler
+from chatApplication.models.Users import User
+from chatApplication.storage import volumes
+from chatApplication.storage.routers import replica_reads
+
+GRANULARITIES = ('hour', 'day')
+
+"""
+Message volume statistics, answered from the hourly and daily rollups (see models/MessageVolumes.py),
+never by counting messages
+"""
+
+
+@require_GET
+@api_exception_handler
+@replica_reads
+def message_volume(request: ASGIRequest, username: str):
+    """
+    Messages the user sent and received per hour or day (granularity, day by default), oldest first, skipping
+    empty buckets. Optionally only those exchanged with one counterpart, within start/end
+    (the default date range otherwise)
+    """
+    return JsonResponse(volume_stats(username, *volume_params_extractor(request)))
+
+
+@require_GET
+@api_exception_handler
+@replica_reads
+def top_users(request: ASGIRequest):
+    """
+    The users who sent (direction=sent, the default) or received the most messages within start/end.
+    With user={username}, that user's counterparts instead: whom they sent the most to, or received the most from
+    """
+    return JsonResponse(top_stats(*top_params_extractor(request)))
+
+
+"""
+#########
+Helpers #
+#########
+"""
+
+
+def granularity_extractor(request) -> str:
+    granularity = request.GET.get('granularity', 'day')
+    if granularity not in GRANULARITIES:
+        raise APIError(message="query param granularity must be hour or day")
+    return granularity
+
+
+def volume_params_extractor(request) -> tuple:
+    """
+    :return: granularity, date range, counterpart (or None)
+    """
+    return granularity_extractor(request), date_range_extractor(request), request.GET.get('counterpart')
+
+
+def top_params_extractor(request) -> tuple:
+    """
+    :return: direction, granularity, date range, limit, user (or None)
+    """
+    direction = request.GET.get('direction', 'sent')
+    if direction not in volumes.DIRECTIONS:
+        raise APIError(message="query param direction must be sent or received")
+    try:
+        limit = min(int(request.GET.get('limit', settings.STATS_TOP_LIMIT)), settings.DEFAULT_MAX_DATA_PER_PAGE)
+    except ValueError:
+        raise APIError(message="query param limit must be int")
+    if limit < 1:
+        raise APIError(message="query param limit must be positive")
+    return direction, granularity_extractor(request), date_range_extractor(request), limit, request.GET.get('user')
+
+
+def stats_user(username: str, role: str = 'User') -> User:
+    try:
+        return User.objects.get_user(username)
+    except User.DoesNotExist:
+        raise APIError(message=f'{role} does not exist', status=404)
+
+
+def volume_stats(username: str, granularity: str, date_range: List[datetime],
+                 counterpart_username: Optional[str]) -> dict:
+    user = stats_user(username)
+    counterpart_id = stats_user(counterpart_username, 'Counterpart').id if counterpart_username else None
+    series = volumes.volume_series(user.id, granularity, date_range, counterpart_id)
+    for point in series:
+        point['bucket'] = point['bucket'].isoformat()
+    return dict(user=username, granularity=granularity, results=series)
+
+
+def top_stats(direction: str, granularity: str, date_range: List[datetime], limit: int,
+              username: Optional[str]) -> dict:
+    user_id = stats_user(username).id if username else None
+    top = volumes.top_users(direction, granularity, date_range, limit, user_id)
+    usernames = User.objects.usernames(top_id for top_id, _ in top)
+    return dict(direction=direction, granularity=granularity,
+                results=[dict(username=usernames[top_id], count=count) for top_id, count in top])
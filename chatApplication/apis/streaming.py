@@ -0,0 +1,110 @@
+import asyncio
+import json
+import threading
+from typing import Iterable, Iterator
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+from chatApplication.apis.db_executor import run_in_db_executor
+
+_END = object()
+
+
+def json_array_chunks(rows: Iterable, buffer_size: int = None) -> Iterator[bytes]:
+    """
+    Encodes rows as one JSON array, incrementally.
+    Encoded rows are gathered into chunks of about buffer_size bytes so the server is not flushing tiny writes
+    :param rows: json serializable rows, typically QuerySet.values(...).iterator(chunk_size=...)
+    :param buffer_size: bytes per yielded chunk, STREAM_BUFFER_BYTES by default
+    """
+    buffer_size = buffer_size or settings.STREAM_BUFFER_BYTES
+    encoder = DjangoJSONEncoder(separators=(', ', ': '))
+    buffer, buffered = ['['], 1
+    for index, row in enumerate(rows):
+        encoded = encoder.encode(row)
+        if index:
+            buffer.append(', ')
+            buffered += 2
+        buffer.append(encoded)
+        buffered += len(encoded)
+        if buffered >= buffer_size:
+            yield ''.join(buffer).encode('utf8')
+            buffer, buffered = [], 0
+    buffer.append(']')
+    yield ''.join(buffer).encode('utf8')
+
+
+def streaming_json_response(rows: Iterable) -> StreamingHttpResponse:
+    """
+    JSON array response whose peak memory does not depend on the number of rows.
+    Rows should come from QuerySet.iterator(chunk_size=STREAM_CHUNK_SIZE), which reads through a server side
+    cursor on postgres. They are read while the response is sent, under ASGI that takes StreamingASGIHandler
+    """
+    return StreamingHttpResponse(json_array_chunks(rows), content_type='application/json')
+
+
+def _read_on_this_thread(response, loop, chunks: asyncio.Queue, stopped: threading.Event):
+    """
+    Iterates response and hands every part to the event loop, blocking while the queue is full.
+    One thread reads the whole response: a server side cursor stays on the connection that opened it
+    """
+
+    def put(item):
+        asyncio.run_coroutine_threadsafe(chunks.put(item), loop).result()
+
+    try:
+        for part in response:
+            if stopped.is_set():
+                break
+            put(part)
+    finally:
+        put(_END)
+
+
+class StreamingASGIHandler(ASGIHandler):
+    """
+    Django 3.2's ASGIHandler iterates streaming responses on the event loop, where the ORM refuses to run.
+    This one iterates them on a database thread (run_in_db_executor), at most STREAM_CHUNKS_AHEAD chunks ahead
+    of what the loop has sent
+    """
+
+    async def send_response(self, response, send):
+        if not response.streaming:
+            return await super().send_response(response, send)
+
+        response_headers = []
+        for header, value in response.items():
+            if isinstance(header, str):
+                header = header.encode('ascii')
+            if isinstance(value, str):
+                value = value.encode('latin1')
+            response_headers.append((bytes(header), bytes(value)))
+        for cookie in response.cookies.values():
+            response_headers.append((b'Set-Cookie', cookie.output(header='').encode('ascii').strip()))
+        await send({'type': 'http.response.start', 'status': response.status_code, 'headers': response_headers})
+
+        chunks, stopped = asyncio.Queue(maxsize=settings.STREAM_CHUNKS_AHEAD), threading.Event()
+        reader = asyncio.ensure_future(
+            run_in_db_executor(_read_on_this_thread, response, asyncio.get_running_loop(), chunks, stopped))
+        part = None
+        try:
+            while True:
+                part = await chunks.get()
+                if part is _END:
+                    break
+                for chunk, _ in self.chunk_bytes(part):
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            await reader  # raises what the iteration raised
+            await send({'type': 'http.response.body'})
+        finally:
+            if part is not _END:
+                # The client is gone: stop the reader, taking what it still puts so it is not blocked
+                stopped.set()
+                while await chunks.get() is not _END:
+                    pass
+            await asyncio.wait({reader})
+            await sync_to_async(response.close, thread_sensitive=True)()
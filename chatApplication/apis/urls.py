@@ -1,14 +1,42 @@
+from django.conf import settings
 from django.urls import path
 
-from chatApplication.apis.message_api import send_message, retrieve_messages, retrieve_all_messages
-from chatApplication.apis.user_api import create_user, get_user, all_users
+if settings.ASYNC_VIEWS:
+    from chatApplication.apis.async_message_api import send_message, send_message_batch, retrieve_messages, \
+        retrieve_all_messages, sync_messages, inbox, mark_inbox_read, search_messages
+    from chatApplication.apis.async_user_api import create_user, get_user, all_users
+    from chatApplication.apis.async_stats_api import message_volume, top_users
+    from chatApplication.apis.async_group_api import create_group, update_group_members, send_group_message, \
+        mark_group_read, user_groups, message_feed
+else:
+    from chatApplication.apis.message_api import send_message, send_message_batch, retrieve_messages, \
+        retrieve_all_messages, sync_messages, inbox, mark_inbox_read, search_messages
+    from chatApplication.apis.user_api import create_user, get_user, all_users
+    from chatApplication.apis.stats_api import message_volume, top_users
+    from chatApplication.apis.group_api import create_group, update_group_members, send_group_message, \
+        mark_group_read, user_groups, message_feed
 
 urlpatterns = [
+    path('message/send/batch/', send_message_batch, name='send-batch'),  # Send many messages at once
     path('message/send/<str:receiver_username>', send_message, name='send'),  # Send Message
     path('message/retrieve/', retrieve_messages, name='retrieve'),  # Specific sender
     path('message/retrieve/all/', retrieve_all_messages, name='retrieve-all'),  # all senders
+    path('message/sync/', sync_messages, name='sync'),  # new messages for a receiver, long-polling
+    path('message/search/', search_messages, name='search'),  # full-text search
+    path('message/inbox/<str:username>', inbox, name='inbox'),  # one row per conversation
+    path('message/inbox/<str:username>/read', mark_inbox_read, name='inbox-read'),  # reset unread count
+    path('message/feed/', message_feed, name='feed'),  # direct and group messages of a user
 
     path('user/create-user/<str:username>', create_user, name='create-user'),
     path('user/get-user/<str:username>', get_user, name='get-user'),
-    path('user/all-users/', all_users, name='get-user')
+    path('user/all-users/', all_users, name='all-users'),
+
+    path('group/create/<str:name>', create_group, name='create-group'),
+    path('group/list/<str:username>', user_groups, name='user-groups'),  # one row per group of the user
+    path('group/<str:name>/members', update_group_members, name='group-members'),  # add and remove members
+    path('group/<str:name>/send', send_group_message, name='group-send'),  # stored once for every member
+    path('group/<str:name>/read', mark_group_read, name='group-read'),  # move the member's read cursor
+
+    path('stats/volume/<str:username>', message_volume, name='stats-volume'),  # sent/received per hour or day
+    path('stats/top/', top_users, name='stats-top'),  # top senders, receivers or counterparts
 ]
@@ -1,9 +1,12 @@
-from django.http import JsonResponse
+from django.conf import settings
 from django.views.decorators.http import require_POST, require_GET
 
+from chatApplication.apis.responses import JsonResponse
+from chatApplication.apis.streaming import streaming_json_response
 from chatApplication.errors.api_errors import APIError
 from chatApplication.errors.decorators import api_exception_handler
 from chatApplication.models.Users import User
+from chatApplication.storage.routers import replica_reads
 
 
 @require_POST
@@ -15,9 +18,10 @@ def create_user(request, username):
 
 @require_GET
 @api_exception_handler
+@replica_reads
 def get_user(request, username):
     try:
-        user = User.objects.get(username=username)
+        user = User.objects.get_user(username)
         return JsonResponse(dict(id=user.id, username=username))
     except User.DoesNotExist:
         raise APIError(message='User does not exist', status=404)
@@ -25,6 +29,15 @@ def get_user(request, username):
 
 @require_GET
 @api_exception_handler
+@replica_reads
 def all_users(request):
-    users = list(User.objects.all().values('id', 'username'))
-    return JsonResponse(users, safe=False)
+    """
+    Streamed, so memory stays flat however many users there are
+    """
+    return streaming_json_response(all_users_rows())
+
+
+def all_users_rows():
+    users = User.objects.order_by('id').values('id', 'username')
+    # Rows are read while the response streams, after the view returned: pick the database (a replica) now
+    return users.using(users.db).iterator(chunk_size=settings.STREAM_CHUNK_SIZE)
@@ -0,0 +1,15 @@
+from django.apps import AppConfig
+from django.core import checks
+
+
+class ChatApplicationConfig(AppConfig):
+    name = 'chatApplication'
+
+    def ready(self):
+        # Connect signal receivers
+        from chatApplication.caches import versions  # noqa: F401
+        from chatApplication.realtime import receivers  # noqa: F401
+        from chatApplication.storage import connections  # noqa: F401
+
+        from chatApplication.storage import ids
+        checks.register(ids.check_worker_id)
@@ -1,7 +1,15 @@
 import os
 
-from django.core.asgi import get_asgi_application
+import django
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'chatApplication.settings')
 
-application = get_asgi_application()
+# What django.core.asgi.get_asgi_application does, with a handler that streams responses off the event loop
+django.setup(set_prefix=False)
+
+from chatApplication.apis.streaming import StreamingASGIHandler  # noqa: E402 (needs django set up)
+from chatApplication.realtime.consumers import realtime_router  # noqa: E402 (needs django set up)
+
+django_application = StreamingASGIHandler()
+
+application = realtime_router(django_application)
@@ -0,0 +1,73 @@
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from typing import Any, Hashable
+
+_caches = weakref.WeakSet()
+
+
+class LRUCache:
+    """
+    Bounded, thread safe, process local mapping.
+    Least recently used entries are evicted once max_size is reached and entries expire ttl seconds after being set
+    """
+
+    def __init__(self, max_size: int, ttl: float, name: str = ''):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # key -> (expires_at, value), least recently used first
+        self._lock = threading.Lock()
+        _caches.add(self)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: Hashable):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        return dict(hits=self.hits, misses=self.misses, evictions=self.evictions, size=len(self._entries))
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def clear_caches():
+    """Empty every LRUCache in this process"""
+    for cache in list(_caches):
+        cache.clear()
+
+
+def cache_stats() -> dict:
+    """:return: cache name -> LRUCache.stats() for every LRUCache in this process"""
+    return {cache.name: cache.stats() for cache in list(_caches)}
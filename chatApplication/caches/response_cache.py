@@ -0,0 +1,56 @@
+import threading
+from typing import Optional
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+
+from chatApplication.caches.lru_cache import LRUCache
+
+
+class ResponseCache:
+    """Rendered response bodies by key. Keys embed a version token, so entries are never updated in place"""
+
+    def get(self, key: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    def set(self, key: str, body: bytes):
+        raise NotImplementedError
+
+
+class LocalResponseCache(ResponseCache):
+    """In-process LRU, the default"""
+
+    def __init__(self):
+        self.cache = LRUCache(max_size=settings.RESPONSE_CACHE_SIZE, ttl=settings.RESPONSE_CACHE_TTL, name='response')
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.cache.get(key)
+
+    def set(self, key: str, body: bytes):
+        self.cache.set(key, body)
+
+
+class DjangoResponseCache(ResponseCache):
+    """Any django cache (settings.RESPONSE_CACHE_CACHE), e.g. memcached or redis shared by every process"""
+
+    def __init__(self):
+        self.cache = caches[settings.RESPONSE_CACHE_CACHE]
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.cache.get(key)
+
+    def set(self, key: str, body: bytes):
+        self.cache.set(key, body, timeout=settings.RESPONSE_CACHE_TTL)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = import_string(settings.RESPONSE_CACHE_BACKEND)()
+        return _cache
@@ -0,0 +1,106 @@
+import random
+import threading
+from typing import Iterable, List, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from chatApplication.models import MessageRecord
+from chatApplication.signals import messages_sent
+
+ALL_MESSAGES_KEY = 'messages:all'
+
+
+def conversation_key(sender_username: str, receiver_username: str) -> str:
+    return f'conversation:{sender_username}:{receiver_username}'
+
+
+class VersionStore:
+    """
+    Version tokens of cached content, bumped whenever the content changes.
+    A token never repeats for different content, so it can be baked into ETags and cache keys,
+    and bumping a version invalidates everything derived from it
+    """
+
+    def token(self, key: str) -> str:
+        raise NotImplementedError
+
+    def bump(self, keys: Iterable[str]):
+        raise NotImplementedError
+
+
+class LocalVersionStore(VersionStore):
+    """
+    In-process counters. The epoch is drawn per process so a restart never reuses a token;
+    with several worker processes each only sees its own bumps, use a shared store there
+    """
+
+    def __init__(self):
+        self.epoch = f'{random.getrandbits(32):08x}'
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def token(self, key: str) -> str:
+        return f'{self.epoch}.{self._versions.get(key, 0)}'
+
+    def bump(self, keys: Iterable[str]):
+        with self._lock:
+            for key in keys:
+                self._versions[key] = self._versions.get(key, 0) + 1
+
+
+class DjangoCacheVersionStore(VersionStore):
+    """
+    Versions shared by every process through a django cache (settings.VERSION_STORE_CACHE, e.g. memcached or redis).
+    A missing version starts at a random value, so an evicted one is not reused
+    """
+
+    def __init__(self):
+        self.cache = caches[settings.VERSION_STORE_CACHE]
+
+    def token(self, key: str) -> str:
+        version = self.cache.get(key)
+        if version is None:
+            self.cache.add(key, random.getrandbits(48), timeout=None)
+            version = self.cache.get(key)
+        return str(version)
+
+    def bump(self, keys: Iterable[str]):
+        for key in keys:
+            try:
+                self.cache.incr(key)
+            except ValueError:  # missing
+                self.cache.add(key, random.getrandbits(48), timeout=None)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_version_store() -> Optional[VersionStore]:
+    """
+    :return: the store of settings.VERSION_STORE_BACKEND, None without one
+    """
+    global _store
+    if settings.VERSION_STORE_BACKEND is None:
+        return None
+    with _store_lock:
+        if _store is None:
+            _store = import_string(settings.VERSION_STORE_BACKEND)()
+        return _store
+
+
+@receiver(messages_sent)
+def bump_message_versions(sender, records: List[MessageRecord], **kwargs):
+    """
+    Bumps the versions of the conversations written to (and of all messages) once the send has committed.
+    Bumping earlier would let a concurrent read cache the old content under the new version
+    """
+    if get_version_store() is None:
+        return
+    keys = {conversation_key(record.sender.username, record.receiver.username) for record in records}
+    keys.add(ALL_MESSAGES_KEY)
+    transaction.on_commit(lambda: get_version_store().bump(keys))
@@ -2,3 +2,53 @@ MAX_MESSAGE_LENGTH = 200
 USERNAME_MAX_LENGTH = 16
 DEFAULT_DATE_RANGE = 30
 DEFAULT_MAX_DATA_PER_PAGE = 100
+MAX_BATCH_SIZE = 500
+USER_CACHE_SIZE = 10000
+USER_CACHE_TTL = 300  # seconds
+CONVERSATION_CACHE_SIZE = 10000
+CONVERSATION_CACHE_TTL = 300  # seconds
+ASYNC_DB_POOL_SIZE = 16  # threads (and at most as many connections) per worker serving async views' ORM calls
+MESSAGE_HUB_BACKEND = 'chatApplication.realtime.hub.InMemoryHub'
+PUSH_QUEUE_SIZE = 100  # undelivered messages buffered per push subscriber
+PUSH_SLOW_CONSUMER_POLICY = 'drop'  # 'drop' the oldest queued message or 'disconnect' the subscriber when full
+PUSH_KEEPALIVE_SECONDS = 15
+SYNC_MAX_WAIT_SECONDS = 30  # longest a /message/sync/ request may park waiting for new messages
+SYNC_SETTLE_MS = 2000  # sync holds back newer messages: longest send commit latency plus worker clock skew
+MESSAGE_WRITE_BUFFER = False  # group commit send_message writes, see chatApplication.ingest.write_buffer
+MESSAGE_WRITE_BUFFER_MAX_BATCH = 200  # messages per commit
+MESSAGE_WRITE_BUFFER_MAX_DELAY_MS = 5  # longest the first message of a batch waits for more
+MESSAGE_WRITE_BUFFER_TIMEOUT = 10  # seconds a request waits for its batch to commit
+STREAM_CHUNK_SIZE = 2000  # rows fetched per round trip by streaming responses
+STREAM_BUFFER_BYTES = 64 * 1024  # bytes gathered before a streaming response writes a chunk
+STREAM_CHUNKS_AHEAD = 2  # chunks an ASGI worker reads ahead of a slow client
+MESSAGE_RETENTION_DAYS = 365  # messages older than this are expired by manage_partitions, at least DEFAULT_DATE_RANGE
+MESSAGE_PARTITIONS_AHEAD = 3  # monthly partitions manage_partitions keeps created ahead of the current month
+METRICS_SERVER_TIMING = True  # send the Server-Timing header on every response
+METRICS_SLOW_QUERY_MS = 0  # log queries slower than this many milliseconds, 0 disables
+RESPONSE_CACHE_BACKEND = 'chatApplication.caches.response_cache.LocalResponseCache'  # or DjangoResponseCache
+RESPONSE_CACHE_CACHE = 'default'  # django cache used by DjangoResponseCache
+RESPONSE_CACHE_SIZE = 10000  # rendered pages kept by LocalResponseCache
+RESPONSE_CACHE_TTL = 60  # seconds
+VERSION_STORE_BACKEND = None  # one every process shares, e.g. DjangoCacheVersionStore; None tags pages by content
+VERSION_STORE_CACHE = 'default'  # django cache used by DjangoCacheVersionStore
+REPLICA_PIN_SECONDS = 5  # a client that wrote reads from the primary this long, longer than replication lag
+REPLICA_PIN_COOKIE = 'pin_primary'
+REPLICA_EJECT_SECONDS = 30  # a failed replica gets no reads this long
+DB_HEALTH_CHECK_SECONDS = 10  # kept connections are pinged before reuse at most this often
+SEND_RATE_PER_SENDER = 20  # messages per second a sender may keep sending, 0 disables the limit
+SEND_BURST_PER_SENDER = 100  # messages a sender may send at once after being idle
+SEND_RATE_PER_CLIENT = 200  # messages per second per client address, 0 disables the limit
+SEND_BURST_PER_CLIENT = 1000
+ADMISSION_TABLE_SIZE = 100000  # token buckets kept per table, idle ones are evicted first
+SHED_QUEUE_DELAY_MS = 250  # shed sends while queue delay stays above this for an interval, 0 disables shedding
+SHED_INTERVAL_MS = 1000
+SHARD_SCATTER_POOL_SIZE = 8  # threads per worker querying shards in parallel, 0 queries them one after the other
+MESSAGE_ID_SEQUENCE_TABLE_SIZE = 16384  # milliseconds whose sequence numbers the message id generator remembers
+STATS_TOP_LIMIT = 10  # users a /stats/top/ query returns by default, at most DEFAULT_MAX_DATA_PER_PAGE
+MAX_GROUPS_PER_USER = 1000  # groups a user may be a member of, bounds the memberships a feed page reads
+IDEMPOTENCY_WINDOW_SECONDS = 24 * 60 * 60  # a repeated Idempotency-Key gets the original response back this long
+IDEMPOTENCY_CACHE_SIZE = 10000  # responses kept in process, older ones are read back from the database
+IDEMPOTENCY_CLAIM_TIMEOUT = 60  # seconds after which the key of a request that never finished can be claimed again
+IDEMPOTENCY_KEY_MAX_LENGTH = 128
+REQUEST_START_TRUSTED = False  # read queue delay from X-Request-Start, only behind a proxy that always sets it
+REQUEST_START_MAX_DELAY_MS = 5000  # longer X-Request-Start delays are capped
@@ -1,6 +1,7 @@
 class APIError(Exception):
 
-    def __init__(self, message, status=400):
+    def __init__(self, message, status=400, headers=None):
         self.message = message
         self.status = status
+        self.headers = headers or {}  # set on the error response, e.g. Retry-After
         super().__init__(self.message)
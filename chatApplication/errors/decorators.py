@@ -1,3 +1,4 @@
+import asyncio
 import functools
 
 from django.http import JsonResponse
@@ -5,12 +6,29 @@ from django.http import JsonResponse
 from chatApplication.errors.api_errors import APIError
 
 
+def error_response(error: APIError) -> JsonResponse:
+    response = JsonResponse(dict(error=error.message), status=error.status)
+    for header, value in error.headers.items():
+        response[header] = value
+    return response
+
+
 def api_exception_handler(func):
+    if asyncio.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_inner(*args, **kwargs):
+            try:
+                return await func(*args, **kwargs)
+            except APIError as e:
+                return error_response(e)
+
+        return async_inner
+
     @functools.wraps(func)
     def inner(*args, **kwargs):
         try:
             return func(*args, **kwargs)
         except APIError as e:
-            return JsonResponse(dict(error=e.message), status=e.status)
+            return error_response(e)
 
     return inner
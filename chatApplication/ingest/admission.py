@@ -0,0 +1,193 @@
+"""
+Admission control for the write path.
+Every sender and every client address gets a token bucket (SEND_RATE_PER_* tokens per second, holding up to
+SEND_BURST_PER_*); a send costs one token per message and is refused with 429 and Retry-After when a bucket runs dry.
+Independently, sends are shed with 503 while the process is overloaded: when even the shortest queue delay seen
+during a SHED_INTERVAL_MS window exceeded SHED_QUEUE_DELAY_MS (the CoDel criterion, a standing queue rather
+than a burst). Queue delays come from the async database executor, the write buffer and, behind a trusted proxy,
+the X-Request-Start header it adds
+"""
+import math
+import threading
+import time
+from typing import Dict, Optional
+
+from django.conf import settings
+
+from chatApplication.caches.lru_cache import LRUCache
+from chatApplication.errors.api_errors import APIError
+
+RATE_LIMITED_ERROR = 'Too many messages, retry later'
+OVERLOADED_ERROR = 'Server is overloaded, retry later'
+
+
+class TokenBuckets:
+    """
+    Token buckets by key in a fixed size table. A request costing more than a full bucket (a large batch) is admitted
+    once the bucket is full and charged in full, leaving the bucket in debt: the sender then waits as long as if its
+    messages had been sent one by one. An idle bucket refills completely within (burst + MAX_BATCH_SIZE) / rate
+    seconds, so entries expire then (a missing bucket is a full one) and the least recently used are evicted first
+    """
+
+    def __init__(self, rate: float, burst: float, max_size: int, name: str = ''):
+        self.rate = rate
+        self.burst = burst
+        self.table = LRUCache(max_size=max_size, ttl=(burst + settings.MAX_BATCH_SIZE) / rate if rate else 0,
+                              name=name)
+        self._lock = threading.Lock()
+
+    def _tokens(self, key, now: float) -> float:
+        tokens, updated = self.table.get(key, (self.burst, now))
+        return min(self.burst, tokens + (now - updated) * self.rate)
+
+    def wait(self, key, cost: float = 1, now: Optional[float] = None) -> float:
+        """
+        :return: 0 when the bucket holds cost tokens (a full bucket at most), else seconds until it will
+        """
+        if not self.rate:
+            return 0
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            return max(min(cost, self.burst) - self._tokens(key, now), 0) / self.rate
+
+    def take(self, key, cost: float = 1, now: Optional[float] = None) -> float:
+        """
+        Takes cost tokens when the bucket holds them (a full bucket at most)
+        :return: 0 when taken, else seconds until the bucket will hold them
+        """
+        if not self.rate:
+            return 0
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            tokens = self._tokens(key, now)
+            if tokens < min(cost, self.burst):
+                self.table.set(key, (tokens, now))
+                return (min(cost, self.burst) - tokens) / self.rate
+            self.table.set(key, (tokens - cost, now))
+            return 0
+
+
+class QueueDelay:
+    """Shortest queue delay per interval; a standing queue keeps it above target, a burst does not"""
+
+    def __init__(self, target: float, interval: float):
+        self.target = target
+        self.interval = interval
+        self._window_start = None
+        self._window_min = None
+        self._last_min = None  # shortest delay of the last complete window
+        self._last_end = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float, now: Optional[float] = None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            if self._window_start is None:
+                self._window_start, self._window_min = now, seconds
+            elif now - self._window_start >= self.interval:
+                self._last_min, self._last_end = self._window_min, now
+                self._window_start, self._window_min = now, seconds
+            elif self._window_min is None or seconds < self._window_min:
+                self._window_min = seconds
+
+    def overloaded(self, now: Optional[float] = None) -> bool:
+        if not self.target:
+            return False
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            # A verdict is only as good as the window it came from; without traffic the queue drained
+            return self._last_min is not None and self._last_min > self.target and \
+                now - self._last_end < 2 * self.interval
+
+    def last_min(self) -> float:
+        return self._last_min or 0.0
+
+
+class AdmissionControl:
+
+    def __init__(self):
+        self.senders = TokenBuckets(settings.SEND_RATE_PER_SENDER, settings.SEND_BURST_PER_SENDER,
+                                    settings.ADMISSION_TABLE_SIZE, name='admission_senders')
+        self.clients = TokenBuckets(settings.SEND_RATE_PER_CLIENT, settings.SEND_BURST_PER_CLIENT,
+                                    settings.ADMISSION_TABLE_SIZE, name='admission_clients')
+        self.queue_delay = QueueDelay(settings.SHED_QUEUE_DELAY_MS / 1000, settings.SHED_INTERVAL_MS / 1000)
+        self._lock = threading.Lock()
+        self.admitted = 0
+        self.limited_senders = 0
+        self.limited_clients = 0
+        self.shed = 0
+
+    def admit(self, request, costs: Dict[str, int]):
+        """
+        :param costs: sender username -> messages the request sends for them
+        :raises APIError: 503 while overloaded, 429 when the client or a sender is over its limit
+        """
+        observe_request_start(request, self.queue_delay)
+        if self.queue_delay.overloaded():
+            self.shed += 1
+            raise APIError(message=OVERLOADED_ERROR, status=503,
+                           headers={'Retry-After': str(math.ceil(self.queue_delay.interval))})
+
+        # Every bucket is checked before any is charged: a refused request costs nothing
+        client = request.META.get('REMOTE_ADDR')
+        charges = [(self.clients, client, sum(costs.values()) or 1)] if client else []
+        charges += [(self.senders, sender, cost) for sender, cost in costs.items()]
+        with self._lock:
+            for buckets, key, cost in charges:
+                wait = buckets.wait(key, cost)
+                if wait:
+                    if buckets is self.clients:
+                        self.limited_clients += 1
+                    else:
+                        self.limited_senders += 1
+                    raise rate_limited(wait)
+            for buckets, key, cost in charges:
+                buckets.take(key, cost)
+        self.admitted += 1
+
+    def stats(self) -> dict:
+        return dict(admitted=self.admitted, limited_senders=self.limited_senders,
+                    limited_clients=self.limited_clients, shed=self.shed,
+                    queue_delay_seconds=self.queue_delay.last_min())
+
+
+def rate_limited(wait: float) -> APIError:
+    return APIError(message=RATE_LIMITED_ERROR, status=429, headers={'Retry-After': str(math.ceil(wait))})
+
+
+def observe_request_start(request, queue_delay: QueueDelay):
+    """
+    X-Request-Start: t=<epoch microseconds> (or seconds/milliseconds), as set by nginx or a load balancer.
+    Read only with REQUEST_START_TRUSTED, behind a proxy that sets it on every request: a client could otherwise
+    claim an old start and shed every sender. Delays are capped at REQUEST_START_MAX_DELAY_MS, against skewed clocks
+    """
+    if not settings.REQUEST_START_TRUSTED:
+        return
+    header = request.META.get('HTTP_X_REQUEST_START')
+    if not header:
+        return
+    try:
+        started = float(header.split('t=')[-1])
+    except ValueError:
+        return
+    # Scale whatever unit the proxy used to seconds
+    while started > 1e11:
+        started /= 1000
+    queue_delay.observe(min(max(time.time() - started, 0.0), settings.REQUEST_START_MAX_DELAY_MS / 1000))
+
+
+_admission = None
+_admission_lock = threading.Lock()
+
+
+def get_admission_control() -> AdmissionControl:
+    global _admission
+    with _admission_lock:
+        if _admission is None:
+            _admission = AdmissionControl()
+        return _admission
+
+
+def observe_queue_delay(seconds: float):
+    """Reports how long a piece of work waited in a queue before it started"""
+    (_admission or get_admission_control()).queue_delay.observe(seconds)
@@ -0,0 +1,218 @@
+"""
+Idempotent sends. A client retrying a send with the Idempotency-Key header of the original request gets the original
+response back, with an Idempotent-Replayed header, and nothing is sent again. Keys are scoped by the request's
+senders: the same key sent for another sender is another key.
+
+A request claims its key before it runs, by inserting an IdempotencyKey row: the unique scope and key let a single
+request in the whole deployment win the claim, retries racing it get 409 until its response is stored. The response
+is stored by store_response, in the transaction that sends the messages on the default database, so it commits with
+them or not at all: a claim left without a response means nothing was sent, and once IDEMPOTENCY_CLAIM_TIMEOUT has
+passed a retry can take it over and send. A request whose claim was taken over meanwhile is refused at its commit.
+Stored responses are also kept in an in-process LRU, so a retry answered by the same worker costs no query; a
+refused request gives its key back for the retry. Keys count for IDEMPOTENCY_WINDOW_SECONDS, after which they can be
+claimed again. A key reused for a different request (path or body) is refused with 422
+"""
+import hashlib
+import json
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+from typing import Iterable, Optional, Tuple, Union
+
+import pytz
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse
+
+from chatApplication.caches.lru_cache import LRUCache
+from chatApplication.errors.api_errors import APIError
+from chatApplication.models import IdempotencyKey
+
+HEADER = 'HTTP_IDEMPOTENCY_KEY'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+IN_PROGRESS_ERROR = 'A request with this Idempotency-Key is in progress, retry later'
+MISMATCH_ERROR = 'Idempotency-Key was already used for a different request'
+
+Stored = Tuple[str, int, str]  # fingerprint, status, body
+
+
+class Claim:
+    """The key claimed by the running request"""
+
+    def __init__(self, scope: str, key: str, fingerprint: str, claimed_at: datetime):
+        self.scope = scope
+        self.key = key
+        self.fingerprint = fingerprint
+        self.claimed_at = claimed_at
+        self.stored = False  # whether store_response stored the response
+
+
+_claim = ContextVar('idempotency_claim', default=None)
+
+
+def idempotency_key(request) -> Optional[str]:
+    """:return: the request's Idempotency-Key header, None without one"""
+    key = request.META.get(HEADER)
+    if key is None:
+        return None
+    if not key or len(key) > settings.IDEMPOTENCY_KEY_MAX_LENGTH:
+        raise APIError(message=f'Idempotency-Key must be 1 to {settings.IDEMPOTENCY_KEY_MAX_LENGTH} chars')
+    return key
+
+
+def request_fingerprint(request) -> str:
+    return hashlib.sha256(request.path.encode('utf8') + b'\n' + request.body).hexdigest()
+
+
+def key_scope(senders: Iterable[str]) -> str:
+    return hashlib.sha256('\n'.join(sorted(senders)).encode('utf8')).hexdigest()
+
+
+@contextmanager
+def running(claim: Claim):
+    """Runs the request holding claim, for store_response"""
+    token = _claim.set(claim)
+    try:
+        yield
+    finally:
+        _claim.reset(token)
+
+
+def claimed() -> bool:
+    """
+    Whether the running request claimed a key: its messages must then be sent in a transaction of the request's own,
+    the one that stores its response (store_response), not by the write buffer
+    """
+    return _claim.get() is not None
+
+
+def store_response(data: dict):
+    """
+    Stores data as the response of the running request's key, if it claimed one. Called in the transaction that sends
+    the request's messages, so the response commits with them
+    :raises APIError: 409 when a retry took the claim over meanwhile: the transaction must roll back, the retry sends
+    """
+    claim = _claim.get()
+    if claim is None:
+        return
+    body = json.dumps(data, cls=DjangoJSONEncoder)
+    if not IdempotencyKey.objects.filter(scope=claim.scope, key=claim.key, created_at=claim.claimed_at,
+                                         status=None).update(status=200, body=body):
+        raise APIError(message=IN_PROGRESS_ERROR, status=409, headers={'Retry-After': '1'})
+    claim.stored = True
+
+
+class IdempotencyKeys:
+
+    def __init__(self):
+        self.responses = LRUCache(max_size=settings.IDEMPOTENCY_CACHE_SIZE, ttl=settings.IDEMPOTENCY_WINDOW_SECONDS,
+                                  name='idempotency')
+        self.requests = 0  # requests with a key
+        self.replayed_from_cache = 0
+        self.replayed_from_database = 0
+        self.in_progress = 0
+        self.mismatched = 0
+
+    def claim(self, scope: str, key: str, fingerprint: str) -> Union[HttpResponse, Claim]:
+        """
+        :return: the stored response of the key, or the claim when the request claimed it and must run
+        :raises APIError: 409 while another request holds the key, 422 when it was used for a different request
+        """
+        self.requests += 1
+        stored = self.responses.get((scope, key))
+        if stored is not None:
+            self.replayed_from_cache += 1
+            return self.replay(stored, fingerprint)
+
+        now = datetime.now(pytz.UTC)
+        try:
+            with transaction.atomic():
+                IdempotencyKey.objects.create(scope=scope, key=key, fingerprint=fingerprint, created_at=now)
+            return Claim(scope, key, fingerprint, now)
+        except IntegrityError:
+            pass
+        try:
+            row = IdempotencyKey.objects.get(scope=scope, key=key)
+        except IdempotencyKey.DoesNotExist:
+            # Given back by a refused request meanwhile
+            self.in_progress += 1
+            raise APIError(message=IN_PROGRESS_ERROR, status=409, headers={'Retry-After': '1'})
+
+        expired = row.created_at < now - timedelta(seconds=settings.IDEMPOTENCY_WINDOW_SECONDS)
+        # Nothing was sent: the response commits with the messages
+        abandoned = row.status is None and \
+            row.created_at < now - timedelta(seconds=settings.IDEMPOTENCY_CLAIM_TIMEOUT)
+        if expired or abandoned:
+            # The conditional update lets one of the requests racing for the key take it, and loses to the
+            # abandoned request should it store its response meanwhile
+            if IdempotencyKey.objects.filter(scope=scope, key=key, created_at=row.created_at, status=row.status).update(
+                    fingerprint=fingerprint, created_at=now, status=None, body=None):
+                return Claim(scope, key, fingerprint, now)
+            self.in_progress += 1
+            raise APIError(message=IN_PROGRESS_ERROR, status=409, headers={'Retry-After': '1'})
+        if row.status is None:
+            self.in_progress += 1
+            raise APIError(message=IN_PROGRESS_ERROR, status=409, headers={'Retry-After': '1'})
+
+        stored = (row.fingerprint, row.status, row.body)
+        self.responses.set((scope, key), stored)
+        self.replayed_from_database += 1
+        return self.replay(stored, fingerprint)
+
+    def replay(self, stored: Stored, fingerprint: str) -> HttpResponse:
+        stored_fingerprint, status, body = stored
+        if stored_fingerprint != fingerprint:
+            self.mismatched += 1
+            raise APIError(message=MISMATCH_ERROR, status=422)
+        response = HttpResponse(body, status=status, content_type='application/json')
+        response[REPLAYED_HEADER] = 'true'
+        return response
+
+    def finish(self, claim: Claim, status: int, body: bytes = b''):
+        """
+        Keeps a successful response for the retries, storing it unless store_response did: a request that stored
+        none sent nothing. A refused request (4xx) sent nothing and gives its key back. After a server error the key
+        stays claimed until IDEMPOTENCY_CLAIM_TIMEOUT
+        """
+        rows = IdempotencyKey.objects.filter(scope=claim.scope, key=claim.key, created_at=claim.claimed_at)
+        if 400 <= status < 500:
+            rows.filter(status=None).delete()
+        elif 200 <= status < 300:
+            body = body.decode('utf8')
+            if not claim.stored:
+                rows.filter(status=None).update(status=status, body=body)
+            self.responses.set((claim.scope, claim.key), (claim.fingerprint, status, body))
+
+    def stats(self) -> dict:
+        replayed = self.replayed_from_cache + self.replayed_from_database
+        return dict(requests=self.requests, replayed_from_cache=self.replayed_from_cache,
+                    replayed_from_database=self.replayed_from_database, in_progress=self.in_progress,
+                    mismatched=self.mismatched, hit_ratio=replayed / self.requests if self.requests else 0.0)
+
+
+def expire_keys(batch_size: int) -> int:
+    """
+    Deletes the keys older than the window, batch_size rows per transaction
+    :return: keys deleted
+    """
+    before = datetime.now(pytz.UTC) - timedelta(seconds=settings.IDEMPOTENCY_WINDOW_SECONDS)
+    deleted = 0
+    while True:
+        ids = list(IdempotencyKey.objects.filter(created_at__lt=before).values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        deleted += IdempotencyKey.objects.filter(id__in=ids).delete()[0]
+
+
+_idempotency_keys = None
+_idempotency_keys_lock = threading.Lock()
+
+
+def get_idempotency_keys() -> IdempotencyKeys:
+    global _idempotency_keys
+    with _idempotency_keys_lock:
+        if _idempotency_keys is None:
+            _idempotency_keys = IdempotencyKeys()
+        return _idempotency_keys
@@ -0,0 +1,141 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime
+from typing import Callable, List, Tuple
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from chatApplication.ingest.admission import observe_queue_delay
+from chatApplication.models import MessageRecord
+from chatApplication.models.Users import User
+from chatApplication.signals import messages_sent
+from chatApplication.storage import shards
+
+Item = Tuple[str, str, str, datetime]  # sender username, receiver username, message, date sent
+
+
+class WriteBuffer:
+    """
+    Group commit: submitted items are queued and a background flusher hands them to flush in batches of up to
+    max_batch items, or whatever arrived within max_delay seconds of the first one, whichever comes first.
+    Every submitter gets a Future resolved with its flush result once the batch has committed
+    (or with the exception that failed the whole batch)
+    """
+
+    def __init__(self, flush: Callable[[List], List], max_batch: int, max_delay: float, name: str = 'write-buffer'):
+        self.flush = flush
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.name = name
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.flushes = 0
+        self.flushed_items = 0
+        self.failed_flushes = 0
+        self.last_batch_size = 0
+        self.max_batch_size = 0
+        self.flush_seconds_total = 0.0
+        self.last_flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+
+    def submit(self, item) -> Future:
+        future = Future()
+        self._queue.put((item, future, time.monotonic()))
+        self._ensure_started()
+        return future
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def stats(self) -> dict:
+        return dict(flushes=self.flushes, flushed_items=self.flushed_items, failed_flushes=self.failed_flushes,
+                    last_batch_size=self.last_batch_size, max_batch_size=self.max_batch_size,
+                    flush_seconds_total=self.flush_seconds_total, last_flush_seconds=self.last_flush_seconds,
+                    max_flush_seconds=self.max_flush_seconds, queue_depth=self.queue_depth())
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+
+    def _next_batch(self) -> list:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            started = time.monotonic()
+            # The newest item waited least, the shortest queue delay is what admission control watches
+            observe_queue_delay(started - batch[-1][2])
+            try:
+                results = self.flush([item for item, _, _ in batch])
+            except Exception as e:
+                logging.exception(f'{self.name}: flush of {len(batch)} items failed')
+                self.failed_flushes += 1
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            elapsed = time.monotonic() - started
+
+            self.flushes += 1
+            self.flushed_items += len(batch)
+            self.last_batch_size = len(batch)
+            self.max_batch_size = max(self.max_batch_size, len(batch))
+            self.flush_seconds_total += elapsed
+            self.last_flush_seconds = elapsed
+            self.max_flush_seconds = max(self.max_flush_seconds, elapsed)
+            for (_, future, _), result in zip(batch, results):
+                future.set_result(result)
+
+
+def flush_messages(items: List[Item]) -> list:
+    """
+    Writes a batch of messages in one transaction: bulk user resolution, one INSERT and one commit (per message shard)
+    :return: the saved MessageRecords, in item order
+    """
+    # The flusher thread outlives requests, so it retires stale connections like the request cycle would
+    close_old_connections()
+    try:
+        with shards.atomic(*shards.shards_for(items)):
+            users = User.objects.bulk_get_or_create(username for sender_username, receiver_username, _, _ in items
+                                                    for username in (sender_username, receiver_username))
+            records = shards.bulk_send([MessageRecord(sender=users[sender_username],
+                                                      receiver=users[receiver_username],
+                                                      message=message,
+                                                      date_sent=date_sent)
+                                        for sender_username, receiver_username, message, date_sent in items])
+            messages_sent.send(sender=MessageRecord, records=records)
+        return records
+    finally:
+        close_old_connections()
+
+
+_write_buffer = None
+_write_buffer_lock = threading.Lock()
+
+
+def get_write_buffer() -> WriteBuffer:
+    global _write_buffer
+    with _write_buffer_lock:
+        if _write_buffer is None:
+            _write_buffer = WriteBuffer(flush_messages,
+                                        max_batch=settings.MESSAGE_WRITE_BUFFER_MAX_BATCH,
+                                        max_delay=settings.MESSAGE_WRITE_BUFFER_MAX_DELAY_MS / 1000,
+                                        name='message-write-buffer')
+        return _write_buffer
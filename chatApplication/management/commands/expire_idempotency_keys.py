@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from chatApplication.ingest import idempotency
+
+
+class Command(BaseCommand):
+    help = ('Deletes the Idempotency-Key claims older than IDEMPOTENCY_WINDOW_SECONDS '
+            '(see chatApplication.ingest.idempotency). Meant to run daily from cron')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000, help='keys deleted per transaction')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+        self.stdout.write(f'expired {idempotency.expire_keys(options["batch_size"])} keys')
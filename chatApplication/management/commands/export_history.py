@@ -0,0 +1,38 @@
+from datetime import datetime
+
+import pytz
+from django.core.management.base import BaseCommand, CommandError
+
+from chatApplication.storage import transfer
+
+
+def parse_date(value: str) -> datetime:
+    date = datetime.fromisoformat(value)
+    return date if date.tzinfo else pytz.UTC.localize(date)
+
+
+class Command(BaseCommand):
+    help = ('Streams users or messages to an NDJSON or CSV file, gzip compressed when its name ends in .gz '
+            '(see chatApplication.storage.transfer). Memory use does not depend on the number of rows')
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=tuple(transfer.FIELDS))
+        parser.add_argument('output', help="file to write, - for stdout")
+        parser.add_argument('--format', choices=transfer.FORMATS,
+                            help='default: csv for *.csv and *.csv.gz, else ndjson')
+        parser.add_argument('--start', type=parse_date, help='messages sent at or after this ISO 8601 date')
+        parser.add_argument('--end', type=parse_date, help='messages sent before this ISO 8601 date')
+        parser.add_argument('--user', help='only this user, or the messages they sent or received')
+
+    def handle(self, *args, **options):
+        if options['kind'] == 'users' and (options['start'] or options['end']):
+            raise CommandError('--start and --end only apply to messages')
+        output = options['output']
+        # Progress goes to stderr when the export goes to stdout
+        report = self.stderr if output == '-' else self.stdout
+        throughput = transfer.Throughput(report.write, 'exported')
+        rows = transfer.export_rows(options['kind'], options['start'], options['end'], options['user'])
+        with transfer.open_output(output) as out:
+            count = transfer.write_rows(rows, out, transfer.FIELDS[options['kind']],
+                                        transfer.file_format(output, options['format']), progress=throughput.update)
+        throughput.done(count)
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from chatApplication.storage import transfer
+
+
+class Command(BaseCommand):
+    help = ('Imports users or messages from a file written by export_history (NDJSON or CSV, optionally gzip '
+            'compressed), a batch per transaction: COPY on postgres, bulk inserts elsewhere. '
+            'With --checkpoint, an interrupted import run again resumes after the last committed batch')
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=tuple(transfer.FIELDS))
+        parser.add_argument('input', help='file to read, - for stdin')
+        parser.add_argument('--format', choices=transfer.FORMATS,
+                            help='default: csv for *.csv and *.csv.gz, else ndjson')
+        parser.add_argument('--batch-size', type=int, default=5000, help='rows per transaction')
+        parser.add_argument('--checkpoint', help='file recording the rows imported so far')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+        source = options['input']
+        checkpoint = transfer.Checkpoint(options['checkpoint'], source) if options['checkpoint'] else None
+        try:
+            skip = checkpoint.load() if checkpoint else 0
+        except ValueError as e:
+            raise CommandError(str(e))
+        if skip:
+            self.stdout.write(f'resuming after row {skip}')
+        throughput = transfer.Throughput(self.stdout.write, 'imported', skipped=skip)
+
+        def committed(rows: int):
+            if checkpoint:
+                checkpoint.save(rows)
+            throughput.update(rows)
+
+        with transfer.open_input(source) as file:
+            rows = transfer.read_rows(file, transfer.file_format(source, options['format']))
+            try:
+                count = transfer.import_rows(options['kind'], rows, options['batch_size'], skip, committed)
+            except ValueError as e:
+                raise CommandError(str(e))
+        throughput.done(count)
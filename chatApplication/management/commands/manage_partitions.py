@@ -0,0 +1,47 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from chatApplication.storage import partitions
+
+
+class Command(BaseCommand):
+    help = ('Creates MessageRecord partitions for the coming months and takes months past the retention period '
+            'out of the live table (see chatApplication.storage.partitions). Meant to run daily from cron')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ahead', type=int, default=settings.MESSAGE_PARTITIONS_AHEAD,
+                            help='months of partitions to keep created ahead of the current one')
+        parser.add_argument('--retention-days', type=int, default=settings.MESSAGE_RETENTION_DAYS,
+                            help='messages older than this many days are expired, one whole month at a time')
+        parser.add_argument('--drop', action='store_true',
+                            help='drop expired months instead of keeping them in archive tables')
+        parser.add_argument('--dry-run', action='store_true', help='only list what would be done')
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        if options['ahead'] < 0:
+            raise CommandError('--ahead must not be negative')
+        if options['retention_days'] < settings.DEFAULT_DATE_RANGE:
+            raise CommandError(f'--retention-days must be at least DEFAULT_DATE_RANGE '
+                               f'({settings.DEFAULT_DATE_RANGE}) or default range reads would miss messages')
+        connection = connections[options['database']]
+        archive, dry_run = not options['drop'], options['dry_run']
+
+        if not partitions.is_partitioned(connection):
+            self.stdout.write(f'{connection.vendor}: {partitions.TABLE} is not partitioned, '
+                              f'expired months are moved to archive tables')
+        elif dry_run:
+            self.stdout.write(f'would ensure partitions through {options["ahead"]} months ahead')
+        else:
+            for name in partitions.ensure_partitions(connection, options['ahead']):
+                self.stdout.write(f'created {name}')
+
+        for start, end in partitions.expired_buckets(connection, options['retention_days']):
+            action = 'archive' if archive else 'drop'
+            name = partitions.partition_name(start)
+            if dry_run:
+                self.stdout.write(f'would {action} {name}')
+                continue
+            rows = partitions.expire_bucket(connection, start, end, archive)
+            self.stdout.write(f'{action}{"d" if archive else "ped"} {name}' + (f' ({rows} messages)' if rows >= 0 else ''))
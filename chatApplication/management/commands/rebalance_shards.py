@@ -0,0 +1,42 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+
+from chatApplication.models import MessageRecord
+from chatApplication.storage import shards
+
+
+class Command(BaseCommand):
+    help = ('Moves every conversation stored on a shard other than the one settings.MESSAGE_SHARDS now assigns it '
+            '(see chatApplication.storage.shards), e.g. after shards were appended. Safe to interrupt and rerun')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shard', action='append', dest='shards',
+                            help='only move conversations off this shard, may be repeated (default: every shard)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='messages moved per transaction')
+        parser.add_argument('--dry-run', action='store_true', help='only list what would be moved')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+        sources = options['shards'] or settings.MESSAGE_SHARDS
+        unknown = set(sources) - set(settings.MESSAGE_SHARDS)
+        if unknown:
+            raise CommandError(f'not in MESSAGE_SHARDS: {", ".join(sorted(unknown))}')
+
+        conversations = messages = 0
+        for source in sources:
+            for conversation_id, sender_username, receiver_username, target in shards.misplaced_conversations(
+                    source, options['batch_size']):
+                name = f'{sender_username} -> {receiver_username}'
+                if options['dry_run']:
+                    count = MessageRecord.objects.using(source).filter(conversation_id=conversation_id).aggregate(
+                        count=Count('id'))['count']
+                    self.stdout.write(f'would move {name} ({count} messages) from {source} to {target}')
+                else:
+                    count = shards.move_conversation(conversation_id, source, target, options['batch_size'])
+                    self.stdout.write(f'moved {name} ({count} messages) from {source} to {target}')
+                conversations += 1
+                messages += count
+        self.stdout.write(f'{"would move" if options["dry_run"] else "moved"} {conversations} conversations, '
+                          f'{messages} messages')
@@ -0,0 +1,30 @@
+from datetime import datetime
+
+import pytz
+from django.core.management.base import BaseCommand, CommandError
+
+from chatApplication.storage import volumes
+
+
+def parse_date(value: str) -> datetime:
+    date = datetime.fromisoformat(value)
+    return date if date.tzinfo else pytz.UTC.localize(date)
+
+
+class Command(BaseCommand):
+    help = ('Recounts the hourly and daily message volume rollups from the stored messages, one day at a time '
+            '(see chatApplication.storage.volumes). Days before the oldest stored message keep their rollups')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', type=parse_date, help='first day to rebuild, the oldest message\'s by default')
+        parser.add_argument('--end', type=parse_date, help='last day to rebuild, today by default')
+
+    def handle(self, *args, **options):
+        if options['start'] and options['end'] and options['start'] > options['end']:
+            raise CommandError('--start must not be after --end')
+        days = messages = 0
+        for day, counted in volumes.rebuild(options['start'], options['end']):
+            days, messages = days + 1, messages + counted
+            if options['verbosity'] > 1:
+                self.stdout.write(f'{day.date()}: {counted} messages')
+        self.stdout.write(f'rebuilt {days} days, {messages} messages')
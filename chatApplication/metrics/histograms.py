@@ -0,0 +1,86 @@
+import threading
+from bisect import bisect_left
+from typing import Dict, List, Sequence, Tuple
+
+LATENCY_BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (128, 512, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+class Histogram:
+    """
+    Cumulative histogram without locks on the hot path: every thread observes into its own shard,
+    only ever written by that thread, and readers sum the shards.
+    A read racing with observations may miss the latest ones, never corrupts them
+    """
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        self._local = threading.local()
+        self._shards = []  # [bucket counts..., +Inf count, sum] per thread
+        self._shards_lock = threading.Lock()
+
+    def observe(self, value: float):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = [0] * (len(self.buckets) + 2)
+            with self._shards_lock:  # once per thread
+                self._shards.append(shard)
+        shard[bisect_left(self.buckets, value)] += 1
+        shard[-1] += value
+
+    def snapshot(self) -> Tuple[List[int], float]:
+        """
+        :return: cumulative count per bucket (the last one being +Inf), sum of the observed values
+        """
+        with self._shards_lock:
+            shards = list(self._shards)
+        counts = [0] * (len(self.buckets) + 1)
+        total = 0.0
+        for shard in shards:
+            for index in range(len(counts)):
+                counts[index] += shard[index]
+            total += shard[-1]
+        for index in range(1, len(counts)):
+            counts[index] += counts[index - 1]
+        return counts, total
+
+
+class HistogramFamily:
+    """A named histogram with one child per label values combination"""
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str], buckets: Sequence[float]):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._children: Dict[tuple, Histogram] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *label_values) -> Histogram:
+        child = self._children.get(label_values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(label_values, Histogram(self.buckets))
+        return child
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        for label_values, child in sorted(self._children.items()):
+            labels = format_labels(zip(self.label_names, label_values))
+            counts, total = child.snapshot()
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                bucket_labels = format_labels([*zip(self.label_names, label_values), ('le', bound)])
+                lines.append(f'{self.name}_bucket{bucket_labels} {count}')
+            lines.append(f'{self.name}_sum{labels} {total}')
+            lines.append(f'{self.name}_count{labels} {counts[-1]}')
+        return lines
+
+
+def format_labels(labels) -> str:
+    labels = [f'{name}="{escape_label(value)}"' for name, value in labels]
+    return '{' + ','.join(labels) + '}' if labels else ''
+
+
+def escape_label(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
@@ -0,0 +1,66 @@
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger(__name__)
+
+
+class RequestMetrics:
+    """What one request spent, filled in by whichever threads do its work"""
+    __slots__ = ('started', 'queries', 'db_seconds', 'serialization_seconds')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.serialization_seconds = 0.0
+
+
+# Set by InstrumentationMiddleware for the duration of a request. Context variables follow the request into
+# sync_to_async and run_in_db_executor threads, and the object is shared, so their work is counted too
+request_metrics: ContextVar[Optional[RequestMetrics]] = ContextVar('request_metrics', default=None)
+
+
+def instrument_query(execute, sql, params, many, context):
+    """connection.execute_wrapper timing every query, charged to the current request if any"""
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        metrics = request_metrics.get()
+        if metrics is not None:
+            metrics.queries += 1
+            metrics.db_seconds += elapsed
+        if settings.METRICS_SLOW_QUERY_MS and elapsed * 1000 >= settings.METRICS_SLOW_QUERY_MS:
+            logger.warning(f'Slow query ({elapsed * 1000:.1f}ms): {sql}')
+
+
+def install_on(sender=None, connection=None, **kwargs):
+    # connection_created fires on every reconnect of the same connection wrapper
+    if instrument_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(instrument_query)
+
+
+def install_query_instrumentation():
+    """Instruments this thread's open connections now and every connection opened from now on"""
+    connection_created.connect(install_on, dispatch_uid='chatApplication.metrics.install_on')
+    for connection in connections.all():
+        install_on(connection=connection)
+
+
+@contextmanager
+def serialization_timer():
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics = request_metrics.get()
+        if metrics is not None:
+            metrics.serialization_seconds += time.perf_counter() - started
@@ -0,0 +1,98 @@
+import asyncio
+import time
+from typing import Iterator
+
+from django.conf import settings
+from django.http import HttpResponse
+
+from chatApplication.metrics.histograms import HistogramFamily, LATENCY_BUCKETS, COUNT_BUCKETS, SIZE_BUCKETS
+from chatApplication.metrics.instrumentation import RequestMetrics, request_metrics, install_query_instrumentation
+
+REQUEST_SECONDS = HistogramFamily('chat_request_duration_seconds', 'Wall time until the response is returned',
+                                  ('view', 'method', 'status'), LATENCY_BUCKETS)
+DB_QUERIES = HistogramFamily('chat_request_db_queries', 'Database queries per request', ('view',), COUNT_BUCKETS)
+DB_SECONDS = HistogramFamily('chat_request_db_duration_seconds', 'Time spent in database queries per request',
+                             ('view',), LATENCY_BUCKETS)
+SERIALIZATION_SECONDS = HistogramFamily('chat_request_serialization_seconds', 'Time spent encoding the response',
+                                        ('view',), LATENCY_BUCKETS)
+RESPONSE_BYTES = HistogramFamily('chat_response_size_bytes', 'Response body size', ('view',), SIZE_BUCKETS)
+
+HISTOGRAMS = (REQUEST_SECONDS, DB_QUERIES, DB_SECONDS, SERIALIZATION_SECONDS, RESPONSE_BYTES)
+
+
+class InstrumentationMiddleware:
+    """
+    Records per URL name the wall time, database query count and time, serialization time and response size
+    of every request into in-process histograms (served by /metrics/), and reports them to the client in a
+    Server-Timing header. Meant to stay on in production: a request costs a few clock reads and counter increments
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self._async = asyncio.iscoroutinefunction(get_response)
+        if self._async:
+            # Marks the instance as a coroutine function for the handler, like django's MiddlewareMixin
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+        self._histograms = {}  # (view, method, status) -> the histograms to observe
+        install_query_instrumentation()
+
+    def __call__(self, request):
+        if self._async:
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = request_metrics.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            request_metrics.reset(token)
+        return self.record(request, response, metrics)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = request_metrics.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            request_metrics.reset(token)
+        return self.record(request, response, metrics)
+
+    def histograms(self, request, response: HttpResponse) -> tuple:
+        match = request.resolver_match
+        view = (match.url_name or match.route) if match is not None else 'unmatched'
+        key = (view, request.method, response.status_code)
+        histograms = self._histograms.get(key)
+        if histograms is None:
+            histograms = self._histograms[key] = (
+                REQUEST_SECONDS.labels(view, request.method, str(response.status_code)), DB_QUERIES.labels(view),
+                DB_SECONDS.labels(view), SERIALIZATION_SECONDS.labels(view), RESPONSE_BYTES.labels(view))
+        return histograms
+
+    def record(self, request, response: HttpResponse, metrics: RequestMetrics) -> HttpResponse:
+        elapsed = time.perf_counter() - metrics.started
+        request_seconds, db_queries, db_seconds, serialization_seconds, response_bytes = \
+            self.histograms(request, response)
+        request_seconds.observe(elapsed)
+        db_queries.observe(metrics.queries)
+        db_seconds.observe(metrics.db_seconds)
+        serialization_seconds.observe(metrics.serialization_seconds)
+        if response.streaming:
+            response.streaming_content = observe_size(response.streaming_content, response_bytes)
+        else:
+            response_bytes.observe(len(response.content))
+
+        if settings.METRICS_SERVER_TIMING:
+            response['Server-Timing'] = (f'db;dur={metrics.db_seconds * 1000:.2f};desc="{metrics.queries} queries", '
+                                         f'ser;dur={metrics.serialization_seconds * 1000:.2f}, '
+                                         f'total;dur={elapsed * 1000:.2f}')
+        return response
+
+
+def observe_size(chunks: Iterator[bytes], histogram) -> Iterator[bytes]:
+    """Streamed responses are only measured once fully sent"""
+    size = 0
+    for chunk in chunks:
+        size += len(chunk)
+        yield chunk
+    histogram.observe(size)
@@ -0,0 +1,53 @@
+from typing import List
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.views.decorators.http import require_GET
+
+from chatApplication.caches.lru_cache import cache_stats
+from chatApplication.ingest.admission import get_admission_control
+from chatApplication.ingest.idempotency import get_idempotency_keys
+from chatApplication.ingest.write_buffer import get_write_buffer
+from chatApplication.metrics.histograms import format_labels
+from chatApplication.metrics.middleware import HISTOGRAMS
+from chatApplication.realtime.hub import get_hub
+from chatApplication.realtime.waiters import waiters
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+@require_GET
+def metrics(request):
+    """
+    Request histograms and the stats of the in-process components, in Prometheus text format.
+    Every worker process keeps its own numbers; scrape each of them
+    """
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines += histogram.render()
+    lines += component_lines()
+    return HttpResponse('\n'.join(lines) + '\n', content_type=PROMETHEUS_CONTENT_TYPE)
+
+
+def component_lines() -> List[str]:
+    samples = {}  # metric name -> [(labels, value)]
+    for name, stats in cache_stats().items():
+        for stat, value in stats.items():
+            samples.setdefault(f'chat_cache_{stat}', []).append(([('cache', name)], value))
+    for stat, value in get_hub().stats().items():
+        samples.setdefault(f'chat_push_{stat}', []).append(([], value))
+    samples['chat_sync_waiting'] = [([], waiters.waiting())]
+    samples['chat_sync_wakeups'] = [([], waiters.wakeups)]
+    for stat, value in get_admission_control().stats().items():
+        samples.setdefault(f'chat_admission_{stat}', []).append(([], value))
+    for stat, value in get_idempotency_keys().stats().items():
+        samples.setdefault(f'chat_idempotency_{stat}', []).append(([], value))
+    if settings.MESSAGE_WRITE_BUFFER:
+        for stat, value in get_write_buffer().stats().items():
+            samples.setdefault(f'chat_write_buffer_{stat}', []).append(([], value))
+
+    lines = []
+    for name, values in samples.items():
+        lines.append(f'# TYPE {name} untyped')
+        lines += [f'{name}{format_labels(labels)} {value}' for labels, value in values]
+    return lines
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.11 on 2026-10-18 17:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatApplication', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='messagerecord',
+            index=models.Index(fields=['-date_sent', '-id'], name='message_date_sent_id_idx'),
+        ),
+    ]
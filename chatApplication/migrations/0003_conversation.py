@@ -0,0 +1,54 @@
+# Generated by Django 3.2.11 on 2026-10-18 17:34
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_conversations(apps, schema_editor):
+    """
+    One Conversation per distinct (sender, receiver) pair already in MessageRecord,
+    then point every existing message at its conversation
+    """
+    db_alias = schema_editor.connection.alias
+    User = apps.get_model('chatApplication', 'User')
+    Conversation = apps.get_model('chatApplication', 'Conversation')
+    MessageRecord = apps.get_model('chatApplication', 'MessageRecord')
+
+    # sender_id/receiver_id hold usernames (to_field='username')
+    pairs = MessageRecord.objects.using(db_alias).values_list('sender_id', 'receiver_id').distinct()
+    for sender_username, receiver_username in pairs.iterator():
+        conversation, _ = Conversation.objects.using(db_alias).get_or_create(
+            sender=User.objects.using(db_alias).get(username=sender_username),
+            receiver=User.objects.using(db_alias).get(username=receiver_username),
+        )
+        MessageRecord.objects.using(db_alias).filter(
+            sender_id=sender_username, receiver_id=receiver_username, conversation__isnull=True
+        ).update(conversation=conversation)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatApplication', '0002_message_date_sent_id_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Conversation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('receiver', models.ForeignKey(on_delete=django.db.models.deletion.RESTRICT, related_name='received_conversations', to='chatApplication.user')),
+                ('sender', models.ForeignKey(on_delete=django.db.models.deletion.RESTRICT, related_name='sent_conversations', to='chatApplication.user')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='conversation',
+            constraint=models.UniqueConstraint(fields=('sender', 'receiver'), name='unique_conversation'),
+        ),
+        migrations.AddField(
+            model_name='messagerecord',
+            name='conversation',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.RESTRICT, related_name='messages', to='chatApplication.conversation'),
+        ),
+        migrations.RunPython(backfill_conversations, migrations.RunPython.noop),
+    ]
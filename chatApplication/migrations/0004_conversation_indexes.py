@@ -0,0 +1,31 @@
+# Generated by Django 3.2.11 on 2026-10-18 17:34
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    """
+    Kept apart from 0003 so the backfill is committed before the column is altered
+    (postgres refuses ALTER TABLE with pending deferred FK trigger events)
+    """
+
+    dependencies = [
+        ('chatApplication', '0003_conversation'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='messagerecord',
+            name='conversation',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.RESTRICT, related_name='messages', to='chatApplication.conversation'),
+        ),
+        migrations.AddIndex(
+            model_name='messagerecord',
+            index=models.Index(fields=['conversation', '-date_sent', '-id'], name='message_conversation_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='messagerecord',
+            index=models.Index(fields=['receiver', '-date_sent'], name='message_receiver_date_idx'),
+        ),
+    ]
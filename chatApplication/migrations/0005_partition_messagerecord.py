@@ -0,0 +1,70 @@
+from datetime import datetime
+
+from django.db import migrations
+
+TABLE = 'chatApplication_messagerecord'
+OLD_TABLE = f'{TABLE}_unpartitioned'
+PARTITIONS_AHEAD = 3
+
+
+def month_index(moment: datetime) -> int:
+    return moment.year * 12 + moment.month - 1
+
+
+def partition_by_month(apps, schema_editor):
+    """
+    postgres only: rebuilds MessageRecord as a table range-partitioned by month on date_sent.
+    The primary key becomes (id, date_sent) since a partitioned table's unique constraints must include
+    the partition key; ids still come from the same sequence, so they stay unique on their own.
+    Secondary indexes and foreign keys are recreated on the parent (and so on every partition) as they were
+    """
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql':
+        return
+    qn = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT indexdef FROM pg_indexes WHERE tablename = %s AND indexname <> %s',
+                       [TABLE, f'{TABLE}_pkey'])
+        index_definitions = [row[0] for row in cursor.fetchall()]
+        cursor.execute("SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+                       "WHERE conrelid = %s::regclass AND contype = 'f'", [qn(TABLE)])
+        foreign_keys = cursor.fetchall()
+        cursor.execute('SELECT pg_get_serial_sequence(%s, %s)', [qn(TABLE), 'id'])
+        sequence = cursor.fetchone()[0]
+        cursor.execute(f'SELECT MIN(date_sent), NOW() FROM {qn(TABLE)}')
+        oldest, now = cursor.fetchone()
+
+        cursor.execute(f'ALTER TABLE {qn(TABLE)} RENAME TO {qn(OLD_TABLE)}')
+        cursor.execute(f'ALTER TABLE {qn(OLD_TABLE)} RENAME CONSTRAINT {qn(TABLE + "_pkey")} '
+                       f'TO {qn(OLD_TABLE + "_pkey")}')
+        cursor.execute(f'CREATE TABLE {qn(TABLE)} (LIKE {qn(OLD_TABLE)} INCLUDING DEFAULTS) '
+                       f'PARTITION BY RANGE (date_sent)')
+        cursor.execute(f'ALTER TABLE {qn(TABLE)} ADD CONSTRAINT {qn(TABLE + "_pkey")} PRIMARY KEY (id, date_sent)')
+        cursor.execute(f'ALTER SEQUENCE {sequence} OWNED BY {qn(TABLE)}.id')
+
+        first = month_index(oldest or now)
+        for index in range(first, month_index(now) + PARTITIONS_AHEAD + 1):
+            start = datetime(index // 12, index % 12 + 1, 1)
+            end = datetime((index + 1) // 12, (index + 1) % 12 + 1, 1)
+            name = f'{TABLE}_p{start.year:04}_{start.month:02}'
+            cursor.execute(f"CREATE TABLE {qn(name)} PARTITION OF {qn(TABLE)} "
+                           f"FOR VALUES FROM ('{start.isoformat()}+00') TO ('{end.isoformat()}+00')")
+        cursor.execute(f'CREATE TABLE {qn(TABLE + "_default")} PARTITION OF {qn(TABLE)} DEFAULT')
+
+        cursor.execute(f'INSERT INTO {qn(TABLE)} SELECT * FROM {qn(OLD_TABLE)}')
+        cursor.execute(f'DROP TABLE {qn(OLD_TABLE)}')
+        for definition in index_definitions:
+            cursor.execute(definition)
+        for name, definition in foreign_keys:
+            cursor.execute(f'ALTER TABLE {qn(TABLE)} ADD CONSTRAINT {qn(name)} {definition}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatApplication', '0004_conversation_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_by_month, migrations.RunPython.noop),
+    ]
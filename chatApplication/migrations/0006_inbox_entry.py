@@ -0,0 +1,64 @@
+# Generated by Django 3.2.11 on 2026-10-18 17:48
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_inbox(apps, schema_editor):
+    """
+    One entry per side of every existing conversation, holding its latest message.
+    History from before the inbox existed counts as read
+    """
+    db_alias = schema_editor.connection.alias
+    Conversation = apps.get_model('chatApplication', 'Conversation')
+    MessageRecord = apps.get_model('chatApplication', 'MessageRecord')
+    InboxEntry = apps.get_model('chatApplication', 'InboxEntry')
+
+    latest = {}
+    for conversation in Conversation.objects.using(db_alias).iterator():
+        record = MessageRecord.objects.using(db_alias).filter(conversation=conversation).order_by(
+            '-date_sent', '-id').first()
+        if record is None:
+            continue
+        for owner_id, counterpart_id, sent in ((conversation.sender_id, conversation.receiver_id, True),
+                                               (conversation.receiver_id, conversation.sender_id, False)):
+            key = (owner_id, counterpart_id)
+            if key not in latest or record.date_sent > latest[key][0].date_sent:
+                latest[key] = (record, sent)
+    InboxEntry.objects.using(db_alias).bulk_create(
+        [InboxEntry(owner_id=owner_id, counterpart_id=counterpart_id, last_message=record.message,
+                    last_date_sent=record.date_sent, last_sent_by_owner=sent)
+         for (owner_id, counterpart_id), (record, sent) in latest.items()],
+        batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatApplication', '0005_partition_messagerecord'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InboxEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_message', models.CharField(max_length=200)),
+                ('last_date_sent', models.DateTimeField()),
+                ('last_sent_by_owner', models.BooleanField(default=False)),
+                ('unread_count', models.PositiveIntegerField(default=0)),
+                ('read_at', models.DateTimeField(null=True)),
+                ('counterpart', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='chatApplication.user')),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='inbox_entries', to='chatApplication.user')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='inboxentry',
+            index=models.Index(fields=['owner', '-last_date_sent'], name='inbox_owner_date_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='inboxentry',
+            constraint=models.UniqueConstraint(fields=('owner', 'counterpart'), name='unique_inbox_entry'),
+        ),
+        migrations.RunPython(backfill_inbox, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 3.2.11 on 2026-10-18 17:50
+
+import re
+from collections import Counter
+
+from django.db import migrations, models
+
+TOKEN_REGEX = re.compile(r'\w+')
+
+
+def build_search_index(apps, schema_editor):
+    """
+    postgres: a generated tsvector column on MessageRecord with a GIN index, computed for existing rows right away
+    and by the database on every insert. Others: SearchToken rows for the existing messages
+    """
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        table = connection.ops.quote_name('chatApplication_messagerecord')
+        schema_editor.execute(f"ALTER TABLE {table} ADD COLUMN search_vector tsvector "
+                              f"GENERATED ALWAYS AS (to_tsvector('simple', message)) STORED")
+        schema_editor.execute(f'CREATE INDEX "message_search_vector_idx" ON {table} USING GIN (search_vector)')
+        return
+
+    db_alias = connection.alias
+    MessageRecord = apps.get_model('chatApplication', 'MessageRecord')
+    SearchToken = apps.get_model('chatApplication', 'SearchToken')
+    tokens = []
+    for record in MessageRecord.objects.using(db_alias).only('id', 'message', 'conversation_id', 'date_sent') \
+            .iterator(chunk_size=2000):
+        tokens.extend(SearchToken(token=token[:32], frequency=frequency, message_id=record.id,
+                                  conversation_id=record.conversation_id, date_sent=record.date_sent)
+                      for token, frequency in Counter(TOKEN_REGEX.findall(record.message.lower())).items())
+        if len(tokens) >= 10000:
+            SearchToken.objects.using(db_alias).bulk_create(tokens, batch_size=1000)
+            tokens = []
+    SearchToken.objects.using(db_alias).bulk_create(tokens, batch_size=1000)
+
+
+def drop_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        schema_editor.execute(f"ALTER TABLE {connection.ops.quote_name('chatApplication_messagerecord')} "
+                              f"DROP COLUMN search_vector")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatApplication', '0006_inbox_entry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=32)),
+                ('frequency', models.PositiveSmallIntegerField(default=1)),
+                ('message_id', models.BigIntegerField()),
+                ('conversation_id', models.BigIntegerField()),
+                ('date_sent', models.DateTimeField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='searchtoken',
+            index=models.Index(fields=['token', 'conversation_id', '-date_sent'], name='search_token_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='searchtoken',
+            index=models.Index(fields=['message_id'], name='search_token_message_idx'),
+        ),
+        migrations.RunPython(build_search_index, drop_search_index),
+    ]
@@ -0,0 +1,79 @@
+from datetime import datetime, timedelta
+
+import pytz
+from django.db import migrations, models
+
+# chatApplication.storage.ids as of this migration
+EPOCH = datetime(2020, 1, 1, tzinfo=pytz.UTC)
+TIME_SHIFT = 22
+
+
+def rewrite_message_ids(apps, schema_editor):
+    """
+    Gives every message a time ordered id (see chatApplication.storage.ids) of its date_sent, and points its
+    search tokens at it. The 22 bits below the millisecond number the messages of that millisecond in their old id
+    order, instead of a worker id and a sequence: ids that processes make later are of later milliseconds
+    """
+    connection = schema_editor.connection
+    MessageRecord = apps.get_model('chatApplication', 'MessageRecord')
+    SearchToken = apps.get_model('chatApplication', 'SearchToken')
+    qn = connection.ops.quote_name
+    table, tokens = qn(MessageRecord._meta.db_table), qn(SearchToken._meta.db_table)
+    if connection.vendor == 'postgresql':
+        epoch_ms = int(EPOCH.timestamp() * 1000)
+        millisecond = "floor(extract(epoch FROM date_sent) * 1000)::bigint"
+        with connection.cursor() as cursor:
+            cursor.execute(f'CREATE TEMPORARY TABLE message_id_map ON COMMIT DROP AS '
+                           f'SELECT id AS old_id, (({millisecond} - {epoch_ms}) << {TIME_SHIFT}) '
+                           f'+ row_number() OVER (PARTITION BY {millisecond} ORDER BY id) - 1 AS new_id FROM {table}')
+            cursor.execute(f'UPDATE {table} SET id = map.new_id FROM message_id_map map WHERE id = map.old_id')
+            cursor.execute(f'UPDATE {tokens} SET message_id = map.new_id FROM message_id_map map '
+                           f'WHERE message_id = map.old_id')
+        return
+
+    new_ids, previous, number = [], None, 0
+    for old_id, date_sent in MessageRecord.objects.using(connection.alias).order_by('date_sent', 'id').values_list(
+            'id', 'date_sent').iterator(chunk_size=2000):
+        ms = (date_sent - EPOCH) // timedelta(milliseconds=1)
+        number = number + 1 if ms == previous else 0
+        previous = ms
+        new_ids.append(((ms << TIME_SHIFT) + number, old_id))
+    with connection.cursor() as cursor:
+        cursor.executemany(f'UPDATE {table} SET id = %s WHERE id = %s', new_ids)
+        cursor.executemany(f'UPDATE {tokens} SET message_id = %s WHERE message_id = %s', new_ids)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatApplication', '0007_message_search'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='messagerecord',
+            name='message_date_sent_id_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='messagerecord',
+            name='message_conversation_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='messagerecord',
+            name='message_receiver_date_idx',
+        ),
+        migrations.RunPython(rewrite_message_ids, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='messagerecord',
+            name='id',
+            field=models.BigIntegerField(editable=False, primary_key=True, serialize=False),
+        ),
+        migrations.AddIndex(
+            model_name='messagerecord',
+            index=models.Index(fields=['conversation', '-id'], name='message_conversation_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='messagerecord',
+            index=models.Index(fields=['receiver', 'id'], name='message_receiver_id_idx'),
+        ),
+    ]
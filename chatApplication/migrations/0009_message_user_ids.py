@@ -0,0 +1,61 @@
+import django.db.models.deletion
+from django.db import migrations, models, transaction
+
+BATCH_SIZE = 10000
+MIN_ID = -(1 << 63)
+
+
+def set_user_ids(table: str, users: str) -> str:
+    """UPDATE of sender_id and receiver_id from the usernames the messages reference"""
+    return (f'UPDATE {table} SET '
+            f'sender_id = (SELECT id FROM {users} WHERE username = {table}.sender_username), '
+            f'receiver_id = (SELECT id FROM {users} WHERE username = {table}.receiver_username)')
+
+
+def backfill_user_ids(apps, schema_editor):
+    """
+    Copies the ids of every message's sender and receiver into the new columns, BATCH_SIZE messages per transaction
+    in id order: each batch locks its rows only until it commits, sends go on meanwhile.
+    Messages written since (by processes not yet running this release) are filled in by 0010
+    """
+    connection = schema_editor.connection
+    MessageRecord = apps.get_model('chatApplication', 'MessageRecord')
+    User = apps.get_model('chatApplication', 'User')
+    qn = connection.ops.quote_name
+    table, users = qn(MessageRecord._meta.db_table), qn(User._meta.db_table)
+    last_id = MIN_ID
+    while last_id is not None:
+        with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+            cursor.execute(f'SELECT MAX(id) FROM (SELECT id FROM {table} WHERE id > %s ORDER BY id LIMIT %s) batch',
+                           [last_id, BATCH_SIZE])
+            batch_last_id = cursor.fetchone()[0]
+            if batch_last_id is not None:
+                cursor.execute(f'{set_user_ids(table, users)} WHERE id > %s AND id <= %s', [last_id, batch_last_id])
+        last_id = batch_last_id
+
+
+class Migration(migrations.Migration):
+    # Every backfill batch commits on its own
+    atomic = False
+
+    dependencies = [
+        ('chatApplication', '0008_time_ordered_message_ids'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='messagerecord',
+            name='sender_user',
+            field=models.ForeignKey(db_column='sender_id', db_index=False, null=True,
+                                    on_delete=django.db.models.deletion.RESTRICT, related_name='+',
+                                    to='chatApplication.user'),
+        ),
+        migrations.AddField(
+            model_name='messagerecord',
+            name='receiver_user',
+            field=models.ForeignKey(db_column='receiver_id', db_index=False, null=True,
+                                    on_delete=django.db.models.deletion.RESTRICT, related_name='+',
+                                    to='chatApplication.user'),
+        ),
+        migrations.RunPython(backfill_user_ids, migrations.RunPython.noop),
+    ]
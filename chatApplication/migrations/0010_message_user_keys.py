@@ -0,0 +1,70 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def fill_remaining_user_ids(apps, schema_editor):
+    """
+    User ids of the messages written since 0009's backfill. On postgres writes to the message table wait from here
+    until this migration commits, so none is written with usernames only once the username columns are gone
+    """
+    connection = schema_editor.connection
+    MessageRecord = apps.get_model('chatApplication', 'MessageRecord')
+    User = apps.get_model('chatApplication', 'User')
+    qn = connection.ops.quote_name
+    table, users = qn(MessageRecord._meta.db_table), qn(User._meta.db_table)
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(f'LOCK TABLE {table} IN SHARE ROW EXCLUSIVE MODE')
+        cursor.execute(f'UPDATE {table} SET '
+                       f'sender_id = (SELECT id FROM {users} WHERE username = {table}.sender_username), '
+                       f'receiver_id = (SELECT id FROM {users} WHERE username = {table}.receiver_username) '
+                       f'WHERE sender_id IS NULL OR receiver_id IS NULL')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatApplication', '0009_message_user_ids'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_remaining_user_ids, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='messagerecord',
+            name='message_receiver_id_idx',
+        ),
+        migrations.RemoveField(
+            model_name='messagerecord',
+            name='sender',
+        ),
+        migrations.RemoveField(
+            model_name='messagerecord',
+            name='receiver',
+        ),
+        migrations.RenameField(
+            model_name='messagerecord',
+            old_name='sender_user',
+            new_name='sender',
+        ),
+        migrations.RenameField(
+            model_name='messagerecord',
+            old_name='receiver_user',
+            new_name='receiver',
+        ),
+        migrations.AlterField(
+            model_name='messagerecord',
+            name='sender',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.RESTRICT, related_name='sender',
+                                    to='chatApplication.user'),
+        ),
+        migrations.AlterField(
+            model_name='messagerecord',
+            name='receiver',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.RESTRICT,
+                                    related_name='receiver', to='chatApplication.user'),
+        ),
+        migrations.AddIndex(
+            model_name='messagerecord',
+            index=models.Index(fields=['receiver', 'id'], name='message_receiver_id_idx'),
+        ),
+    ]
@@ -0,0 +1,107 @@
+# Generated by Django 3.2.11 on 2026-10-18 18:38
+
+from collections import Counter
+
+import pytz
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, migrations, models
+from django.db.migrations.recorder import MigrationRecorder
+from django.db.models import Count
+from django.db.models.functions import Trunc
+import django.db.models.deletion
+
+
+def message_shards():
+    """
+    The shards to count the messages of. A shard never migrated holds no messages; one migrated short of the user
+    keys (0010) can't be read yet
+    """
+    shards = []
+    for shard in settings.MESSAGE_SHARDS:
+        if shard != DEFAULT_DB_ALIAS:
+            recorder = MigrationRecorder(connections[shard])
+            applied = recorder.applied_migrations() if recorder.has_table() else {}
+            if not any(app_label == 'chatApplication' for app_label, _ in applied):
+                continue
+            if ('chatApplication', '0010_message_user_keys') not in applied:
+                raise RuntimeError(f'The message volumes count the messages of every shard: run '
+                                   f'"migrate --database {shard}" before migrating the default database')
+        shards.append(shard)
+    return shards
+
+
+def backfill_message_volumes(apps, schema_editor):
+    """
+    Counts the messages already stored on every shard into the new rollups, which live on the default database alone
+    """
+    if schema_editor.connection.alias != DEFAULT_DB_ALIAS:
+        return
+    MessageRecord = apps.get_model('chatApplication', 'MessageRecord')
+    for model_name, granularity in (('HourlyMessageVolume', 'hour'), ('DailyMessageVolume', 'day')):
+        model = apps.get_model('chatApplication', model_name)
+        counts = Counter()
+        for shard in message_shards():
+            for sender_id, receiver_id, bucket, messages in MessageRecord.objects.using(shard).annotate(
+                    bucket=Trunc('date_sent', granularity, tzinfo=pytz.UTC)).values(
+                    'sender_id', 'receiver_id', 'bucket').annotate(messages=Count('id')).values_list(
+                    'sender_id', 'receiver_id', 'bucket', 'messages').iterator():
+                counts[(sender_id, receiver_id, bucket)] += messages
+        model.objects.using(DEFAULT_DB_ALIAS).bulk_create(
+            [model(sender_id=sender_id, receiver_id=receiver_id, bucket=bucket, count=messages)
+             for (sender_id, receiver_id, bucket), messages in counts.items()],
+            batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatApplication', '0010_message_user_keys'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HourlyMessageVolume',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField()),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('receiver', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='chatApplication.user')),
+                ('sender', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='chatApplication.user')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DailyMessageVolume',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField()),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('receiver', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='chatApplication.user')),
+                ('sender', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='chatApplication.user')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='hourlymessagevolume',
+            index=models.Index(fields=['receiver', 'bucket'], name='hourly_volume_receiver_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='hourlymessagevolume',
+            index=models.Index(fields=['bucket'], name='hourly_volume_bucket_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='hourlymessagevolume',
+            constraint=models.UniqueConstraint(fields=('sender', 'bucket', 'receiver'), name='unique_hourly_volume'),
+        ),
+        migrations.AddIndex(
+            model_name='dailymessagevolume',
+            index=models.Index(fields=['receiver', 'bucket'], name='daily_volume_receiver_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dailymessagevolume',
+            index=models.Index(fields=['bucket'], name='daily_volume_bucket_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailymessagevolume',
+            constraint=models.UniqueConstraint(fields=('sender', 'bucket', 'receiver'), name='unique_daily_volume'),
+        ),
+        migrations.RunPython(backfill_message_volumes, migrations.RunPython.noop),
+    ]
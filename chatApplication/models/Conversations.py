@@ -0,0 +1,100 @@
+from typing import Dict, Iterable, Tuple
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, models, transaction
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from chatApplication.caches.lru_cache import LRUCache
+from chatApplication.models.Users import User
+
+# (database, sender id, receiver id) -> conversation id, only ever filled with committed rows
+conversation_cache = LRUCache(max_size=settings.CONVERSATION_CACHE_SIZE, ttl=settings.CONVERSATION_CACHE_TTL,
+                              name='conversation')
+
+
+class ConversationManager(models.Manager):
+    def for_users(self, sender: User, receiver: User) -> 'Conversation':
+        conversation = self.cached(sender.id, receiver.id)
+        if conversation is None:
+            conversation, _ = self.get_or_create(sender=sender, receiver=receiver)
+            cache_conversation_on_commit(conversation)
+        return conversation
+
+    def bulk_for_users(self, pairs: Iterable[Tuple[User, User]]) -> Dict[Tuple[int, int], 'Conversation']:
+        """
+        Resolve or create the conversations for many (sender, receiver) pairs in a constant number of queries
+        :param pairs: (sender, receiver) users
+        :return: (sender id, receiver id) -> Conversation
+        """
+        conversations = {}
+        for sender, receiver in pairs:
+            conversations[(sender.id, receiver.id)] = self.cached(sender.id, receiver.id)
+        wanted = {pair for pair, conversation in conversations.items() if conversation is None}
+        sender_ids = {sender_id for sender_id, _ in wanted}
+        receiver_ids = {receiver_id for _, receiver_id in wanted}
+
+        def fetch():
+            # Superset of the wanted pairs, narrowed in python
+            conversations.update(((c.sender_id, c.receiver_id), c)
+                                 for c in self.filter(sender_id__in=sender_ids, receiver_id__in=receiver_ids)
+                                 if (c.sender_id, c.receiver_id) in wanted)
+
+        if wanted:
+            fetch()
+        missing = {pair for pair in wanted if conversations[pair] is None}
+        if missing:
+            self.bulk_create([self.model(sender_id=sender_id, receiver_id=receiver_id)
+                              for sender_id, receiver_id in missing], ignore_conflicts=True)
+            fetch()
+        for pair in wanted:
+            cache_conversation_on_commit(conversations[pair])
+        return conversations
+
+    def cached_for_usernames(self, sender_username: str, receiver_username: str):
+        sender, receiver = User.objects.cached(sender_username), User.objects.cached(receiver_username)
+        if sender is None or receiver is None:
+            return None
+        return self.cached(sender.id, receiver.id)
+
+    def cached(self, sender_id: int, receiver_id: int):
+        # Keyed by the database the manager is bound to (a message shard), not the one a read is routed to
+        conversation_id = conversation_cache.get((self._db or DEFAULT_DB_ALIAS, sender_id, receiver_id))
+        if conversation_id is None:
+            return None
+        return self.model.from_db(self.db, ['id', 'sender_id', 'receiver_id'], (conversation_id, sender_id, receiver_id))
+
+
+class Conversation(models.Model):
+    """
+    Ordered (sender -> receiver) pair of users. Every MessageRecord references the conversation it belongs to,
+    so one conversation's history is a single range on the (conversation, id) index.
+    """
+    objects = ConversationManager()
+
+    sender = models.ForeignKey(User, related_name='sent_conversations', on_delete=models.RESTRICT)
+    receiver = models.ForeignKey(User, related_name='received_conversations', on_delete=models.RESTRICT)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['sender', 'receiver'], name='unique_conversation'),
+        ]
+
+    def __repr__(self):
+        return f'(Conversation: {self.sender_id} -> {self.receiver_id})'
+
+    def __str__(self):
+        return f'(Conversation: {self.sender_id} -> {self.receiver_id})'
+
+
+def cache_conversation_on_commit(conversation: Conversation):
+    db = conversation._state.db
+    key, conversation_id = (db, conversation.sender_id, conversation.receiver_id), conversation.id
+    transaction.on_commit(lambda: conversation_cache.set(key, conversation_id), using=db)
+
+
+@receiver(post_delete, sender=Conversation)
+def conversation_deleted(sender, instance: Conversation, using: str, **kwargs):
+    key = (using, instance.sender_id, instance.receiver_id)
+    conversation_cache.delete(key)
+    transaction.on_commit(lambda: conversation_cache.delete(key), using=using)
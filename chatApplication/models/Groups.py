@@ -0,0 +1,115 @@
+"""
+Group conversations, stored for fan-out on read. A message sent to a group is one GroupMessage row whatever the
+number of members; each member reads the group's messages sent since they joined, and keeps a read cursor of their
+own on their GroupMembership. Group.last_message_id, updated by every send, tells which groups have anything newer
+than a position without reading their messages (see storage/feeds.py).
+Groups live on the default database, like users and inboxes
+"""
+from datetime import datetime
+from typing import Iterable
+
+import pytz
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import models
+from django.db.models import Count, Q
+
+from chatApplication.errors.api_errors import APIError
+from chatApplication.models.Users import USERNAME_REGEX, User
+from chatApplication.storage import ids
+
+
+class GroupManager(models.Manager):
+    @staticmethod
+    def validate_name(name: str):
+        if len(name) > settings.USERNAME_MAX_LENGTH or not USERNAME_REGEX.match(name):
+            raise ValidationError([f"Group name must be 3 to {settings.USERNAME_MAX_LENGTH} chars, "
+                                   "with alphanumeric start and end char.",
+                                   "Only - . _ special characters are allowed"])
+
+    def message_sent(self, group_id: int, message_id: int):
+        """Moves the group's last_message_id forward, never back: messages can commit out of id order"""
+        self.filter(Q(last_message_id=None) | Q(last_message_id__lt=message_id), id=group_id).update(
+            last_message_id=message_id)
+
+
+class Group(models.Model):
+    objects = GroupManager()
+
+    name = models.CharField(max_length=settings.USERNAME_MAX_LENGTH, unique=True)
+    last_message_id = models.BigIntegerField(null=True)
+
+    def __repr__(self):
+        return f'(Group: {self.name})'
+
+    def __str__(self):
+        return f'(Group: {self.name})'
+
+
+class GroupMembershipManager(models.Manager):
+    def add_members(self, group: Group, users: Iterable[User]) -> int:
+        """
+        Adds the users not yet members, who see the messages sent from now on
+        :return: members added
+        """
+        joined_id = ids.first_id(datetime.now(pytz.UTC)) - 1
+        users = {user.id: user for user in users}
+        existing = set(self.filter(group=group, member_id__in=users).values_list('member_id', flat=True))
+        full = list(self.filter(member_id__in=set(users) - existing).values('member_id').annotate(
+            groups=Count('id')).filter(groups__gte=settings.MAX_GROUPS_PER_USER).values_list('member_id', flat=True))
+        if full:
+            raise APIError(message=f'{", ".join(sorted(users[user_id].username for user_id in full))} '
+                                   f'already in {settings.MAX_GROUPS_PER_USER} groups', status=409)
+        self.bulk_create([self.model(group=group, member=user, joined_id=joined_id, read_id=joined_id)
+                          for user_id, user in users.items() if user_id not in existing], ignore_conflicts=True)
+        return len(users) - len(existing)
+
+
+class GroupMembership(models.Model):
+    objects = GroupMembershipManager()
+
+    # Indexed by the unique constraint below
+    group = models.ForeignKey(Group, related_name='memberships', db_index=False, on_delete=models.CASCADE)
+    member = models.ForeignKey(User, related_name='group_memberships', on_delete=models.CASCADE)
+    joined_id = models.BigIntegerField()  # the member sees the group's messages with larger ids
+    read_id = models.BigIntegerField()  # read cursor: messages up to this id are read
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['group', 'member'], name='unique_group_member'),
+        ]
+
+    def __repr__(self):
+        return f'(GroupMembership: {self.member_id} in {self.group_id})'
+
+    def __str__(self):
+        return f'(GroupMembership: {self.member_id} in {self.group_id})'
+
+
+class GroupMessage(models.Model):
+    # Time ordered like MessageRecord ids and made by the same generator, so the two merge by id
+    id = models.BigIntegerField(primary_key=True, editable=False)
+
+    # Indexed by the composite group index below
+    group = models.ForeignKey(Group, related_name='messages', db_index=False, on_delete=models.CASCADE)
+    sender = models.ForeignKey(User, related_name='+', on_delete=models.RESTRICT)
+    message = models.CharField(max_length=settings.MAX_MESSAGE_LENGTH)
+    date_sent = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            # A group's messages newest first, from any position
+            models.Index(fields=['group', '-id'], name='group_message_group_id_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.pk is None:
+            self.pk = ids.next_id(self.date_sent)
+            kwargs.setdefault('force_insert', True)
+        super(GroupMessage, self).save(*args, **kwargs)
+
+    def __repr__(self):
+        return f'Date: {self.date_sent}: group - {self.group_id} | Sender: {self.sender_id}'
+
+    def __str__(self):
+        return f'Date: {self.date_sent}: group - {self.group_id} | Sender: {self.sender_id}'
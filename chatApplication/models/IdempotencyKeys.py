@@ -0,0 +1,29 @@
+"""
+Idempotency-Key headers of the send requests (see chatApplication.ingest.idempotency). A request claims its key
+by inserting the row before it runs: the unique scope and key make concurrent retries on any worker lose the claim
+instead of sending twice. The response is stored in the transaction that sends the messages, and replayed to retries.
+Keys are scoped by the request's senders, so two senders' keys never meet.
+Rows live on the default database; expire_idempotency_keys deletes the ones older than IDEMPOTENCY_WINDOW_SECONDS
+"""
+from django.conf import settings
+from django.db import models
+
+
+class IdempotencyKey(models.Model):
+    scope = models.CharField(max_length=64, default='')  # sha256 of the request's senders
+    key = models.CharField(max_length=settings.IDEMPOTENCY_KEY_MAX_LENGTH)
+    fingerprint = models.CharField(max_length=64)  # sha256 of the request's path and body
+    created_at = models.DateTimeField(db_index=True)  # when the key was claimed
+    status = models.PositiveSmallIntegerField(null=True)  # of the stored response, null while the request runs
+    body = models.TextField(null=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['scope', 'key'], name='unique_idempotency_scope_key'),
+        ]
+
+    def __repr__(self):
+        return f'(IdempotencyKey: {self.key}: {self.status})'
+
+    def __str__(self):
+        return f'(IdempotencyKey: {self.key}: {self.status})'
@@ -0,0 +1,96 @@
+from collections import Counter
+from typing import List
+
+from django.conf import settings
+from django.db import models
+from django.dispatch import receiver
+
+from chatApplication.models.MessageRecords import MessageRecord
+from chatApplication.models.Users import User
+from chatApplication.signals import messages_sent
+
+
+class InboxEntryManager(models.Manager):
+    def record_messages(self, records: List[MessageRecord], count_unread: bool = True):
+        """
+        Folds newly sent messages into the sender's and the receiver's inbox entries in three queries,
+        whatever the number of messages or the history size: insert the missing entries, lock every touched entry,
+        write them back with one bulk UPDATE.
+        Runs inside the sending transaction, so the inbox commits (or rolls back) with the messages
+        :param count_unread: False for messages that count as read (imported history)
+        """
+        latest, unread = {}, Counter()
+        for record in records:
+            sides = [(record.sender, record.receiver, True)]
+            if record.sender.id != record.receiver.id:
+                sides.append((record.receiver, record.sender, False))
+            for owner, counterpart, sent in sides:
+                key = (owner.id, counterpart.id)
+                if key not in latest or record.date_sent >= latest[key][0].date_sent:
+                    latest[key] = (record, sent)
+                if not sent and count_unread:
+                    unread[key] += 1
+
+        # Same order in every transaction, so concurrent sends touching the same entries can't deadlock
+        keys = sorted(latest)
+        self.bulk_create([self.model(owner_id=owner_id, counterpart_id=counterpart_id,
+                                     last_message=latest[(owner_id, counterpart_id)][0].message,
+                                     last_date_sent=latest[(owner_id, counterpart_id)][0].date_sent)
+                          for owner_id, counterpart_id in keys], ignore_conflicts=True)
+        # Superset of the touched entries, narrowed in python
+        entries = [entry for entry in self.select_for_update().filter(
+            owner_id__in={owner_id for owner_id, _ in keys},
+            counterpart_id__in={counterpart_id for _, counterpart_id in keys},
+        ).order_by('owner_id', 'counterpart_id') if (entry.owner_id, entry.counterpart_id) in latest]
+
+        for entry in entries:
+            record, sent = latest[(entry.owner_id, entry.counterpart_id)]
+            entry.unread_count += unread[(entry.owner_id, entry.counterpart_id)]
+            # Messages can commit out of date_sent order, the entry keeps the newest one
+            if record.date_sent >= entry.last_date_sent:
+                entry.last_message, entry.last_date_sent, entry.last_sent_by_owner = record.message, \
+                    record.date_sent, sent
+        self.bulk_update(entries, ['unread_count', 'last_message', 'last_date_sent', 'last_sent_by_owner'])
+
+    def mark_read(self, owner: User, counterpart: User, read_at) -> bool:
+        """
+        :return: False when the owner has no conversation with the counterpart
+        """
+        return self.filter(owner=owner, counterpart=counterpart).update(unread_count=0, read_at=read_at) > 0
+
+
+class InboxEntry(models.Model):
+    """
+    Incrementally maintained summary of one user's conversation with another, in either direction:
+    the last message and how many messages from the counterpart are unread.
+    A user's inbox is their entries, so reading it costs one row per counterpart however long the history
+    """
+    objects = InboxEntryManager()
+
+    owner = models.ForeignKey(User, related_name='inbox_entries', on_delete=models.CASCADE)
+    counterpart = models.ForeignKey(User, related_name='+', on_delete=models.CASCADE)
+    last_message = models.CharField(max_length=settings.MAX_MESSAGE_LENGTH)
+    last_date_sent = models.DateTimeField()
+    last_sent_by_owner = models.BooleanField(default=False)
+    unread_count = models.PositiveIntegerField(default=0)
+    read_at = models.DateTimeField(null=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['owner', 'counterpart'], name='unique_inbox_entry'),
+        ]
+        indexes = [
+            # Serves the inbox listing: one owner's entries, most recent first
+            models.Index(fields=['owner', '-last_date_sent'], name='inbox_owner_date_idx'),
+        ]
+
+    def __repr__(self):
+        return f'(InboxEntry: {self.owner_id} <-> {self.counterpart_id} unread {self.unread_count})'
+
+    def __str__(self):
+        return f'(InboxEntry: {self.owner_id} <-> {self.counterpart_id} unread {self.unread_count})'
+
+
+@receiver(messages_sent)
+def update_inbox(sender, records: List[MessageRecord], **kwargs):
+    InboxEntry.objects.record_messages(records)
@@ -1,24 +1,121 @@
+import csv
+import io
+from datetime import datetime
+from typing import List
+
 from django.conf import settings
-from django.db import models
+from django.db import connections, models, router
+from django.db.models import Q
 
+from chatApplication.models.Conversations import Conversation
 from chatApplication.models.Users import User
+from chatApplication.storage import ids
+
+
+class MessageRecordManager(models.Manager):
+    def bulk_send(self, records: List['MessageRecord'], copy: bool = False) -> List['MessageRecord']:
+        """
+        Insert many messages with one INSERT, resolving their conversations in bulk.
+        The bulk equivalent of MessageRecord.save
+        :param records: unsaved records with sender and receiver set, and ids for records that keep theirs
+        :param copy: on postgres write them with COPY instead, which is faster for large batches
+        :return: the inserted records
+        """
+        conversations = Conversation.objects.db_manager(self._db).bulk_for_users(
+            (record.sender, record.receiver) for record in records)
+        new_records = [record for record in records if record.pk is None]
+        for record, record_id in zip(new_records, ids.next_ids(record.date_sent for record in new_records)):
+            record.pk = record_id
+        for record in records:
+            record.conversation = conversations[(record.sender.id, record.receiver.id)]
+        db = self._db or router.db_for_write(self.model)
+        if copy and connections[db].vendor == 'postgresql':
+            self.copy_records(db, records)
+            return records
+        return self.bulk_create(records)
+
+    def copy_records(self, db: str, records: List['MessageRecord']):
+        """COPY ... FROM STDIN of records with their conversations set (postgres)"""
+        buffer = io.StringIO()
+        # Quoted, so empty messages are not read back as NULL
+        csv.writer(buffer, quoting=csv.QUOTE_ALL).writerows(
+            (record.id, record.date_sent.isoformat(), record.message, record.sender_id, record.receiver_id,
+             record.conversation_id) for record in records)
+        buffer.seek(0)
+        connection = connections[db]
+        columns = ', '.join(connection.ops.quote_name(self.model._meta.get_field(name).column)
+                            for name in ('id', 'date_sent', 'message', 'sender', 'receiver', 'conversation'))
+        with connection.cursor() as cursor:
+            cursor.cursor.copy_expert(f'COPY {connection.ops.quote_name(self.model._meta.db_table)} ({columns}) '
+                                      f'FROM STDIN WITH (FORMAT csv)', buffer)
+        for record in records:
+            record._state.db, record._state.adding = db, False
+
+
+def sent_within(date_range: List[datetime]) -> Q:
+    """
+    Messages sent from start to end: the id range the dates map to, which the (..., id) indexes seek, and the dates
+    themselves, which postgres prunes partitions by and which are exact where ids run ahead (see storage.ids)
+    :param date_range: [start, end]
+    """
+    return Q(id__range=ids.id_range(*date_range), date_sent__range=date_range)
+
+
+USER_FIELDS = ('sender', 'receiver')
+
+
+def with_usernames(rows: List[dict]) -> List[dict]:
+    """
+    Replaces the user ids of the sender and receiver of values() rows with usernames, in place,
+    through User.objects.usernames: one lookup per page instead of a join per row
+    :return: rows
+    """
+    user_fields = [field for field in USER_FIELDS if rows and field in rows[0]]
+    if user_fields:
+        usernames = User.objects.usernames(row[field] for row in rows for field in user_fields)
+        for row in rows:
+            for field in user_fields:
+                row[field] = usernames[row[field]]
+    return rows
 
 
 class MessageRecord(models.Model):
+    objects = MessageRecordManager()
+
+    # Time ordered (chatApplication.storage.ids), made from date_sent by save and bulk_send
+    id = models.BigIntegerField(primary_key=True, editable=False)
 
     date_sent = models.DateTimeField('Date Sent', db_index=True, unique=False)
     message = models.CharField(max_length=settings.MAX_MESSAGE_LENGTH)
-    sender = models.ForeignKey(User, to_field='username', db_column='sender_username',
-                               related_name='sender',
-                               on_delete=models.RESTRICT)
+    # User ids, not usernames: 8 bytes a key in the row and its indexes. Pages map them back to usernames
+    # with with_usernames, from the user cache instead of a join
+    sender = models.ForeignKey(User, related_name='sender', on_delete=models.RESTRICT)
+
+    # Indexed by the composite receiver index below
+    receiver = models.ForeignKey(User, related_name='receiver', db_index=False, on_delete=models.RESTRICT)
+
+    # Indexed by the composite conversation index below, a separate single column index would be redundant
+    conversation = models.ForeignKey(Conversation, related_name='messages', db_index=False,
+                                     on_delete=models.RESTRICT)
 
-    receiver = models.ForeignKey(User, to_field='username', db_column='receiver_username',
-                                 related_name='receiver',
-                                 on_delete=models.RESTRICT)
+    class Meta:
+        indexes = [
+            # Keyset pagination over every message reads the primary key backwards, ids being time ordered.
+            # One conversation's history (retrieve_messages) is a single range read
+            models.Index(fields=['conversation', '-id'], name='message_conversation_id_idx'),
+            # Everything sent to one receiver, in the order sync reads it
+            models.Index(fields=['receiver', 'id'], name='message_receiver_id_idx'),
+        ]
 
     def save(self, *args, **kwargs):
-        # Clear datetime of microseconds before save
-        self.date_sent = self.date_sent.replace(microsecond=0)
+        if self.pk is None:
+            self.pk = ids.next_id(self.date_sent)
+            # A new id has no row to update
+            kwargs.setdefault('force_insert', True)
+        if self.conversation_id is None:
+            # On the database the record is saved to (its shard)
+            self.conversation = Conversation.objects.db_manager(kwargs.get('using')).for_users(sender=self.sender,
+                                                                                              receiver=self.receiver)
         super(MessageRecord, self).save(*args, **kwargs)
 
     def __repr__(self):
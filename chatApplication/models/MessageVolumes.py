@@ -0,0 +1,117 @@
+"""
+Message counts per sender, receiver and hour or day, updated by every send in the sending transaction, so volume over
+months is read from a few rows per day (see apis/stats_api.py) instead of counting messages.
+Rows live on the default database, whatever the shard of their messages, like inbox entries. They outlive the
+messages expired by manage_partitions; rebuild_message_volumes recounts them from the messages still stored
+"""
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Iterable, List, Tuple
+
+import pytz
+from django.db import connections, models, router
+from django.dispatch import receiver
+
+from chatApplication.models.MessageRecords import MessageRecord
+from chatApplication.models.Users import User
+from chatApplication.signals import messages_sent
+
+VolumeKey = Tuple[int, int, datetime]  # sender id, receiver id, bucket
+UPSERT_ROWS = 200  # rows per statement, 800 parameters stay below SQLite's limit
+
+
+class MessageVolumeManager(models.Manager):
+    def record_messages(self, records: List[MessageRecord]):
+        """
+        Adds newly sent messages to the counts of their (sender, receiver, bucket)
+        """
+        self.add_counts(Counter((record.sender.id, record.receiver.id, self.model.bucket_of(record.date_sent))
+                                for record in records))
+
+    def add_counts(self, counts: Dict[VolumeKey, int]):
+        """
+        One INSERT ... ON CONFLICT DO UPDATE (postgres, SQLite 3.24+) per UPSERT_ROWS keys, in key order,
+        so concurrent sends adding to the same rows can't deadlock
+        """
+        connection = connections[self._db or router.db_for_write(self.model)]
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        keys = sorted(counts)
+        with connection.cursor() as cursor:
+            for start in range(0, len(keys), UPSERT_ROWS):
+                chunk = keys[start:start + UPSERT_ROWS]
+                values = ', '.join(['(%s, %s, %s, %s)'] * len(chunk))
+                cursor.execute(f'INSERT INTO {table} (sender_id, receiver_id, bucket, count) VALUES {values} '
+                               f'ON CONFLICT (sender_id, bucket, receiver_id) '
+                               f'DO UPDATE SET count = {table}.count + excluded.count',
+                               [value for sender_id, receiver_id, bucket in chunk
+                                for value in (sender_id, receiver_id, connection.ops.adapt_datetimefield_value(bucket),
+                                              counts[(sender_id, receiver_id, bucket)])])
+
+
+class MessageVolume(models.Model):
+    objects = MessageVolumeManager()
+
+    granularity = None  # hour or day, the length of a bucket
+
+    # Indexed by the unique constraint and the composite receiver index of each table
+    sender = models.ForeignKey(User, related_name='+', db_index=False, on_delete=models.CASCADE)
+    receiver = models.ForeignKey(User, related_name='+', db_index=False, on_delete=models.CASCADE)
+    bucket = models.DateTimeField()  # start of the hour or day (UTC)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def bucket_of(cls, moment: datetime) -> datetime:
+        """Start of the (UTC) hour or day moment falls in"""
+        moment = moment.astimezone(pytz.UTC).replace(minute=0, second=0, microsecond=0)
+        return moment.replace(hour=0) if cls.granularity == 'day' else moment
+
+    def __repr__(self):
+        return f'({self.__class__.__name__}: {self.sender_id} -> {self.receiver_id} at {self.bucket}: {self.count})'
+
+    def __str__(self):
+        return f'({self.__class__.__name__}: {self.sender_id} -> {self.receiver_id} at {self.bucket}: {self.count})'
+
+
+class HourlyMessageVolume(MessageVolume):
+    granularity = 'hour'
+
+    class Meta:
+        constraints = [
+            # One sender's volume over a range is a range read of its prefix
+            models.UniqueConstraint(fields=['sender', 'bucket', 'receiver'], name='unique_hourly_volume'),
+        ]
+        indexes = [
+            models.Index(fields=['receiver', 'bucket'], name='hourly_volume_receiver_idx'),
+            # Top senders or receivers of a range, over every user
+            models.Index(fields=['bucket'], name='hourly_volume_bucket_idx'),
+        ]
+
+
+class DailyMessageVolume(MessageVolume):
+    granularity = 'day'
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['sender', 'bucket', 'receiver'], name='unique_daily_volume'),
+        ]
+        indexes = [
+            models.Index(fields=['receiver', 'bucket'], name='daily_volume_receiver_idx'),
+            models.Index(fields=['bucket'], name='daily_volume_bucket_idx'),
+        ]
+
+
+VOLUMES = {model.granularity: model for model in (HourlyMessageVolume, DailyMessageVolume)}
+
+
+def record_message_volumes(records: Iterable[MessageRecord]):
+    records = list(records)
+    for model in VOLUMES.values():
+        model.objects.record_messages(records)
+
+
+@receiver(messages_sent)
+def update_message_volumes(sender, records: List[MessageRecord], **kwargs):
+    record_message_volumes(records)
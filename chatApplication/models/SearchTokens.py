@@ -0,0 +1,72 @@
+import re
+from collections import Counter
+from typing import List
+
+from django.db import connections, models
+from django.dispatch import receiver
+
+from chatApplication.models.MessageRecords import MessageRecord
+from chatApplication.signals import messages_sent
+
+TOKEN_REGEX = re.compile(r'\w+')
+TOKEN_MAX_LENGTH = 32
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lower cased words, without stemming or stop words, like postgres' 'simple' text search configuration
+    """
+    return [token[:TOKEN_MAX_LENGTH] for token in TOKEN_REGEX.findall(text.lower())]
+
+
+class SearchTokenManager(models.Manager):
+    def index_messages(self, records: List[MessageRecord]):
+        """
+        One row per distinct token of every message, inserted with a single bulk INSERT
+        :param records: saved records
+        """
+        self.bulk_create([self.model(token=token, frequency=frequency, message_id=record.id,
+                                     conversation_id=record.conversation_id, date_sent=record.date_sent)
+                          for record in records
+                          for token, frequency in Counter(tokenize(record.message)).items()],
+                         batch_size=1000)
+
+
+class SearchToken(models.Model):
+    """
+    Inverted index of message content for databases without native full-text search (SQLite):
+    token -> the messages containing it. On postgres MessageRecord's generated search_vector column
+    and its GIN index are used instead and this table stays empty.
+    message_id and conversation_id are plain columns, MessageRecord's partitioned table can't be referenced by a FK
+    """
+    objects = SearchTokenManager()
+
+    token = models.CharField(max_length=TOKEN_MAX_LENGTH)
+    frequency = models.PositiveSmallIntegerField(default=1)
+    message_id = models.BigIntegerField()
+    conversation_id = models.BigIntegerField()
+    date_sent = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            # A term's postings within a set of conversations, newest first
+            models.Index(fields=['token', 'conversation_id', '-date_sent'], name='search_token_idx'),
+            models.Index(fields=['message_id'], name='search_token_message_idx'),
+        ]
+
+    def __repr__(self):
+        return f'(SearchToken: {self.token} -> {self.message_id})'
+
+    def __str__(self):
+        return f'(SearchToken: {self.token} -> {self.message_id})'
+
+
+@receiver(messages_sent)
+def index_messages(sender, records: List[MessageRecord], **kwargs):
+    # Tokens are stored next to their messages, on each message's shard
+    shards = {}
+    for record in records:
+        shards.setdefault(record._state.db, []).append(record)
+    for db, shard_records in shards.items():
+        if connections[db].vendor != 'postgresql':
+            SearchToken.objects.db_manager(db).index_messages(shard_records)
@@ -1,30 +1,108 @@
 import re
+from typing import Dict, Iterable, Optional
 
 from django.conf import settings
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.db import models, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 
+from chatApplication.caches.lru_cache import LRUCache
 from chatApplication.errors.api_errors import APIError
 
+USERNAME_REGEX = re.compile(r"^[A-Za-z0-9][A-Za-z0-9.+_-]{1,16}[A-Za-z0-9]$")
+
+# username -> user id and user id -> username, only ever filled with committed rows
+username_cache = LRUCache(max_size=settings.USER_CACHE_SIZE, ttl=settings.USER_CACHE_TTL, name='username')
+user_id_cache = LRUCache(max_size=settings.USER_CACHE_SIZE, ttl=settings.USER_CACHE_TTL, name='user_id')
+
 
 class UserManager(models.Manager):
+    @staticmethod
+    def validate_username(username: str):
+        if len(username) > settings.USERNAME_MAX_LENGTH:
+            raise ValidationError(message="Username must be at-least 3 chars")
+        if not USERNAME_REGEX.match(username):
+            raise ValidationError(["Username must have alphanumeric start and end char.",
+                                   "Only - . _ special characters are allowed"])
+
     def get_or_create(self, **kwargs):
-        regex = re.compile(r"^[A-Za-z0-9][A-Za-z0-9.+_-]{1,16}[A-Za-z0-9]$")
         username_field = 'username'
         if username_field in kwargs:
-            if len(kwargs[username_field]) > settings.USERNAME_MAX_LENGTH:
-                raise ValidationError(message="Username must be at-least 3 chars")
-            if not regex.match(kwargs[username_field]):
-                raise ValidationError(["Username must have alphanumeric start and end char.",
-                                       "Only - . _ special characters are allowed"])
+            self.validate_username(kwargs[username_field])
 
         return super().get_or_create(**kwargs)
 
     def api_get_or_create(self, **kwargs):
+        if kwargs.keys() == {'username'}:
+            user = self.cached(kwargs['username'])
+            if user is not None:
+                return user, False
         try:
-            return self.get_or_create(**kwargs)
+            user, created = self.get_or_create(**kwargs)
         except ValidationError as e:
             raise APIError(e.messages)
+        cache_user_on_commit(user)
+        return user, created
+
+    def get_user(self, username: str) -> 'User':
+        """
+        :param username:
+        :return: User, raises User.DoesNotExist
+        """
+        user = self.cached(username)
+        if user is None:
+            user = self.get(username=username)
+            cache_user_on_commit(user)
+        return user
+
+    def bulk_get_or_create(self, usernames: Iterable[str]) -> Dict[str, 'User']:
+        """
+        Resolve many usernames at once: one SELECT for the existing users, one INSERT for the missing ones
+        and one SELECT to read them back (ignore_conflicts makes concurrent creators harmless).
+        Cached usernames skip the database entirely. Usernames must already be validated
+        :param usernames:
+        :return: username -> User
+        """
+        users = {}
+        for username in set(usernames):
+            users[username] = self.cached(username)
+        missing = {username for username, user in users.items() if user is None}
+        if missing:
+            users.update((user.username, user) for user in self.filter(username__in=missing))
+            missing = {username for username in missing if users[username] is None}
+        if missing:
+            self.bulk_create([self.model(username=username) for username in missing], ignore_conflicts=True)
+            users.update((user.username, user) for user in self.filter(username__in=missing))
+        for user in users.values():
+            cache_user_on_commit(user)
+        return users
+
+    def cached(self, username: str) -> Optional['User']:
+        user_id = username_cache.get(username)
+        if user_id is None:
+            return None
+        return self.model.from_db(self.db, ['id', 'username'], (user_id, username))
+
+    def cached_username(self, user_id: int) -> Optional[str]:
+        return user_id_cache.get(user_id)
+
+    def usernames(self, user_ids: Iterable[int]) -> Dict[int, str]:
+        """
+        Resolve user ids (of message rows) to usernames: cached ids skip the database, the others are read
+        with one SELECT and cached
+        :param user_ids:
+        :return: user id -> username, without the ids of users that do not exist
+        """
+        usernames = {}
+        for user_id in set(user_ids):
+            usernames[user_id] = user_id_cache.get(user_id)
+        missing = [user_id for user_id, username in usernames.items() if username is None]
+        if missing:
+            for user_id, username in self.filter(id__in=missing).values_list('id', 'username'):
+                usernames[user_id] = username
+                cache_user_on_commit(self.model(id=user_id, username=username))
+        return {user_id: username for user_id, username in usernames.items() if username is not None}
 
 
 class User(models.Model):
@@ -37,3 +115,42 @@ class User(models.Model):
 
     def __str__(self):
         return f'(User: {self.username})'
+
+
+"""
+#############################
+Cache maintenance           #
+#############################
+"""
+
+
+def cache_user(user_id: int, username: str):
+    previous_username = user_id_cache.get(user_id)
+    if previous_username is not None and previous_username != username:
+        username_cache.delete(previous_username)
+    username_cache.set(username, user_id)
+    user_id_cache.set(user_id, username)
+
+
+def cache_user_on_commit(user: User):
+    """Rows read or written inside a transaction are only cached once (and if) it commits"""
+    user_id, username = user.id, user.username
+    transaction.on_commit(lambda: cache_user(user_id, username))
+
+
+def evict_user(user_id: int, username: str):
+    username_cache.delete(username)
+    user_id_cache.delete(user_id)
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance: User, **kwargs):
+    cache_user_on_commit(instance)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance: User, **kwargs):
+    user_id, username = instance.id, instance.username
+    evict_user(user_id, username)
+    # Evict again in case the row was cached by another request before this delete committed
+    transaction.on_commit(lambda: evict_user(user_id, username))
@@ -1,2 +1,8 @@
 from .Users import User
+from .Conversations import Conversation
 from .MessageRecords import MessageRecord
+from .InboxEntries import InboxEntry
+from .SearchTokens import SearchToken
+from .MessageVolumes import HourlyMessageVolume, DailyMessageVolume
+from .Groups import Group, GroupMembership, GroupMessage
+from .IdempotencyKeys import IdempotencyKey
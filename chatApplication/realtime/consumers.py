@@ -0,0 +1,111 @@
+import asyncio
+import json
+import re
+
+from django.conf import settings
+
+from chatApplication.realtime.hub import get_hub
+
+WEBSOCKET_PATH = re.compile(r'^/ws/messages/(?P<username>[^/]+)/?$')
+SSE_PATH = re.compile(r'^/message/stream/(?P<username>[^/]+)/?$')
+
+
+async def _push_events(subscription, receive):
+    """
+    Yields ('payload', dict) for every published message and ('idle', None) after PUSH_KEEPALIVE_SECONDS
+    without one. Stops when the client disconnects or the subscription is closed as a slow consumer,
+    other client events are ignored
+    """
+    receive_task = asyncio.ensure_future(receive())
+    payload_task = None
+    try:
+        while True:
+            if payload_task is None:
+                payload_task = asyncio.ensure_future(subscription.get())
+            done, _ = await asyncio.wait({payload_task, receive_task}, timeout=settings.PUSH_KEEPALIVE_SECONDS,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if receive_task in done:
+                if receive_task.result()['type'] in ('http.disconnect', 'websocket.disconnect'):
+                    return
+                receive_task = asyncio.ensure_future(receive())
+            if payload_task in done:
+                payload, payload_task = payload_task.result(), None
+                if payload is None:
+                    return
+                yield 'payload', payload
+            if not done:
+                yield 'idle', None
+    finally:
+        receive_task.cancel()
+        if payload_task is not None:
+            payload_task.cancel()
+
+
+async def websocket_consumer(scope, receive, send, username: str):
+    """
+    Pushes every message sent to username as a JSON text frame.
+    Frames sent by the client are ignored
+    """
+    event = await receive()
+    if event['type'] != 'websocket.connect':
+        return
+    await send({'type': 'websocket.accept'})
+
+    hub = get_hub()
+    subscription = hub.subscribe(username)
+    try:
+        async for kind, payload in _push_events(subscription, receive):
+            if kind == 'payload':
+                await send({'type': 'websocket.send', 'text': json.dumps(payload)})
+        if subscription.closed:  # disconnected as a slow consumer
+            await send({'type': 'websocket.close', 'code': 1013})
+    finally:
+        hub.unsubscribe(subscription)
+
+
+async def sse_consumer(scope, receive, send, username: str):
+    """
+    Server-sent events stream of every message sent to username, with keep-alive comments while idle
+    """
+    if scope['method'] != 'GET':
+        await send({'type': 'http.response.start', 'status': 405, 'headers': [(b'allow', b'GET')]})
+        await send({'type': 'http.response.body', 'body': b''})
+        return
+
+    await send({'type': 'http.response.start', 'status': 200,
+                'headers': [(b'content-type', b'text/event-stream'), (b'cache-control', b'no-cache')]})
+    hub = get_hub()
+    subscription = hub.subscribe(username)
+    try:
+        async for kind, payload in _push_events(subscription, receive):
+            if kind == 'payload':
+                body = f'id: {payload["id"]}\nevent: message\ndata: {json.dumps(payload)}\n\n'.encode('utf8')
+            else:
+                body = b': keep-alive\n\n'
+            await send({'type': 'http.response.body', 'body': body, 'more_body': True})
+        if subscription.closed:  # disconnected as a slow consumer
+            await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        hub.unsubscribe(subscription)
+
+
+def realtime_router(application):
+    """
+    Wraps the Django ASGI application: push channels are served here, everything else goes to Django
+    """
+
+    async def router(scope, receive, send):
+        if scope['type'] == 'websocket':
+            match = WEBSOCKET_PATH.match(scope['path'])
+            if match is None:
+                await receive()
+                await send({'type': 'websocket.close', 'code': 1000})
+                return
+            return await websocket_consumer(scope, receive, send, match.group('username'))
+        if scope['type'] == 'http':
+            match = SSE_PATH.match(scope['path'])
+            if match is not None:
+                return await sse_consumer(scope, receive, send, match.group('username'))
+        return await application(scope, receive, send)
+
+    return router
@@ -0,0 +1,132 @@
+import asyncio
+import logging
+import threading
+from collections import defaultdict
+from typing import Optional
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+_CLOSED = object()
+
+
+class Subscription:
+    """
+    One connected client of a receiver's push channel.
+    Bounded queue owned by the subscriber's event loop; publishers on any thread hand payloads over thread safely
+    """
+
+    def __init__(self, hub: 'MessageHub', receiver_username: str, loop: asyncio.AbstractEventLoop,
+                 max_size: int, policy: str):
+        self.hub = hub
+        self.receiver_username = receiver_username
+        self.loop = loop
+        self.policy = policy
+        self.queue = asyncio.Queue(maxsize=max_size)
+        self.closed = False
+        self.dropped = 0
+
+    def deliver(self, payload: dict):
+        """Called on the subscriber's loop"""
+        if self.closed:
+            return
+        if self.queue.full():
+            if self.policy == 'disconnect':
+                logging.info(f'Disconnecting slow subscriber of {self.receiver_username}')
+                self.hub.disconnected += 1
+                self.close()
+                return
+            # drop: the oldest undelivered payload makes room
+            self.queue.get_nowait()
+            self.dropped += 1
+            self.hub.dropped += 1
+        self.queue.put_nowait(payload)
+        self.hub.delivered += 1
+
+    def close(self):
+        """Called on the subscriber's loop; wakes a pending get() which then returns None"""
+        if self.closed:
+            return
+        self.closed = True
+        self.hub.unsubscribe(self)
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(_CLOSED)
+
+    async def get(self) -> Optional[dict]:
+        """
+        :return: the next payload, None once the subscription is closed
+        """
+        payload = await self.queue.get()
+        return None if payload is _CLOSED else payload
+
+
+class MessageHub:
+    """
+    Publish/subscribe of sent messages, keyed by receiver username.
+    This base class fans out to the subscribers connected to this process. A multi node deployment subclasses it
+    and overrides publish to go through a broker, calling fan_out for every message the broker delivers here.
+    Selected by settings.MESSAGE_HUB_BACKEND
+    """
+
+    def __init__(self):
+        self._subscriptions = defaultdict(set)
+        self._lock = threading.Lock()
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.disconnected = 0
+
+    def subscribe(self, receiver_username: str, loop: asyncio.AbstractEventLoop = None) -> Subscription:
+        subscription = Subscription(self, receiver_username, loop or asyncio.get_running_loop(),
+                                    max_size=settings.PUSH_QUEUE_SIZE,
+                                    policy=settings.PUSH_SLOW_CONSUMER_POLICY)
+        with self._lock:
+            self._subscriptions[receiver_username].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.receiver_username)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.receiver_username]
+
+    def publish(self, receiver_username: str, payload: dict):
+        self.published += 1
+        self.fan_out(receiver_username, payload)
+
+    def fan_out(self, receiver_username: str, payload: dict):
+        """Hands payload to every local subscriber of receiver_username; safe to call from any thread"""
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(receiver_username, ()))
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, payload)
+            except RuntimeError:  # the subscriber's loop is closed
+                self.unsubscribe(subscription)
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return sum(len(subscriptions) for subscriptions in self._subscriptions.values())
+
+    def stats(self) -> dict:
+        return dict(subscribers=self.subscriber_count(), published=self.published, delivered=self.delivered,
+                    dropped=self.dropped, disconnected=self.disconnected)
+
+
+class InMemoryHub(MessageHub):
+    """Single process hub, the default backend and the stand-in for tests"""
+
+
+_hub = None
+_hub_lock = threading.Lock()
+
+
+def get_hub() -> MessageHub:
+    global _hub
+    with _hub_lock:
+        if _hub is None:
+            _hub = import_string(settings.MESSAGE_HUB_BACKEND)()
+        return _hub
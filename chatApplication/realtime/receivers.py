@@ -0,0 +1,39 @@
+from typing import List
+
+from django.db import transaction
+from django.dispatch import receiver
+
+from chatApplication.models import MessageRecord
+from chatApplication.realtime.hub import get_hub
+from chatApplication.realtime.waiters import waiters
+from chatApplication.signals import messages_sent
+
+
+def message_payload(record: MessageRecord) -> dict:
+    return dict(id=record.id, sender=record.sender.username, receiver=record.receiver.username,
+                message=record.message, date_sent=record.date_sent.isoformat())
+
+
+@receiver(messages_sent)
+def publish_messages(sender, records: List[MessageRecord], **kwargs):
+    """Pushes messages to their receivers' subscribers once the send has committed"""
+    payloads = [(record.receiver.username, message_payload(record)) for record in records]
+
+    def publish():
+        hub = get_hub()
+        for receiver_username, payload in payloads:
+            hub.publish(receiver_username, payload)
+
+    transaction.on_commit(publish)
+
+
+@receiver(messages_sent)
+def wake_sync_waiters(sender, records: List[MessageRecord], **kwargs):
+    """Wakes long-polling /message/sync/ requests of the receivers once the send has committed"""
+    receiver_usernames = {record.receiver.username for record in records}
+
+    def notify():
+        for receiver_username in receiver_usernames:
+            waiters.notify(receiver_username)
+
+    transaction.on_commit(notify)
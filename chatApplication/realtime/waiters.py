@@ -0,0 +1,75 @@
+import asyncio
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+
+class Waiter:
+    """A parked long-poll request, woken when a message is sent to its receiver"""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop = None):
+        self.loop = loop
+        self.event = asyncio.Event() if loop else threading.Event()
+
+    def wake(self):
+        if self.loop is None:
+            self.event.set()
+            return
+        try:
+            self.loop.call_soon_threadsafe(self.event.set)
+        except RuntimeError:  # the waiter's loop is closed
+            pass
+
+    def wait(self, timeout: float) -> bool:
+        """
+        :return: True if woken, False on timeout
+        """
+        return self.event.wait(timeout)
+
+    async def async_wait(self, timeout: float) -> bool:
+        try:
+            await asyncio.wait_for(self.event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+
+class WaiterRegistry:
+    """
+    Receiver username -> parked waiters of this process.
+    Register before checking for new messages so a send between the check and the wait is not missed
+    """
+
+    def __init__(self):
+        self._waiters = defaultdict(set)
+        self._lock = threading.Lock()
+        self.wakeups = 0
+
+    @contextmanager
+    def waiter(self, receiver_username: str, loop: asyncio.AbstractEventLoop = None):
+        waiter = Waiter(loop)
+        with self._lock:
+            self._waiters[receiver_username].add(waiter)
+        try:
+            yield waiter
+        finally:
+            with self._lock:
+                waiters = self._waiters.get(receiver_username)
+                if waiters is not None:
+                    waiters.discard(waiter)
+                    if not waiters:
+                        del self._waiters[receiver_username]
+
+    def notify(self, receiver_username: str):
+        with self._lock:
+            waiters = list(self._waiters.get(receiver_username, ()))
+        self.wakeups += len(waiters)
+        for waiter in waiters:
+            waiter.wake()
+
+    def waiting(self) -> int:
+        with self._lock:
+            return sum(len(waiters) for waiters in self._waiters.values())
+
+
+waiters = WaiterRegistry()
@@ -17,6 +17,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'chatApplication.metrics.middleware.InstrumentationMiddleware',
+    'chatApplication.storage.routers.ReplicaRoutingMiddleware',
     'django.middleware.common.CommonMiddleware'
 ]
 
@@ -54,10 +56,25 @@ DATABASES = {
         'USER': os.environ.get('POSTGRES_USER', 'mishukdutta'),
         'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
         'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
-        'port': 5432
+        'port': 5432,
+        # Keep connections open across requests (seconds), see chatApplication.storage.connections
+        'CONN_MAX_AGE': int(os.environ.get('POSTGRES_CONN_MAX_AGE', '60')),
     }
 }
 
+# Read replicas (POSTGRES_REPLICA_HOSTS=host,host...), see chatApplication.storage.routers.
+# Tests mirror them to the default test database
+for _index, _host in enumerate(filter(None, os.environ.get('POSTGRES_REPLICA_HOSTS', '').split(',')), start=1):
+    DATABASES[f'replica_{_index}'] = dict(DATABASES['default'], HOST=_host.strip(), TEST={'MIRROR': 'default'})
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias.startswith('replica_')]
+
+# Message shards (POSTGRES_SHARD_HOSTS=host,host...) after the default database, see chatApplication.storage.shards.
+# Only ever append hosts: a conversation's shard follows from its position in the list
+for _index, _host in enumerate(filter(None, os.environ.get('POSTGRES_SHARD_HOSTS', '').split(',')), start=2):
+    DATABASES[f'shard_{_index}'] = dict(DATABASES['default'], HOST=_host.strip())
+MESSAGE_SHARDS = ['default'] + [alias for alias in DATABASES if alias.startswith('shard_')]
+DATABASE_ROUTERS = ['chatApplication.storage.routers.ReplicaRouter', 'chatApplication.storage.shards.ShardRouter']
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/3.2/topics/i18n/
@@ -82,4 +99,12 @@ STATIC_URL = '/static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Serve the native async views (chatApplication.apis.async_*_api), meant for ASGI servers
+ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS', '0') == '1'
+
+# Worker id (0-1023) in the ids of the messages this process writes, see chatApplication.storage.ids.
+# Processes writing at the same time need different ones (e.g. one per host and server worker). Required outside
+# DEBUG; unset under DEBUG, the process id modulo 1024 is used, which only tells apart the processes of one host
+MESSAGE_ID_WORKER_ID = int(os.environ['MESSAGE_ID_WORKER_ID']) if os.environ.get('MESSAGE_ID_WORKER_ID') else None
+
 from chatApplication.constants import *
\ No newline at end of file
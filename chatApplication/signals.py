@@ -0,0 +1,5 @@
+from django.dispatch import Signal
+
+# Sent by the send paths once new MessageRecords are written, inside the writing transaction.
+# Arguments: records (list of MessageRecord with sender and receiver users loaded)
+messages_sent = Signal()
@@ -0,0 +1,50 @@
+"""
+Health checks for persistent database connections (CONN_MAX_AGE > 0).
+Django 3.2 only retires a kept connection once a query on it has failed, so a connection the server or a proxy
+dropped while idle costs the next request an error. Kept connections are pinged at most every
+DB_HEALTH_CHECK_SECONDS before they are reused, and closed when the ping fails so the next query reconnects
+"""
+import time
+
+from django.conf import settings
+from django.core.signals import request_started
+from django.db import DatabaseError, connections
+from django.dispatch import receiver
+
+
+def check_connection(connection) -> bool:
+    """
+    Pings the open connection of this thread unless it was checked recently, closing it when the ping fails
+    :return: False when the connection was found broken and closed
+    """
+    if connection.connection is None:
+        return True
+    now = time.monotonic()
+    if now - getattr(connection, 'health_checked_at', 0) < settings.DB_HEALTH_CHECK_SECONDS:
+        return True
+    connection.health_checked_at = now
+    # Never ping in the middle of a transaction, a broken one fails the transaction anyway
+    if connection.in_atomic_block or connection.is_usable():
+        return True
+    connection.close()
+    return False
+
+
+def ensure_connection(alias: str) -> bool:
+    """
+    Connects this thread to alias (reusing a healthy kept connection)
+    :return: whether the database is reachable
+    """
+    connection = connections[alias]
+    check_connection(connection)
+    try:
+        connection.ensure_connection()
+    except DatabaseError:
+        return False
+    return True
+
+
+@receiver(request_started)
+def check_connections(**kwargs):
+    for connection in connections.all():
+        check_connection(connection)
@@ -0,0 +1,66 @@
+"""
+A user's feed: the direct messages they received and the messages of their groups, newest first, in one id order
+(both tables take their ids from storage/ids.py, so ids never collide and a cursor is a single id).
+
+Group messages are stored once per group (fan-out on read, see models/Groups.py), so the feed reads them group by
+group. The user's groups are taken in order of their last message (Group.last_message_id) and a group is only read
+while its last message is newer than the oldest row the page has so far: once the page is full, the next group, and
+every group after it, can't contribute. The first page thus reads at most limit groups however many the user is in,
+each with one range read of the (group, -id) index; deeper pages also read the groups active since the cursor
+"""
+from datetime import datetime
+from typing import List, Optional
+
+from django.db.models import F
+
+from chatApplication.models import GroupMembership, GroupMessage, MessageRecord
+from chatApplication.models.MessageRecords import sent_within
+from chatApplication.storage import ids, shards
+
+FEED_FIELDS = ('id', 'sender', 'message', 'date_sent')
+
+
+def feed_rows(user_id: int, before: Optional[int], date_range: List[datetime], limit: int) -> List[dict]:
+    """
+    :param before: only the rows with smaller ids, None for the newest
+    :return: up to limit rows {id, sender (user id), group (name, None for direct messages), message, date_sent},
+             newest first
+    """
+    return group_rows(user_id, before, date_range, limit, direct_rows(user_id, before, date_range, limit))
+
+
+def direct_rows(user_id: int, before: Optional[int], date_range: List[datetime], limit: int) -> List[dict]:
+    records = shards.all_shards(MessageRecord.objects.filter(sent_within(date_range), receiver_id=user_id))
+    if before is not None:
+        records = records.filter(id__lt=before)
+    rows = list(records.values(*FEED_FIELDS).order_by('-id')[:limit])
+    for row in rows:
+        row['group'] = None
+    return rows
+
+
+def group_rows(user_id: int, before: Optional[int], date_range: List[datetime], limit: int,
+               rows: List[dict]) -> List[dict]:
+    """
+    :param rows: rows newest first, merged with the messages of the user's groups
+    :return: the newest limit rows of both
+    """
+    oldest = ids.first_id(date_range[0]) - 1
+    memberships = GroupMembership.objects.filter(member_id=user_id, group__last_message_id__gt=F('joined_id'))
+    groups = []
+    for group_id, name, joined_id, last_message_id in memberships.values_list('group_id', 'group__name', 'joined_id',
+                                                                              'group__last_message_id'):
+        newest = last_message_id if before is None else min(last_message_id, before - 1)
+        groups.append((newest, max(joined_id, oldest), group_id, name))
+
+    for newest, after, group_id, name in sorted(groups, reverse=True):
+        if len(rows) >= limit:
+            after = max(after, rows[-1]['id'])
+            if newest <= rows[-1]['id']:
+                break
+        if newest <= after:
+            continue
+        messages = GroupMessage.objects.filter(group_id=group_id, id__gt=after, id__lte=newest)
+        group_page = [dict(row, group=name) for row in messages.values(*FEED_FIELDS).order_by('-id')[:limit]]
+        rows = shards.merge([rows, group_page], key=lambda row: row['id'], limit=limit)
+    return rows
@@ -0,0 +1,149 @@
+"""
+Time ordered 64-bit message ids, made in process without a round trip to the database.
+
+An id is the millisecond it stands for (since EPOCH, 41 bits), the worker id of the process that made it (10 bits)
+and a sequence number within that millisecond (12 bits). Ids sort by time to the millisecond, and the ids of one
+millisecond by the order they were made in, so ordering messages by id needs no tiebreak column and a date range
+maps to an id range (id_range). Two processes writing at the same time must not share a worker id:
+settings.MESSAGE_ID_WORKER_ID, required outside DEBUG. The process id modulo 1024, its DEBUG fallback, only tells
+apart the processes of one host: containers all run as the same few pids.
+
+An id stands for the time it is made for, its message's date_sent, not the time it is made at: a message saved
+late or imported gets an id of its past millisecond. The generator remembers the sequence numbers of the last
+MESSAGE_ID_SEQUENCE_TABLE_SIZE milliseconds it used; a millisecond it has forgotten, or one whose 4096 sequence
+numbers are used up, gets an id of the next millisecond it can still use. An id's time is never before its message
+was sent, and only later in those cases
+"""
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional, Tuple
+
+import pytz
+from django.conf import settings
+from django.core import checks
+from django.core.exceptions import ImproperlyConfigured
+
+EPOCH = datetime(2020, 1, 1, tzinfo=pytz.UTC)  # ids of earlier times are negative
+WORKER_BITS = 10
+SEQUENCE_BITS = 12
+TIME_SHIFT = WORKER_BITS + SEQUENCE_BITS
+MAX_WORKER_ID = (1 << WORKER_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+MILLISECOND = timedelta(milliseconds=1)
+WORKER_ID_ERROR = 'MESSAGE_ID_WORKER_ID must be set outside DEBUG, to a worker id (0-1023) of its own for each ' \
+                  'process writing messages'
+
+
+def millisecond(moment: datetime) -> int:
+    """Whole milliseconds from EPOCH to moment (timezone aware)"""
+    return (moment - EPOCH) // MILLISECOND
+
+
+def first_id(moment: datetime) -> int:
+    """The smallest id of moment's millisecond"""
+    return millisecond(moment) << TIME_SHIFT
+
+
+def last_id(moment: datetime) -> int:
+    """The largest id of moment's millisecond"""
+    return ((millisecond(moment) + 1) << TIME_SHIFT) - 1
+
+
+def id_range(start: datetime, end: datetime) -> Tuple[int, int]:
+    """[first, last] id of the messages sent from start to end, both included"""
+    return first_id(start), last_id(end)
+
+
+def id_time(message_id: int) -> datetime:
+    """The millisecond an id stands for"""
+    return EPOCH + (message_id >> TIME_SHIFT) * MILLISECOND
+
+
+class IdGenerator:
+
+    def __init__(self, worker_id: int, table_size: int):
+        if not 0 <= worker_id <= MAX_WORKER_ID:
+            raise ValueError(f'worker id must be from 0 to {MAX_WORKER_ID}')
+        self.worker_id = worker_id
+        self.table_size = max(table_size, 2)
+        self._sequences = {}  # millisecond -> last sequence number used
+        self._forgotten = None  # latest millisecond dropped from _sequences, no earlier one is used again
+        self._lock = threading.Lock()
+
+    def next_id(self, at: Optional[datetime] = None) -> int:
+        """
+        :param at: the time the id stands for, now by default
+        """
+        return self.next_ids([at])[0]
+
+    def next_ids(self, times: Iterable[Optional[datetime]]) -> List[int]:
+        """One id per time (None is now), in order, taking the lock once"""
+        now = None
+        milliseconds = []
+        for at in times:
+            if at is None:
+                now = now or datetime.now(pytz.UTC)
+                at = now
+            milliseconds.append(millisecond(at))
+        with self._lock:
+            return [self._take(ms) for ms in milliseconds]
+
+    def _take(self, ms: int) -> int:
+        if self._forgotten is not None and ms <= self._forgotten:
+            ms = self._forgotten + 1
+        sequence = self._sequences.get(ms, -1) + 1
+        while sequence > MAX_SEQUENCE:
+            ms += 1
+            sequence = self._sequences.get(ms, -1) + 1
+        self._sequences[ms] = sequence
+        if len(self._sequences) > self.table_size:
+            self._forget()
+        return (ms << TIME_SHIFT) + (self.worker_id << SEQUENCE_BITS) + sequence
+
+    def _forget(self):
+        """Drops the earlier half of the milliseconds, sorting once per table_size / 2 new ones"""
+        earlier = sorted(self._sequences)[:len(self._sequences) // 2]
+        for ms in earlier:
+            del self._sequences[ms]
+        self._forgotten = earlier[-1]
+
+
+_generator = None
+_generator_lock = threading.Lock()
+
+
+def get_id_generator() -> IdGenerator:
+    global _generator
+    with _generator_lock:
+        if _generator is None:
+            worker_id = settings.MESSAGE_ID_WORKER_ID
+            if worker_id is None and not settings.DEBUG:
+                raise ImproperlyConfigured(WORKER_ID_ERROR)
+            _generator = IdGenerator(os.getpid() % (MAX_WORKER_ID + 1) if worker_id is None else worker_id,
+                                     settings.MESSAGE_ID_SEQUENCE_TABLE_SIZE)
+        return _generator
+
+
+def _reset_after_fork():
+    # A forked child must not go on with its parent's sequences; under DEBUG it gets a worker id of its own pid
+    global _generator, _generator_lock
+    _generator, _generator_lock = None, threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def check_worker_id(app_configs, **kwargs) -> List[checks.CheckMessage]:
+    """Refuses to start without a worker id outside DEBUG, rather than at the first message sent"""
+    if settings.MESSAGE_ID_WORKER_ID is None and not settings.DEBUG:
+        return [checks.Error(WORKER_ID_ERROR, id='chatApplication.E001')]
+    return []
+
+
+def next_id(at: Optional[datetime] = None) -> int:
+    return (_generator or get_id_generator()).next_id(at)
+
+
+def next_ids(times: Iterable[Optional[datetime]]) -> List[int]:
+    return (_generator or get_id_generator()).next_ids(times)
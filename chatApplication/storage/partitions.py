@@ -0,0 +1,149 @@
+"""
+Monthly time buckets of MessageRecord by date_sent.
+
+postgres: the table is natively partitioned by range on date_sent (migration 0005), one partition per month
+named <table>_pYYYY_MM plus a <table>_default catch-all. Range reads only scan the partitions overlapping
+their window, and expired months are detached (kept as standalone tables) or dropped whole.
+
+Other databases (SQLite for local testing) keep one live table; expired months are moved out into
+<table>_pYYYY_MM archive tables, one per bucket.
+"""
+from datetime import datetime, timedelta
+from typing import List, Tuple
+
+import pytz
+from django.db import transaction
+from django.db.backends.base.base import BaseDatabaseWrapper
+
+from chatApplication.models import MessageRecord, SearchToken
+
+
+TABLE = MessageRecord._meta.db_table
+DEFAULT_PARTITION = f'{TABLE}_default'
+
+
+def month_start(moment: datetime) -> datetime:
+    return moment.astimezone(pytz.UTC).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def add_months(month: datetime, months: int) -> datetime:
+    index = month.year * 12 + month.month - 1 + months
+    return month.replace(year=index // 12, month=index % 12 + 1)
+
+
+def partition_name(month: datetime) -> str:
+    return f'{TABLE}_p{month.year:04}_{month.month:02}'
+
+
+def month_of_partition(name: str) -> datetime:
+    year, month = name[len(TABLE) + 2:].split('_')
+    return datetime(int(year), int(month), 1, tzinfo=pytz.UTC)
+
+
+def is_partitioned(connection: BaseDatabaseWrapper) -> bool:
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT relkind FROM pg_class WHERE oid = %s::regclass', [connection.ops.quote_name(TABLE)])
+        row = cursor.fetchone()
+    return row is not None and row[0] == 'p'
+
+
+def bucket_tables(connection: BaseDatabaseWrapper) -> List[str]:
+    """
+    :return: partitions (postgres) or archive tables (others) named after a month, oldest first
+    """
+    prefix = f'{TABLE}_p'
+    return sorted(name for name in connection.introspection.table_names(include_views=False)
+                  if name.startswith(prefix) and name[len(prefix):].replace('_', '').isdigit())
+
+
+def attached_partitions(connection: BaseDatabaseWrapper) -> List[str]:
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid '
+                       'WHERE i.inhparent = %s::regclass', [connection.ops.quote_name(TABLE)])
+        return sorted(row[0] for row in cursor.fetchall() if row[0] != DEFAULT_PARTITION)
+
+
+def create_partition(connection: BaseDatabaseWrapper, month: datetime):
+    """
+    Creates the month's partition, moving any of its rows out of the default partition first
+    (postgres refuses to attach a range the default partition holds rows for)
+    """
+    qn = connection.ops.quote_name
+    name, start, end = partition_name(month), month, add_months(month, 1)
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        cursor.execute(f'CREATE TABLE {qn(name)} '
+                       f'(LIKE {qn(TABLE)} INCLUDING DEFAULTS INCLUDING GENERATED INCLUDING CONSTRAINTS)')
+        cursor.execute(f'WITH moved AS (DELETE FROM {qn(DEFAULT_PARTITION)} '
+                       f'WHERE date_sent >= %s AND date_sent < %s RETURNING *) '
+                       f'INSERT INTO {qn(name)} SELECT * FROM moved', [start, end])
+        cursor.execute(f'ALTER TABLE {qn(TABLE)} ATTACH PARTITION {qn(name)} FOR VALUES FROM (%s) TO (%s)',
+                       [start, end])
+
+
+def ensure_partitions(connection: BaseDatabaseWrapper, ahead: int, now: datetime = None) -> List[str]:
+    """
+    Creates the partitions from the current month through `ahead` months in the future
+    :return: names of the created partitions
+    """
+    if not is_partitioned(connection):
+        return []
+    current = month_start(now or datetime.now(pytz.UTC))
+    existing = set(attached_partitions(connection))
+    created = []
+    for offset in range(0, ahead + 1):
+        month = add_months(current, offset)
+        if partition_name(month) not in existing:
+            create_partition(connection, month)
+            created.append(partition_name(month))
+    return created
+
+
+def expired_buckets(connection: BaseDatabaseWrapper, retention_days: int,
+                    now: datetime = None) -> List[Tuple[datetime, datetime]]:
+    """
+    :return: (start, end) of every month that ended before the retention cutoff and still has live data
+    """
+    cutoff = (now or datetime.now(pytz.UTC)) - timedelta(days=retention_days)
+    if is_partitioned(connection):
+        months = [month_of_partition(name) for name in attached_partitions(connection)]
+    else:
+        oldest = MessageRecord.objects.using(connection.alias).order_by('date_sent').values_list(
+            'date_sent', flat=True).first()
+        months = []
+        month = month_start(oldest) if oldest else None
+        while month is not None and add_months(month, 1) <= cutoff:
+            months.append(month)
+            month = add_months(month, 1)
+    return [(month, add_months(month, 1)) for month in months if add_months(month, 1) <= cutoff]
+
+
+def expire_bucket(connection: BaseDatabaseWrapper, start: datetime, end: datetime, archive: bool) -> int:
+    """
+    Takes one expired month out of the live table.
+    postgres: detaches its partition, dropping it unless archive.
+    others: moves its rows into the month's archive table (or just deletes them unless archive),
+    archived messages are taken out of the search index
+    :return: number of rows taken out, -1 when unknown (a detached partition is not counted)
+    """
+    qn = connection.ops.quote_name
+    name = partition_name(start)
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        if is_partitioned(connection):
+            cursor.execute(f'ALTER TABLE {qn(TABLE)} DETACH PARTITION {qn(name)}')
+            if not archive:
+                cursor.execute(f'DROP TABLE {qn(name)}')
+            return -1
+
+        if archive:
+            if name in bucket_tables(connection):
+                cursor.execute(f'INSERT INTO {qn(name)} SELECT * FROM {qn(TABLE)} '
+                               f'WHERE date_sent >= %s AND date_sent < %s', [start, end])
+            else:
+                cursor.execute(f'CREATE TABLE {qn(name)} AS SELECT * FROM {qn(TABLE)} '
+                               f'WHERE date_sent >= %s AND date_sent < %s', [start, end])
+        deleted, _ = MessageRecord.objects.using(connection.alias).filter(
+            date_sent__gte=start, date_sent__lt=end).delete()
+        SearchToken.objects.using(connection.alias).filter(date_sent__gte=start, date_sent__lt=end).delete()
+        return deleted
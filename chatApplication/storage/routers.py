@@ -0,0 +1,226 @@
+"""
+Read replica routing.
+Views decorated with replica_reads read from settings.DATABASE_REPLICAS, picked round robin per request;
+everything else, and every write, uses the primary (default). A replica that cannot be reached, or fails a
+query, is ejected for REPLICA_EJECT_SECONDS and the view is answered by the primary meanwhile.
+A client that wrote is pinned to the primary for REPLICA_PIN_SECONDS by a cookie, so it reads its own writes however
+far the replicas lag. Only the cookie pins: an address is shared by every client behind the same NAT or proxy
+"""
+import asyncio
+import contextvars
+import functools
+import threading
+import time
+from typing import Optional, Sequence
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, InterfaceError, OperationalError
+
+from chatApplication.storage.connections import ensure_connection
+
+
+class RoutingState:
+    """Routing decisions of one request"""
+    __slots__ = ('pinned', 'replica_reads', 'replica', 'wrote')
+
+    def __init__(self, pinned: bool = False):
+        self.pinned = pinned  # the client wrote recently, read from the primary
+        self.replica_reads = False  # inside a replica_reads view
+        self.replica = None  # alias chosen for this request's reads, so a page reads from one database
+        self.wrote = False
+
+
+routing = contextvars.ContextVar('database_routing', default=None)
+
+
+class ReplicaPool:
+    """Round robin over replica aliases, skipping ejected ones"""
+
+    def __init__(self, aliases: Sequence[str]):
+        self.aliases = tuple(aliases)
+        self._next = 0
+        self._ejected = {}  # alias -> monotonic time it is retried at
+        self._lock = threading.Lock()
+
+    def candidates(self) -> list:
+        """Aliases not ejected, starting with the next in turn"""
+        with self._lock:
+            now = time.monotonic()
+            start = self._next
+            self._next = (self._next + 1) % max(len(self.aliases), 1)
+            ordered = self.aliases[start:] + self.aliases[:start]
+            return [alias for alias in ordered if self._ejected.get(alias, 0) <= now]
+
+    def choose(self) -> Optional[str]:
+        """
+        :return: the next reachable replica, None when none is
+        """
+        for alias in self.candidates():
+            if ensure_connection(alias):
+                return alias
+            self.eject(alias)
+        return None
+
+    def eject(self, alias: str):
+        with self._lock:
+            self._ejected[alias] = time.monotonic() + settings.REPLICA_EJECT_SECONDS
+
+    def healthy(self) -> list:
+        now = time.monotonic()
+        with self._lock:
+            return [alias for alias in self.aliases if self._ejected.get(alias, 0) <= now]
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_replica_pool() -> ReplicaPool:
+    global _pool
+    aliases = tuple(settings.DATABASE_REPLICAS)
+    with _pool_lock:
+        if _pool is None or _pool.aliases != aliases:
+            _pool = ReplicaPool(aliases)
+        return _pool
+
+
+class ReplicaRouter:
+    """settings.DATABASE_ROUTERS entry, see the module docstring"""
+
+    def db_for_read(self, model, **hints):
+        return replica_alias()
+
+    def db_for_write(self, model, **hints):
+        state = routing.get()
+        if state is not None:
+            state.wrote = True
+        # Django would save an instance back to the database it was read from
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db in settings.DATABASE_REPLICAS:
+            return DEFAULT_DB_ALIAS
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get the schema through replication
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
+
+
+def replica_alias() -> Optional[str]:
+    """
+    :return: the replica reads at this point of the request go to, None for the primary
+    """
+    state = routing.get()
+    if state is None or not state.replica_reads or state.pinned:
+        return None
+    if state.replica is None:
+        state.replica = get_replica_pool().choose() or DEFAULT_DB_ALIAS
+    return None if state.replica == DEFAULT_DB_ALIAS else state.replica
+
+
+def _retry_on_primary(state: RoutingState) -> bool:
+    """After a failed query: ejects the replica the request read from, if any, and routes to the primary"""
+    state.replica_reads = False
+    if state.replica in (None, DEFAULT_DB_ALIAS):
+        return False
+    get_replica_pool().eject(state.replica)
+    state.replica = None
+    return True
+
+
+def replica_reads(func):
+    """
+    Reads of the view go to a replica, unless the client is pinned to the primary.
+    Views must not write. A view whose replica fails mid request runs again on the primary.
+    Has no effect without ReplicaRoutingMiddleware
+    """
+    if asyncio.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_inner(*args, **kwargs):
+            state = routing.get()
+            if state is None or state.pinned:
+                return await func(*args, **kwargs)
+            state.replica_reads = True
+            try:
+                return await func(*args, **kwargs)
+            except (OperationalError, InterfaceError):
+                if not _retry_on_primary(state):
+                    raise
+                return await func(*args, **kwargs)
+            finally:
+                state.replica_reads = False
+
+        return async_inner
+
+    @functools.wraps(func)
+    def inner(*args, **kwargs):
+        state = routing.get()
+        if state is None or state.pinned:
+            return func(*args, **kwargs)
+        state.replica_reads = True
+        try:
+            return func(*args, **kwargs)
+        except (OperationalError, InterfaceError):
+            if not _retry_on_primary(state):
+                raise
+            return func(*args, **kwargs)
+        finally:
+            state.replica_reads = False
+
+    return inner
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Tracks the routing state of every request and pins clients that wrote to the primary.
+    A no-op while settings.DATABASE_REPLICAS is empty
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self._async = asyncio.iscoroutinefunction(get_response)
+        if self._async:
+            # Marks the instance as a coroutine function for the handler, like django's MiddlewareMixin
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if self._async:
+            return self.__acall__(request)
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+        state = RoutingState(pinned=self.is_pinned(request))
+        token = routing.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            routing.reset(token)
+        return self.pin(request, response, state)
+
+    async def __acall__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return await self.get_response(request)
+        state = RoutingState(pinned=self.is_pinned(request))
+        token = routing.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            routing.reset(token)
+        return self.pin(request, response, state)
+
+    def is_pinned(self, request) -> bool:
+        return settings.REPLICA_PIN_COOKIE in request.COOKIES
+
+    def pin(self, request, response, state: RoutingState):
+        if state.wrote:
+            response.set_cookie(settings.REPLICA_PIN_COOKIE, '1', max_age=settings.REPLICA_PIN_SECONDS,
+                                httponly=True, samesite='Lax')
+        return response
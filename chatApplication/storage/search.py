@@ -0,0 +1,73 @@
+"""
+Full-text search over message content.
+postgres: MessageRecord.search_vector (generated tsvector, GIN indexed, see migration 0007) ranked with ts_rank.
+Others: the SearchToken inverted index, ranked by how often the terms occur in the message.
+Either way every term must match, and results are ordered by rank, then newest first
+"""
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from django.db import connections, router
+from django.db.models import BooleanField, Count, FloatField, Q, QuerySet, Sum
+from django.db.models.expressions import RawSQL
+
+from chatApplication.models import MessageRecord, SearchToken
+from chatApplication.models.MessageRecords import sent_within
+
+
+Position = Tuple[float, int]  # rank, id of the last result of a page
+
+FIELDS = ('id', 'sender', 'receiver', 'date_sent', 'message')
+
+
+def search_messages(terms: List[str], conversations: QuerySet, date_range: List[datetime],
+                    after: Optional[Position], limit: int, using: Optional[str] = None) -> List[dict]:
+    """
+    :param terms: tokenized query, not empty
+    :param conversations: ids of the conversations to search
+    :param date_range: [start, end] of date_sent
+    :param after: keyset position to continue after, None for the first page
+    :param limit: rows to return at most
+    :param using: database (message shard) to search, None lets the routers pick
+    :return: matching messages (FIELDS and rank), best first
+    """
+    if connections[using or router.db_for_read(MessageRecord)].vendor == 'postgresql':
+        return search_vector_matches(terms, conversations, date_range, after, limit, using)
+    return token_index_matches(terms, conversations, date_range, after, limit, using)
+
+
+def after_position(after: Optional[Position], id_field: str) -> Q:
+    if after is None:
+        return Q()
+    rank, record_id = after
+    return Q(rank__lt=rank) | Q(rank=rank, **{f'{id_field}__lt': record_id})
+
+
+def search_vector_matches(terms, conversations, date_range, after, limit, using=None) -> List[dict]:
+    connection = connections[using or router.db_for_read(MessageRecord)]
+    vector = f'{connection.ops.quote_name(MessageRecord._meta.db_table)}.search_vector'
+    query = ' '.join(terms)
+    return list(MessageRecord.objects.using(using).filter(
+        RawSQL(f"{vector} @@ plainto_tsquery('simple', %s)", [query], output_field=BooleanField()),
+        sent_within(date_range),
+        conversation__in=conversations,
+    ).annotate(
+        rank=RawSQL(f"ts_rank({vector}, plainto_tsquery('simple', %s))", [query], output_field=FloatField()),
+    ).filter(after_position(after, 'id')).values(*FIELDS, 'rank').order_by('-rank', '-id')[:limit])
+
+
+def token_index_matches(terms, conversations, date_range, after, limit, using=None) -> List[dict]:
+    terms = set(terms)
+    matches = list(SearchToken.objects.using(using).filter(
+        token__in=terms,
+        conversation_id__in=conversations,
+        date_sent__range=date_range,
+    ).values('message_id').annotate(
+        matched=Count('token'), rank=Sum('frequency'),
+    ).filter(Q(matched=len(terms)) & after_position(after, 'message_id')).order_by(
+        '-rank', '-message_id').values_list('message_id', 'rank')[:limit])
+
+    records = {record['id']: record for record in MessageRecord.objects.using(using).filter(
+        id__in=[message_id for message_id, _ in matches]).values(*FIELDS)}
+    # Skips messages removed since they were indexed (expired by manage_partitions)
+    return [dict(records[message_id], rank=float(rank)) for message_id, rank in matches if message_id in records]
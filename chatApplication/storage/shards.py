@@ -0,0 +1,309 @@
+"""
+Message sharding across the database aliases in settings.MESSAGE_SHARDS.
+
+A conversation lives on one shard, picked by a jump consistent hash of its (sender, receiver) usernames:
+its Conversation row, MessageRecords and SearchTokens are all there, so sending writes one shard and a
+conversation's history is read from one shard. Reads spanning conversations (retrieve_all, sync, search)
+query every shard in parallel and merge. Growing the list of shards moves only the conversations the new
+shards take over (about 1/N each), see the rebalance_shards command.
+
+Users are created on the default database, which also keeps the inbox, and replicated (same id and username)
+to a shard the first time they take part in a conversation stored there, so foreign keys hold on every shard.
+With the default single shard ('default') nothing changes
+"""
+import contextvars
+import hashlib
+import heapq
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from itertools import chain, islice
+from typing import Callable, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, close_old_connections, connections, transaction
+from django.db.models import QuerySet
+from django.db.models.query import ValuesIterable, ValuesListIterable
+
+from chatApplication.caches.lru_cache import LRUCache
+from chatApplication.models import Conversation, MessageRecord, SearchToken
+from chatApplication.models.Users import User
+from chatApplication.storage.connections import check_connections
+
+# (shard, user id) of users known to be replicated, only ever filled with committed rows
+replicated_users = LRUCache(max_size=settings.USER_CACHE_SIZE, ttl=settings.USER_CACHE_TTL, name='shard_users')
+
+
+def jump_hash(key: int, buckets: int) -> int:
+    """
+    Jump consistent hash (Lamping, Veach 2014): going from n to n + 1 buckets moves 1 / (n + 1) of the keys,
+    all of them into the new bucket
+    """
+    bucket, jump = -1, 0
+    while jump < buckets:
+        bucket = jump
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        jump = int((bucket + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return bucket
+
+
+def pair_key(sender_username: str, receiver_username: str) -> int:
+    """Stable across processes and restarts, unlike hash()"""
+    digest = hashlib.blake2b(f'{sender_username}\n{receiver_username}'.encode('utf8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big')
+
+
+def shard_for(sender_username: str, receiver_username: str, shards: Sequence[str] = None) -> str:
+    shards = shards or settings.MESSAGE_SHARDS
+    if len(shards) == 1:
+        return shards[0]
+    return shards[jump_hash(pair_key(sender_username, receiver_username), len(shards))]
+
+
+@contextmanager
+def atomic(*shards: str):
+    """
+    One transaction on the default database and on each shard, committed innermost (shards) first.
+    Not atomic across databases: a failure between the commits leaves the shards' writes committed alone
+    """
+    with ExitStack() as stack:
+        for alias in dict.fromkeys((DEFAULT_DB_ALIAS, *shards)):
+            stack.enter_context(transaction.atomic(using=alias))
+        yield
+
+
+def replicate_users(shard: str, users: Iterable[User]):
+    """Copies users missing from the shard, with their ids. Runs inside the shard's transaction"""
+    if shard == DEFAULT_DB_ALIAS:
+        return
+    missing = {user.id: user for user in users if replicated_users.get((shard, user.id)) is None}
+    if not missing:
+        return
+    User.objects.using(shard).bulk_create([User(id=user.id, username=user.username) for user in missing.values()],
+                                          ignore_conflicts=True)
+    keys = [(shard, user_id) for user_id in missing]
+
+    def cache_replicated():
+        for key in keys:
+            replicated_users.set(key, True)
+
+    transaction.on_commit(cache_replicated, using=shard)
+
+
+def shards_for(pairs: Iterable[tuple]) -> List[str]:
+    """
+    :param pairs: (sender username, receiver username, ...) tuples
+    :return: the distinct shards storing them
+    """
+    return list(dict.fromkeys(shard_for(pair[0], pair[1]) for pair in pairs))
+
+
+def using(shard: str) -> Optional[str]:
+    """
+    The using argument for a shard. None for the default database, which is left to the routers
+    (replica reads, pinning writers)
+    """
+    return None if shard == DEFAULT_DB_ALIAS else shard
+
+
+def bulk_send(records: List[MessageRecord], copy: bool = False) -> List[MessageRecord]:
+    """
+    MessageRecord.objects.bulk_send (with copy) on every records' shard, replicating their users first.
+    Must run inside atomic(*shards of the records)
+    :return: the inserted records, in order
+    """
+    groups = {}
+    for record in records:
+        groups.setdefault(shard_for(record.sender.username, record.receiver.username), []).append(record)
+    for shard, group in groups.items():
+        replicate_users(shard, chain.from_iterable((record.sender, record.receiver) for record in group))
+        MessageRecord.objects.db_manager(using(shard)).bulk_send(group, copy=copy)
+    return records
+
+
+"""
+#############################
+Scatter-gather              #
+#############################
+"""
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_scatter_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.SHARD_SCATTER_POOL_SIZE, thread_name_prefix='shard')
+        return _executor
+
+
+def _run_on_shard(func: Callable, shard: str):
+    # Worker threads outlive requests, so they retire stale connections like the request cycle would
+    close_old_connections()
+    check_connections()
+    try:
+        return func(shard)
+    finally:
+        close_old_connections()
+
+
+def scatter(func: Callable[[str], object], shards: Sequence[str] = None) -> list:
+    """
+    Calls func(shard) for every shard, in parallel on the scatter pool when there are several shards and
+    SHARD_SCATTER_POOL_SIZE > 0 (0 runs them one after the other on the calling thread and its connections,
+    e.g. inside a test transaction)
+    :return: the results, in shard order
+    """
+    shards = shards or settings.MESSAGE_SHARDS
+    if len(shards) == 1 or not settings.SHARD_SCATTER_POOL_SIZE:
+        return [func(shard) for shard in shards]
+    executor = get_scatter_executor()
+    # Carries context variables (e.g. the request's metrics) into the worker threads
+    futures = [executor.submit(contextvars.copy_context().run, _run_on_shard, func, shard) for shard in shards]
+    return [future.result() for future in futures]
+
+
+def merge(rows_per_shard: Iterable[list], key: Callable, limit: int = None, reverse: bool = True) -> list:
+    """
+    K-way merge of per shard rows sorted by key (descending with reverse)
+    :return: the first limit merged rows
+    """
+    return list(islice(heapq.merge(*rows_per_shard, key=key, reverse=reverse), limit))
+
+
+class ShardedQuerySet:
+    """
+    A queryset over every shard, enough for the paginators: filter, values, values_list and order_by build it,
+    count() adds up the shards' counts and a slice [start:stop] reads the first stop rows of every shard and
+    merges them. Deep offsets are as costly as they look, keyset pagination (a filter past the last id) is not.
+    Ordered newest first by a single field unique across shards, id (see chatApplication.storage.ids)
+    """
+
+    def __init__(self, queryset: QuerySet, shards: Sequence[str]):
+        self.queryset = queryset
+        self.shards = shards
+
+    def _chain(self, queryset: QuerySet) -> 'ShardedQuerySet':
+        return ShardedQuerySet(queryset, self.shards)
+
+    def filter(self, *args, **kwargs) -> 'ShardedQuerySet':
+        return self._chain(self.queryset.filter(*args, **kwargs))
+
+    def values(self, *fields) -> 'ShardedQuerySet':
+        return self._chain(self.queryset.values(*fields))
+
+    def values_list(self, *fields) -> 'ShardedQuerySet':
+        return self._chain(self.queryset.values_list(*fields))
+
+    def order_by(self, *fields) -> 'ShardedQuerySet':
+        return self._chain(self.queryset.order_by(*fields))
+
+    @property
+    def ordered(self) -> bool:
+        return self.queryset.ordered
+
+    def count(self) -> int:
+        return sum(scatter(lambda shard: self.queryset.using(using(shard)).count(), self.shards))
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice) or item.step is not None or item.stop is None:
+            raise TypeError('ShardedQuerySet only supports [start:stop] slices')
+        key = row_key(self.queryset, (self.ordering(),))
+        return merge(scatter(lambda shard: list(self.queryset.using(using(shard))[:item.stop]), self.shards),
+                     key, item.stop)[item.start or 0:]
+
+    def ordering(self) -> str:
+        ordering = self.queryset.query.order_by
+        if len(ordering) != 1 or not ordering[0].startswith('-'):
+            raise TypeError('ShardedQuerySet must be ordered by one field, descending')
+        return ordering[0][1:]
+
+
+def row_key(queryset: QuerySet, names: Sequence[str]) -> Callable:
+    """
+    :return: the values of the fields names of a row of the queryset (model instance, values or values_list row),
+             None for fields the row lacks
+    """
+    fields = queryset._fields
+    if queryset._iterable_class is ValuesListIterable:
+        positions = [fields.index(name) if name in fields else None for name in names]
+        return lambda row: tuple(None if position is None else row[position] for position in positions)
+    if queryset._iterable_class is ValuesIterable:
+        return lambda row: tuple(row.get(name) for name in names)
+    return lambda row: tuple(getattr(row, name) for name in names)
+
+
+def all_shards(queryset: QuerySet):
+    """
+    :return: the queryset, over every shard: itself when there is a single one, else its ShardedQuerySet
+    """
+    if len(settings.MESSAGE_SHARDS) == 1:
+        return queryset
+    return ShardedQuerySet(queryset, settings.MESSAGE_SHARDS)
+
+
+class ShardRouter:
+    """settings.DATABASE_ROUTERS entry: rows of different shards and of the default database may be related"""
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.MESSAGE_SHARDS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+"""
+#############################
+Rebalancing                 #
+#############################
+"""
+
+
+def misplaced_conversations(shard: str, batch_size: int) -> Iterator[Tuple[int, str, str, str]]:
+    """
+    Conversations stored on shard that shard_for now assigns elsewhere, read batch_size at a time
+    :return: (conversation id, sender username, receiver username, target shard) tuples
+    """
+    last_id = 0
+    while True:
+        batch = list(Conversation.objects.using(shard).filter(id__gt=last_id).order_by('id').values_list(
+            'id', 'sender__username', 'receiver__username')[:batch_size])
+        if not batch:
+            return
+        last_id = batch[-1][0]
+        for conversation_id, sender_username, receiver_username in batch:
+            target = shard_for(sender_username, receiver_username)
+            if target != shard:
+                yield conversation_id, sender_username, receiver_username, target
+
+
+def move_conversation(conversation_id: int, source: str, target: str, batch_size: int) -> int:
+    """
+    Moves a conversation's messages (and search tokens) from source to target batch_size at a time, then the
+    conversation itself. Messages keep their ids, which are unique across shards. Every batch commits on target
+    before it is deleted from source, so a failure may leave messages on both shards but never on neither.
+    Does not send messages_sent: they are not new messages
+    :return: messages moved
+    """
+    moved = 0
+    while True:
+        with transaction.atomic(using=source):
+            with transaction.atomic(using=target):
+                batch = list(MessageRecord.objects.using(source).filter(conversation_id=conversation_id)
+                             .select_related('sender', 'receiver').order_by('id')[:batch_size])
+                if not batch:
+                    break
+                replicate_users(target, {record.sender for record in batch} | {record.receiver for record in batch})
+                copies = MessageRecord.objects.db_manager(target).bulk_send([
+                    MessageRecord(id=record.id, sender=record.sender, receiver=record.receiver,
+                                  message=record.message, date_sent=record.date_sent) for record in batch])
+                if connections[target].vendor != 'postgresql':
+                    SearchToken.objects.db_manager(target).index_messages(copies)
+            ids = [record.id for record in batch]
+            SearchToken.objects.using(source).filter(message_id__in=ids).delete()
+            MessageRecord.objects.using(source).filter(id__in=ids).delete()
+        moved += len(batch)
+    Conversation.objects.using(source).filter(id=conversation_id).delete()
+    return moved
@@ -0,0 +1,323 @@
+"""
+Bulk export and import of users and message history (the export_history and import_history commands).
+Files are NDJSON (one JSON object per line) or CSV with a header row, gzip compressed when the name ends in .gz.
+
+Exports read through QuerySet.iterator, a server side cursor on postgres, STREAM_CHUNK_SIZE rows at a time, so
+memory stays flat whatever the number of rows; messages of every shard are merged oldest first, their user ids
+mapped back to usernames a chunk at a time.
+Imports resolve usernames and conversations a batch at a time and write each batch in one transaction per database,
+with COPY on postgres. A checkpoint (rows imported so far) is saved after every batch, an interrupted import
+started again with the same checkpoint skips the rows already imported. A run stopped between a batch's commit and
+its checkpoint leaves that batch imported but not recorded: the first batch of a resumed run only imports the
+messages not stored yet
+"""
+import csv
+import gzip
+import heapq
+import io
+import json
+import os
+import sys
+import time
+from collections import Counter
+from datetime import datetime
+from itertools import islice
+from typing import IO, Callable, Iterable, Iterator, List, Optional
+
+import pytz
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Q, QuerySet
+
+from chatApplication.caches.versions import bump_message_versions
+from chatApplication.models import InboxEntry, MessageRecord
+from chatApplication.models.MessageRecords import with_usernames
+from chatApplication.models.MessageVolumes import record_message_volumes
+from chatApplication.models.SearchTokens import index_messages
+from chatApplication.models.Users import User
+from chatApplication.storage import shards
+
+FIELDS = {
+    'users': ('id', 'username'),
+    'messages': ('id', 'sender', 'receiver', 'date_sent', 'message'),
+}
+FORMATS = ('ndjson', 'csv')
+GZIP_MAGIC = b'\x1f\x8b'
+
+
+def file_format(path: str, requested: Optional[str] = None) -> str:
+    """
+    :return: requested, else csv for *.csv and *.csv.gz files, else ndjson
+    """
+    if requested:
+        return requested
+    return 'csv' if (path[:-3] if path.endswith('.gz') else path).endswith('.csv') else 'ndjson'
+
+
+def open_output(path: str) -> IO[str]:
+    """Text file to write, gzip compressed for *.gz; '-' is stdout"""
+    if path == '-':
+        return io.TextIOWrapper(sys.stdout.buffer, encoding='utf8', newline='', write_through=True)
+    if path.endswith('.gz'):
+        return gzip.open(path, 'wt', encoding='utf8', newline='')
+    return open(path, 'w', encoding='utf8', newline='')
+
+
+def open_input(path: str) -> IO[str]:
+    """Text file to read, decompressed when gzip compressed (whatever its name); '-' is stdin"""
+    raw = sys.stdin.buffer if path == '-' else open(path, 'rb')
+    if raw.peek(2)[:2] == GZIP_MAGIC:
+        raw = gzip.GzipFile(fileobj=raw)
+    return io.TextIOWrapper(raw, encoding='utf8', newline='')
+
+
+"""
+#############################
+Export                      #
+#############################
+"""
+
+
+def export_rows(kind: str, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                username: Optional[str] = None) -> Iterator[dict]:
+    """
+    :param kind: users or messages
+    :param start: messages sent at or after start
+    :param end: messages sent before end
+    :param username: only this user, or the messages they sent or received
+    :return: the FIELDS of every row, read STREAM_CHUNK_SIZE rows at a time
+    """
+    if kind == 'users':
+        users = User.objects.order_by('id').values(*FIELDS['users'])
+        if username:
+            users = users.filter(username=username)
+        return users.iterator(chunk_size=settings.STREAM_CHUNK_SIZE)
+
+    messages = MessageRecord.objects.order_by('id').values(*FIELDS['messages'])
+    if start:
+        messages = messages.filter(date_sent__gte=start)
+    if end:
+        messages = messages.filter(date_sent__lt=end)
+    if username:
+        user = User.objects.filter(username=username).first()
+        if user is None:
+            return iter(())
+        messages = messages.filter(Q(sender_id=user.id) | Q(receiver_id=user.id))
+    return (row for chunk in batches(merge_shards(messages), settings.STREAM_CHUNK_SIZE)
+            for row in with_usernames(chunk))
+
+
+def merge_shards(messages: QuerySet) -> Iterator[dict]:
+    """Every shard's messages, merged oldest first (by their time ordered ids), with one open cursor per shard"""
+    cursors = [messages.using(shards.using(shard)).iterator(chunk_size=settings.STREAM_CHUNK_SIZE)
+               for shard in settings.MESSAGE_SHARDS]
+    if len(cursors) == 1:
+        return cursors[0]
+    return heapq.merge(*cursors, key=lambda row: row['id'])
+
+
+def write_rows(rows: Iterable[dict], out: IO[str], fields: tuple, output_format: str,
+               progress: Callable[[int], None] = None) -> int:
+    """
+    :param progress: called with the number of rows written every STREAM_CHUNK_SIZE rows
+    :return: rows written
+    """
+    count = 0
+    if output_format == 'csv':
+        writer = csv.writer(out)
+        writer.writerow(fields)
+
+        def encode(row: dict):
+            writer.writerow([value.isoformat() if isinstance(value, datetime) else value
+                             for value in (row[field] for field in fields)])
+    else:
+        # Dates at full precision, DjangoJSONEncoder would cut them to milliseconds
+        encoder = json.JSONEncoder(separators=(',', ':'), default=datetime.isoformat)
+
+        def encode(row: dict):
+            out.write(encoder.encode(row) + '\n')
+    for count, row in enumerate(rows, start=1):
+        encode(row)
+        if progress and not count % settings.STREAM_CHUNK_SIZE:
+            progress(count)
+    return count
+
+
+"""
+#############################
+Import                      #
+#############################
+"""
+
+
+def read_rows(source: IO[str], input_format: str) -> Iterator[dict]:
+    if input_format == 'csv':
+        return csv.DictReader(source)
+    return (json.loads(line) for line in source if line.strip())
+
+
+def batches(rows: Iterable, size: int) -> Iterator[list]:
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+def import_rows(kind: str, rows: Iterable[dict], batch_size: int, skip: int = 0,
+                committed: Callable[[int], None] = None) -> int:
+    """
+    :param skip: rows imported by a previous run, see Checkpoint
+    :param committed: called with the number of rows imported so far after every batch commits
+    :return: rows imported, skipped ones included
+    """
+    import_batch = import_users if kind == 'users' else import_messages
+    imported = skip
+    for number, batch in enumerate(batches(islice(rows, skip, None), batch_size)):
+        import_batch(batch, first_row=imported + 1, resumed=bool(skip) and number == 0)
+        imported += len(batch)
+        if committed:
+            committed(imported)
+    return imported
+
+
+def import_users(batch: List[dict], first_row: int, resumed: bool = False):
+    """Users that exist keep their ids, new ones get new ids, so importing them again changes nothing"""
+    usernames = [str(row_value(row, 'username', first_row + index)) for index, row in enumerate(batch)]
+    for index, username in enumerate(usernames):
+        validate_username(username, first_row + index)
+    with transaction.atomic():
+        User.objects.bulk_get_or_create(usernames)
+
+
+def import_messages(batch: List[dict], first_row: int, resumed: bool = False):
+    """
+    Messages get new ids, of their date_sent; users are created as needed. Imported messages update the inboxes,
+    the search index and the volume rollups like sends, but count as read and are not pushed to subscribers
+    :param resumed: the batch may have been imported by the previous run, skip the messages already stored
+    """
+    items = [message_item(row, first_row + index) for index, row in enumerate(batch)]
+    with shards.atomic(*shards.shards_for(items)):
+        users = User.objects.bulk_get_or_create(username for sender_username, receiver_username, _, _ in items
+                                                for username in (sender_username, receiver_username))
+        records = [MessageRecord(sender=users[sender_username], receiver=users[receiver_username], message=message,
+                                 date_sent=date_sent)
+                   for sender_username, receiver_username, message, date_sent in items]
+        if resumed:
+            records = not_stored(records)
+        records = shards.bulk_send(records, copy=True)
+        index_messages(sender=MessageRecord, records=records)
+        InboxEntry.objects.record_messages(records, count_unread=False)
+        record_message_volumes(records)
+        bump_message_versions(sender=MessageRecord, records=records)
+
+
+def not_stored(records: List[MessageRecord]) -> List[MessageRecord]:
+    """
+    :return: the records without a stored twin (same sender, receiver, date sent and message),
+             an identical message repeated in the records counting once per stored twin
+    """
+    records_per_shard = {}
+    for record in records:
+        records_per_shard.setdefault(shards.shard_for(record.sender.username, record.receiver.username),
+                                     []).append(record)
+    stored = Counter()
+    for shard, shard_records in records_per_shard.items():
+        stored.update(MessageRecord.objects.using(shards.using(shard)).filter(
+            sender_id__in={record.sender.id for record in shard_records},
+            receiver_id__in={record.receiver.id for record in shard_records},
+            date_sent__gte=min(record.date_sent for record in shard_records),
+            date_sent__lte=max(record.date_sent for record in shard_records),
+        ).values_list('sender_id', 'receiver_id', 'date_sent', 'message'))
+    missing = []
+    for record in records:
+        key = (record.sender.id, record.receiver.id, record.date_sent, record.message)
+        if stored[key]:
+            stored[key] -= 1
+        else:
+            missing.append(record)
+    return missing
+
+
+def row_value(row: dict, field: str, row_number: int):
+    value = row.get(field) if isinstance(row, dict) else None
+    if value is None:
+        raise ValueError(f'row {row_number}: {field} is required')
+    return value
+
+
+def validate_username(username: str, row_number: int):
+    try:
+        User.objects.validate_username(username)
+    except ValidationError as e:
+        raise ValueError(f'row {row_number}: {username}: {" ".join(e.messages)}')
+
+
+def message_item(row: dict, row_number: int) -> tuple:
+    """
+    :return: (sender username, receiver username, message, date sent) of an exported message row
+    """
+    sender_username, receiver_username, message = (str(row_value(row, field, row_number))
+                                                   for field in ('sender', 'receiver', 'message'))
+    validate_username(sender_username, row_number)
+    validate_username(receiver_username, row_number)
+    if len(message) > settings.MAX_MESSAGE_LENGTH:
+        raise ValueError(f'row {row_number}: max message length({settings.MAX_MESSAGE_LENGTH}) exceeded')
+    try:
+        date_sent = datetime.fromisoformat(str(row_value(row, 'date_sent', row_number)))
+    except ValueError:
+        raise ValueError(f'row {row_number}: date_sent must be an ISO 8601 date')
+    return sender_username, receiver_username, message, date_sent if date_sent.tzinfo else pytz.UTC.localize(date_sent)
+
+
+class Checkpoint:
+    """Rows of a file imported so far, saved atomically (write and rename) next to the import"""
+
+    def __init__(self, path: str, source: str):
+        self.path = path
+        self.source = os.path.abspath(source) if source != '-' else source
+
+    def load(self) -> int:
+        """
+        :return: rows imported by previous runs, 0 without a checkpoint
+        :raises ValueError: the checkpoint belongs to another file
+        """
+        if not os.path.exists(self.path):
+            return 0
+        with open(self.path) as file:
+            checkpoint = json.load(file)
+        if checkpoint['source'] != self.source:
+            raise ValueError(f'checkpoint {self.path} is for {checkpoint["source"]}')
+        return checkpoint['rows']
+
+    def save(self, rows: int):
+        temporary = f'{self.path}.tmp'
+        with open(temporary, 'w') as file:
+            json.dump(dict(source=self.source, rows=rows), file)
+        os.replace(temporary, self.path)
+
+
+class Throughput:
+    """Reports rows per second, at most every interval seconds"""
+
+    def __init__(self, write: Callable[[str], None], verb: str, interval: float = 5, skipped: int = 0):
+        self.write = write
+        self.verb = verb
+        self.interval = interval
+        self.skipped = skipped  # rows done by a previous run, not part of the rate
+        self.started = self.reported = time.monotonic()
+
+    def rate(self, rows: int) -> float:
+        return (rows - self.skipped) / max(time.monotonic() - self.started, 1e-9)
+
+    def update(self, rows: int):
+        now = time.monotonic()
+        if now - self.reported >= self.interval:
+            self.reported = now
+            self.write(f'{self.verb} {rows} rows ({self.rate(rows):.0f} rows/s)')
+
+    def done(self, rows: int):
+        self.write(f'{self.verb} {rows} rows in {time.monotonic() - self.started:.1f}s '
+                   f'({self.rate(rows):.0f} rows/s)')
@@ -0,0 +1,127 @@
+"""
+Queries of the message volume rollups (models/MessageVolumes.py), and their rebuild from the stored messages.
+
+Series and top lists read the rollups alone: a year of one user's daily volume is at most 365 rows per counterpart,
+a range read of the (sender, bucket, receiver) or (receiver, bucket) index. The rebuild recounts one day at a time,
+reading every shard, and replaces that day's hourly and daily rows in one transaction on the default database
+"""
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Iterator, List, Optional, Tuple
+
+import pytz
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Count, Min, Sum
+from django.db.models.functions import Trunc
+
+from chatApplication.models import DailyMessageVolume, HourlyMessageVolume, MessageRecord
+from chatApplication.models.MessageVolumes import VOLUMES
+
+DAY = timedelta(days=1)
+DIRECTIONS = ('sent', 'received')
+
+
+def in_range(model, date_range: List[datetime]) -> dict:
+    """Filter of the buckets overlapping [start, end]"""
+    start, end = date_range
+    return dict(bucket__gte=model.bucket_of(start), bucket__lte=end)
+
+
+def volume_series(user_id: int, granularity: str, date_range: List[datetime],
+                  counterpart_id: Optional[int] = None) -> List[dict]:
+    """
+    :param granularity: hour or day
+    :param counterpart_id: only the messages exchanged with this user
+    :return: {bucket, sent, received} of every bucket the user sent or received messages in, oldest first
+    """
+    model = VOLUMES[granularity]
+    volumes = dict(sent=model.objects.filter(sender_id=user_id, **in_range(model, date_range)),
+                   received=model.objects.filter(receiver_id=user_id, **in_range(model, date_range)))
+    if counterpart_id is not None:
+        volumes = dict(sent=volumes['sent'].filter(receiver_id=counterpart_id),
+                       received=volumes['received'].filter(sender_id=counterpart_id))
+    series = {}
+    for direction in DIRECTIONS:
+        for bucket, count in volumes[direction].values('bucket').annotate(total=Sum('count')).values_list(
+                'bucket', 'total'):
+            series.setdefault(bucket, dict(bucket=bucket, sent=0, received=0))[direction] = count
+    return [series[bucket] for bucket in sorted(series)]
+
+
+def top_users(direction: str, granularity: str, date_range: List[datetime], limit: int,
+              user_id: Optional[int] = None) -> List[Tuple[int, int]]:
+    """
+    :param direction: sent ranks senders, received ranks receivers
+    :param user_id: rank this user's counterparts instead of every user: the receivers of what they sent,
+                    or the senders of what they received
+    :return: (user id, messages) of the top limit users, most messages first
+    """
+    model = VOLUMES[granularity]
+    volumes = model.objects.filter(**in_range(model, date_range))
+    field = 'sender_id' if direction == 'sent' else 'receiver_id'
+    if user_id is not None:
+        volumes = volumes.filter(**{field: user_id})
+        field = 'receiver_id' if direction == 'sent' else 'sender_id'
+    return list(volumes.values(field).annotate(total=Sum('count')).order_by('-total', field).values_list(
+        field, 'total')[:limit])
+
+
+"""
+#############################
+Rebuild                     #
+#############################
+"""
+
+
+def rebuild(start: Optional[datetime] = None, end: Optional[datetime] = None) -> Iterator[Tuple[datetime, int]]:
+    """
+    Recounts the rollups of every (UTC) day from start's to end's from the messages stored on every shard,
+    one transaction per day. On postgres the rollup tables are locked for the day's recount: sends committed before
+    are counted, sends waiting for the lock add to the rebuilt rows once it is released
+    :param start: the day of the oldest stored message by default
+    :param end: today by default
+    :return: (day, messages counted) of every day rebuilt, as it commits
+    """
+    start = start or oldest_message()
+    if start is None:
+        return
+    day = DailyMessageVolume.bucket_of(start)
+    last_day = DailyMessageVolume.bucket_of(end or datetime.now(pytz.UTC))
+    while day <= last_day:
+        yield day, rebuild_day(day)
+        day += DAY
+
+
+def oldest_message() -> Optional[datetime]:
+    dates = [MessageRecord.objects.using(shard).aggregate(oldest=Min('date_sent'))['oldest']
+             for shard in settings.MESSAGE_SHARDS]
+    return min((date for date in dates if date is not None), default=None)
+
+
+def rebuild_day(day: datetime) -> int:
+    """
+    :return: messages counted
+    """
+    connection = connections[DEFAULT_DB_ALIAS]
+    with transaction.atomic(using=DEFAULT_DB_ALIAS):
+        if connection.vendor == 'postgresql':
+            tables = ', '.join(connection.ops.quote_name(model._meta.db_table) for model in VOLUMES.values())
+            with connection.cursor() as cursor:
+                cursor.execute(f'LOCK TABLE {tables} IN SHARE ROW EXCLUSIVE MODE')
+        # Deleting first also takes SQLite's write lock
+        HourlyMessageVolume.objects.filter(bucket__gte=day, bucket__lt=day + DAY).delete()
+        DailyMessageVolume.objects.filter(bucket=day).delete()
+
+        hourly, daily = Counter(), Counter()
+        for shard in settings.MESSAGE_SHARDS:
+            for sender_id, receiver_id, hour, messages in MessageRecord.objects.using(shard).filter(
+                    date_sent__gte=day, date_sent__lt=day + DAY,
+            ).annotate(hour=Trunc('date_sent', 'hour', tzinfo=pytz.UTC)).values(
+                    'sender_id', 'receiver_id', 'hour').annotate(messages=Count('id')).values_list(
+                    'sender_id', 'receiver_id', 'hour', 'messages'):
+                hourly[(sender_id, receiver_id, hour)] += messages
+                daily[(sender_id, receiver_id, day)] += messages
+        HourlyMessageVolume.objects.add_counts(hourly)
+        DailyMessageVolume.objects.add_counts(daily)
+    return sum(daily.values())
@@ -1,7 +1,10 @@
 from django.http import JsonResponse
 from django.urls import path, include
 
+from chatApplication.metrics.views import metrics
+
 urlpatterns = [
     path('health-check/', lambda x: JsonResponse(dict(status='ok'), status=200)),
+    path('metrics/', metrics, name='metrics'),
     path('', include('chatApplication.apis.urls'))
 ]
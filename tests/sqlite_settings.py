@@ -0,0 +1,29 @@
+"""
+Settings for running the tests without postgres: a SQLite primary, a replica alias mirroring it and a second
+message shard
+
+    python manage.py test --settings=tests.sqlite_settings
+"""
+from chatApplication.settings import *  # noqa: F401,F403
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': str(BASE_DIR / 'db.sqlite3'),  # noqa: F405
+    },
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': str(BASE_DIR / 'db.sqlite3'),  # noqa: F405
+        'TEST': {'MIRROR': 'default'},
+    },
+    'shard_2': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': str(BASE_DIR / 'db_shard_2.sqlite3'),  # noqa: F405
+    },
+}
+# Routing to the replica is switched on per test (tests.test_routers), other tests read their own writes
+DATABASE_REPLICAS = []
+# Likewise sharding (tests.test_shards)
+MESSAGE_SHARDS = ['default']
+# A single test process writes the messages
+MESSAGE_ID_WORKER_ID = 0
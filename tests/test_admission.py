@@ -0,0 +1,134 @@
+import json
+import time
+
+from django.test import TestCase, Client, SimpleTestCase, override_settings
+
+from chatApplication.ingest import admission
+from chatApplication.ingest.admission import QueueDelay, TokenBuckets, get_admission_control
+from chatApplication.models.Users import User
+
+
+class TokenBucketsTest(SimpleTestCase):
+    def test_burst_then_limited_until_refilled(self):
+        buckets = TokenBuckets(rate=2, burst=3, max_size=10)
+        self.assertEqual([buckets.take('alice', now=0) for _ in range(3)], [0, 0, 0])
+        self.assertEqual(buckets.take('alice', now=0), 0.5)
+        self.assertEqual(buckets.take('bob', now=0), 0)
+        self.assertEqual(buckets.take('alice', now=0.5), 0)
+
+    def test_cost_over_a_full_bucket_is_charged_in_full(self):
+        buckets = TokenBuckets(rate=1, burst=5, max_size=10)
+        self.assertEqual(buckets.wait('alice', cost=50, now=0), 0)
+        self.assertEqual(buckets.take('alice', cost=50, now=0), 0)
+        # 45 tokens in debt: as long as the 50 messages one by one
+        self.assertEqual(buckets.take('alice', now=1), 45)
+        self.assertEqual(buckets.wait('alice', cost=50, now=1), 49)
+        self.assertEqual(buckets.take('alice', cost=50, now=50), 0)
+
+    def test_table_size_is_fixed(self):
+        buckets = TokenBuckets(rate=1, burst=1, max_size=2)
+        for key in ('a', 'b', 'c'):
+            buckets.take(key, now=0)
+        self.assertEqual(len(buckets.table), 2)
+        # The evicted bucket starts full again
+        self.assertEqual(buckets.take('a', now=0), 0)
+        self.assertEqual(buckets.take('c', now=0), 1)
+
+    def test_rate_zero_disables(self):
+        buckets = TokenBuckets(rate=0, burst=1, max_size=2)
+        self.assertEqual([buckets.take('a', now=0) for _ in range(5)], [0] * 5)
+
+
+class QueueDelayTest(SimpleTestCase):
+    def test_burst_is_not_overload(self):
+        delay = QueueDelay(target=0.1, interval=1)
+        for now, seconds in ((0.1, 0.5), (0.5, 0.01), (0.9, 0.5), (1.1, 0.5)):
+            delay.observe(seconds, now=now)
+        self.assertFalse(delay.overloaded(now=1.2))
+
+    def test_standing_queue_is_overload_while_it_lasts(self):
+        delay = QueueDelay(target=0.1, interval=1)
+        for now in (0.1, 0.5, 0.9, 1.1):
+            delay.observe(0.3, now=now)
+        self.assertTrue(delay.overloaded(now=1.2))
+        # No traffic for two intervals: the verdict is stale
+        self.assertFalse(delay.overloaded(now=3.2))
+
+
+@override_settings(SEND_RATE_PER_SENDER=1, SEND_BURST_PER_SENDER=2, SEND_RATE_PER_CLIENT=0, SHED_QUEUE_DELAY_MS=100,
+                   SHED_INTERVAL_MS=50)
+class AdmissionAPITest(TestCase):
+    def setUp(self):
+        # Built from the overridden settings on first use
+        admission._admission = None
+        self.addCleanup(setattr, admission, '_admission', None)
+        User.objects.create(username='receiver')
+        self.client = Client()
+
+    def _send(self, sender):
+        return self.client.post('/message/send/receiver', data=dict(sender=sender, message='hello'),
+                                content_type='application/json')
+
+    def test_sender_over_its_limit_gets_429(self):
+        self.assertEqual([self._send('alice').status_code for _ in range(3)], [200, 200, 429])
+        response = self._send('alice')
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertEqual(self._send('bob').status_code, 200)
+        self.assertEqual(get_admission_control().stats()['limited_senders'], 2)
+
+    def test_batch_costs_one_token_per_message(self):
+        messages = [dict(sender='alice', receiver='receiver', message=f'm{i}') for i in range(2)]
+        response = self.client.post('/message/send/batch/', data=dict(messages=messages),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self._send('alice').status_code, 429)
+
+    def test_large_batches_pay_for_every_message(self):
+        messages = [dict(sender='alice', receiver='receiver', message=f'm{i}') for i in range(5)]
+        response = self.client.post('/message/send/batch/', data=dict(messages=messages),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(int(self._send('alice')['Retry-After']), 4)
+
+    @override_settings(SEND_RATE_PER_CLIENT=1, SEND_BURST_PER_CLIENT=4)
+    def test_refused_requests_are_not_charged(self):
+        self._send('alice')
+        self._send('alice')
+        for _ in range(5):
+            self.assertEqual(self._send('alice').status_code, 429)
+        # The client bucket (burst of 4) was only charged for the two admitted sends
+        self.assertEqual([self._send(sender).status_code for sender in ('bob', 'carol')], [200, 200])
+        self.assertEqual(self._send('dave').status_code, 429)
+
+    def test_standing_queue_sheds_sends(self):
+        get_admission_control().queue_delay.observe(0.5)
+        time.sleep(0.06)
+        get_admission_control().queue_delay.observe(0.5)
+        response = self._send('alice')
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response)
+        self.assertEqual(json.loads(response.content)['error'], admission.OVERLOADED_ERROR)
+
+    def test_request_start_header_is_ignored_unless_trusted(self):
+        for _ in range(2):
+            self.client.post('/message/send/receiver', data=dict(sender='alice', message='hello'),
+                             content_type='application/json', HTTP_X_REQUEST_START='t=1')
+            time.sleep(0.06)
+        self.assertEqual(get_admission_control().queue_delay.last_min(), 0.0)
+        self.assertEqual(self._send('bob').status_code, 200)
+
+    @override_settings(REQUEST_START_TRUSTED=True, REQUEST_START_MAX_DELAY_MS=2000)
+    def test_trusted_request_start_delay_is_capped(self):
+        self.client.post('/message/send/receiver', data=dict(sender='alice', message='hello'),
+                         content_type='application/json', HTTP_X_REQUEST_START='t=1')
+        time.sleep(0.06)
+        self.client.post('/message/send/receiver', data=dict(sender='bob', message='hello'),
+                         content_type='application/json', HTTP_X_REQUEST_START='t=1')
+        self.assertEqual(get_admission_control().queue_delay.last_min(), 2.0)
+
+    def test_counters_are_exported(self):
+        for _ in range(3):
+            self._send('alice')
+        content = self.client.get('/metrics/').content.decode()
+        self.assertIn('chat_admission_admitted 2', content)
+        self.assertIn('chat_admission_limited_senders 1', content)
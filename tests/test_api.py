@@ -3,10 +3,13 @@ from datetime import datetime, timedelta
 
 import pytz
 from django.conf import settings
+from django.db import connection
 from django.test import TestCase, Client
+from django.test.utils import CaptureQueriesContext
 
+from chatApplication.caches.lru_cache import clear_caches
 from chatApplication.constants import DEFAULT_DATE_RANGE
-from chatApplication.models import MessageRecord
+from chatApplication.models import Conversation, InboxEntry, MessageRecord
 from chatApplication.models.Users import User
 
 
@@ -78,6 +81,8 @@ class SendAPITest(TestCase):
 
 class RetrieveAPITest(TestCase):
     def setUp(self):
+        # Rendered pages are cached by content version, which only moves when a send commits
+        clear_caches()
         self.sender = User.objects.create(username='sender')
         self.second_sender = User.objects.create(username='second_sender')
         self.receiver = User.objects.create(username='receiver')
@@ -223,3 +228,309 @@ class RetrieveAPITest(TestCase):
 
         message_list = json.loads(response.content)
         self.assertEqual(len(message_list), 0)
+
+
+class KeysetPaginationAPITest(TestCase):
+    def setUp(self):
+        # Rendered pages are cached by content version, which only moves when a send commits
+        clear_caches()
+        self.sender = User.objects.create(username='sender')
+        self.receiver = User.objects.create(username='receiver')
+        self.client = Client()
+        self.base_endpoint = '/message/retrieve'
+        self.utc_now = datetime.now(pytz.UTC).replace(microsecond=0)
+        # Pairs of messages share a date_sent so the id tiebreak is exercised
+        for i in range(0, 50):
+            MessageRecord(date_sent=self.utc_now - timedelta(hours=i // 2),
+                          message=f'sent {i} by user {self.sender.username}',
+                          sender=self.sender,
+                          receiver=self.receiver).save()
+
+    def tearDown(self):
+        # Callbacks run by captureOnCommitCallbacks cached rows this test's rollback removes
+        clear_caches()
+
+    def _walk(self, url, data=None, per_page=7):
+        collected, cursor, pages = [], '', 0
+        while cursor is not None:
+            response = self.client.generic('GET', f'{url}?per_page={per_page}&cursor={cursor}',
+                                           data=data or '',
+                                           content_type='application/x-www-form-urlencoded')
+            self.assertEqual(response.status_code, 200)
+            body = json.loads(response.content)
+            collected.extend(body['results'])
+            cursor = body['next_cursor']
+            pages += 1
+        return collected, pages
+
+    def test_cursor_walk_returns_every_message_once_in_order(self):
+        data = f"sender={self.sender.username}&receiver={self.receiver.username}"
+        collected, pages = self._walk(f'{self.base_endpoint}/', data=data)
+        self.assertEqual(pages, 8)
+        self.assertEqual(len(collected), 50)
+        self.assertEqual(len({x['id'] for x in collected}), 50)
+        keys = [(x['date_sent'], x['id']) for x in collected]
+        self.assertEqual(keys, sorted(keys, reverse=True))
+
+    def test_cursor_walk_all_messages(self):
+        collected, _ = self._walk(f'{self.base_endpoint}/all/', per_page=10)
+        self.assertEqual(len(collected), 50)
+        self.assertEqual(collected[0]['sender'], self.sender.username)
+        self.assertEqual(collected[0]['receiver'], self.receiver.username)
+
+    def test_deep_page_is_a_single_query(self):
+        cursor = ''
+        # Outside a test transaction the usernames of the page's users are cached from the first page on
+        with self.captureOnCommitCallbacks(execute=True):
+            for _ in range(5):
+                response = self.client.get(f'{self.base_endpoint}/all/?per_page=5&cursor={cursor}')
+                cursor = json.loads(response.content)['next_cursor']
+        with self.assertNumQueries(1):
+            response = self.client.get(f'{self.base_endpoint}/all/?per_page=5&cursor={cursor}')
+        self.assertEqual(len(json.loads(response.content)['results']), 5)
+
+    def test_pages_are_stable_when_new_messages_arrive(self):
+        response = self.client.get(f'{self.base_endpoint}/all/?per_page=10&cursor=')
+        first_page = json.loads(response.content)
+        expected = self.client.get(f'{self.base_endpoint}/all/?per_page=10&cursor={first_page["next_cursor"]}')
+
+        for i in range(0, 5):
+            MessageRecord(date_sent=self.utc_now, message=f'new {i}',
+                          sender=self.sender, receiver=self.receiver).save()
+
+        response = self.client.get(f'{self.base_endpoint}/all/?per_page=10&cursor={first_page["next_cursor"]}')
+        self.assertEqual(json.loads(response.content), json.loads(expected.content))
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get(f'{self.base_endpoint}/all/?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, 400)
+
+
+class ColumnarFormatAPITest(TestCase):
+    def setUp(self):
+        # Rendered pages are cached by content version, which only moves when a send commits
+        clear_caches()
+        self.sender = User.objects.create(username='sender')
+        self.second_sender = User.objects.create(username='second_sender')
+        self.receiver = User.objects.create(username='receiver')
+        self.client = Client()
+        self.base_endpoint = '/message/retrieve'
+        self.utc_now = datetime.now(pytz.UTC).replace(microsecond=0)
+        for i in range(0, 30):
+            MessageRecord(date_sent=self.utc_now - timedelta(hours=i // 2),
+                          message=f'sent {i}',
+                          sender=self.sender if i % 3 else self.second_sender,
+                          receiver=self.receiver).save()
+
+    def _rows(self, body):
+        """Rebuilds the objects of the json format from a columnar page"""
+        columns = body['columns']
+        rows = [dict(zip(columns, values)) for values in zip(*columns.values())]
+        for row in rows:
+            row['date_sent'] = datetime.fromtimestamp(row['date_sent'] / 1000, pytz.UTC).isoformat()
+            for name in ('sender', 'receiver'):
+                if name in row:
+                    row[name] = body['users'][row[name]]
+        return rows
+
+    def test_offset_page_matches_json_format(self):
+        expected = json.loads(self.client.get(f'{self.base_endpoint}/all/?per_page=20').content)
+        response = self.client.get(f'{self.base_endpoint}/all/?per_page=20&format=columnar')
+        self.assertEqual(response.status_code, 200)
+        body = json.loads(response.content)
+        self.assertEqual(body['format'], 'columnar')
+        self.assertEqual(body['count'], 20)
+        self.assertEqual(body['num_pages'], 2)
+        self.assertCountEqual(body['users'], ['sender', 'second_sender', 'receiver'])
+        self.assertEqual(self._rows(body), expected)
+
+    def test_cursor_walk_matches_json_format(self):
+        data = f"sender={self.sender.username}&receiver={self.receiver.username}"
+        expected, collected = [], []
+        for response_format, pages in (('json', expected), ('columnar', collected)):
+            cursor = ''
+            while cursor is not None:
+                response = self.client.generic('GET', f'{self.base_endpoint}/?per_page=7&cursor={cursor}'
+                                                      f'&format={response_format}',
+                                               data=data, content_type='application/x-www-form-urlencoded')
+                body = json.loads(response.content)
+                pages.extend(body['results'] if response_format == 'json' else self._rows(body))
+                cursor = body['next_cursor']
+        self.assertEqual(len(collected), 20)
+        self.assertEqual(collected, expected)
+
+    def test_page_past_the_end_is_empty(self):
+        response = self.client.get(f'{self.base_endpoint}/all/?page=5&format=columnar')
+        body = json.loads(response.content)
+        self.assertEqual(body['count'], 0)
+        self.assertEqual(body['users'], [])
+        self.assertEqual(body['columns']['message'], [])
+
+    def test_unknown_format_is_rejected(self):
+        response = self.client.get(f'{self.base_endpoint}/all/?format=xml')
+        self.assertEqual(response.status_code, 400)
+
+    def test_invalid_columnar_paging_is_rejected(self):
+        for query in ('per_page=0', 'per_page=-1', 'per_page=many', 'page=0', 'page=-1', 'page=first'):
+            response = self.client.get(f'{self.base_endpoint}/all/?{query}&format=columnar')
+            self.assertEqual(response.status_code, 400, query)
+
+
+class ConversationTest(TestCase):
+    def setUp(self):
+        # Rendered pages are cached by content version, which only moves when a send commits
+        clear_caches()
+        self.sender = User.objects.create(username='sender')
+        self.receiver = User.objects.create(username='receiver')
+        self.client = Client()
+        self.utc_now = datetime.now(pytz.UTC).replace(microsecond=0)
+
+    def _save(self, sender, receiver, message='hello'):
+        record = MessageRecord(date_sent=self.utc_now, message=message, sender=sender, receiver=receiver)
+        record.save()
+        return record
+
+    def test_messages_share_one_conversation_per_direction(self):
+        first = self._save(self.sender, self.receiver)
+        second = self._save(self.sender, self.receiver)
+        reply = self._save(self.receiver, self.sender)
+        self.assertEqual(first.conversation_id, second.conversation_id)
+        self.assertNotEqual(first.conversation_id, reply.conversation_id)
+        self.assertEqual(Conversation.objects.count(), 2)
+        self.assertEqual(first.conversation.sender, self.sender)
+        self.assertEqual(first.conversation.receiver, self.receiver)
+
+    def test_retrieve_reads_only_the_requested_direction(self):
+        self._save(self.sender, self.receiver, message='to receiver')
+        self._save(self.receiver, self.sender, message='to sender')
+        data = f"sender={self.sender.username}&receiver={self.receiver.username}"
+        with self.assertNumQueries(1):
+            response = self.client.generic('GET', '/message/retrieve/?cursor=', data=data,
+                                           content_type='application/x-www-form-urlencoded')
+        self.assertEqual([x['message'] for x in json.loads(response.content)['results']], ['to receiver'])
+
+
+class SendBatchAPITest(TestCase):
+    def setUp(self):
+        self.sender = User.objects.create(username='sender')
+        self.client = Client()
+        self.endpoint = '/message/send/batch/'
+
+    def _post(self, items):
+        return self.client.post(self.endpoint, data=dict(messages=items), content_type='application/json')
+
+    def _items(self, count):
+        return [dict(sender=self.sender.username, receiver=f'receiver-{i}', message=f'message {i}')
+                for i in range(count)]
+
+    def test_batch_inserts_every_message_and_creates_users(self):
+        response = self._post(self._items(20))
+        self.assertEqual(response.status_code, 200)
+        results = json.loads(response.content)['results']
+        self.assertEqual([x['status'] for x in results], ['success'] * 20)
+        self.assertEqual(MessageRecord.objects.filter(sender=self.sender).count(), 20)
+        self.assertEqual(User.objects.filter(username__startswith='receiver-').count(), 20)
+        self.assertEqual(Conversation.objects.filter(sender=self.sender).count(), 20)
+
+    def test_round_trips_do_not_grow_with_batch_size(self):
+        def count_queries(items):
+            with CaptureQueriesContext(connection) as ctx:
+                self.assertEqual(self._post(items).status_code, 200)
+            return len(ctx.captured_queries)
+
+        small = count_queries(self._items(5))
+        MessageRecord.objects.all().delete()
+        Conversation.objects.all().delete()
+        User.objects.exclude(pk=self.sender.pk).delete()
+        large = count_queries(self._items(50))
+        self.assertEqual(small, large)
+
+    def test_invalid_items_are_reported_and_skipped(self):
+        items = self._items(2) + [dict(sender=self.sender.username, receiver='x', message='bad receiver'),
+                                  dict(sender=self.sender.username, receiver='receiver-0', message='ab' * 200),
+                                  dict(sender=self.sender.username)]
+        response = self._post(items)
+        self.assertEqual(response.status_code, 200)
+        results = json.loads(response.content)['results']
+        self.assertEqual([x['status'] for x in results], ['success', 'success', 'error', 'error', 'error'])
+        self.assertEqual(MessageRecord.objects.count(), 2)
+
+    def test_batch_size_is_limited(self):
+        response = self._post(self._items(settings.MAX_BATCH_SIZE + 1))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(MessageRecord.objects.count(), 0)
+
+    def test_bad_content(self):
+        self.assertEqual(self._post([]).status_code, 400)
+        response = self.client.post(self.endpoint, data='not json', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+
+class InboxAPITest(TestCase):
+    def setUp(self):
+        self.client = Client()
+
+    def _send(self, sender, receiver, message):
+        response = self.client.post(f'/message/send/{receiver}', data=dict(sender=sender, message=message),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+
+    def _inbox(self, username):
+        response = self.client.get(f'/message/inbox/{username}')
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content)['results']
+
+    def _read(self, username, counterpart):
+        return self.client.post(f'/message/inbox/{username}/read', data=dict(counterpart=counterpart),
+                                content_type='application/json')
+
+    def test_one_row_per_counterpart_with_last_message_and_unread_count(self):
+        self._send('alice', 'bob', 'hi bob')
+        self._send('alice', 'bob', 'still there?')
+        self._send('carol', 'bob', 'hey')
+        self._send('bob', 'alice', 'yes')
+
+        bob = {entry['counterpart']: entry for entry in self._inbox('bob')}
+        self.assertEqual(set(bob), {'alice', 'carol'})
+        self.assertEqual(bob['alice']['last_message'], 'yes')
+        self.assertTrue(bob['alice']['last_sent_by_me'])
+        self.assertEqual(bob['alice']['unread_count'], 2)
+        self.assertEqual(bob['carol']['unread_count'], 1)
+
+        alice, = self._inbox('alice')
+        self.assertEqual((alice['counterpart'], alice['unread_count'], alice['last_sent_by_me']), ('bob', 1, False))
+
+    def test_read_marker_resets_unread_count(self):
+        self._send('alice', 'bob', 'one')
+        self._send('alice', 'bob', 'two')
+        self.assertEqual(self._read('bob', 'alice').status_code, 200)
+        self.assertEqual(self._inbox('bob')[0]['unread_count'], 0)
+        self._send('alice', 'bob', 'three')
+        self.assertEqual(self._inbox('bob')[0]['unread_count'], 1)
+
+    def test_batch_sends_update_the_inbox(self):
+        self.client.post('/message/send/batch/', content_type='application/json', data=dict(messages=[
+            dict(sender='alice', receiver='bob', message=f'message {i}') for i in range(3)]))
+        entry, = self._inbox('bob')
+        self.assertEqual(entry['unread_count'], 3)
+        self.assertEqual(InboxEntry.objects.count(), 2)
+
+    def test_inbox_reads_do_not_grow_with_history(self):
+        self._send('alice', 'bob', 'first')
+        self._send('carol', 'bob', 'first')
+        with CaptureQueriesContext(connection) as short_history:
+            self._inbox('bob')
+        for i in range(20):
+            self._send('alice', 'bob', f'message {i}')
+        with CaptureQueriesContext(connection) as long_history:
+            self.assertEqual(len(self._inbox('bob')), 2)
+        self.assertEqual(len(short_history.captured_queries), len(long_history.captured_queries))
+
+    def test_errors(self):
+        self.assertEqual(self.client.get('/message/inbox/nobody').status_code, 404)
+        self._send('alice', 'bob', 'hi')
+        self.assertEqual(self._read('bob', 'carol').status_code, 404)
+        User.objects.create(username='carol')
+        self.assertEqual(self._read('bob', 'carol').status_code, 404)
+        self.assertEqual(self.client.post('/message/inbox/bob/read', data=dict(),
+                                          content_type='application/json').status_code, 400)
@@ -0,0 +1,77 @@
+import json
+from datetime import datetime, timedelta
+
+import pytz
+from asgiref.sync import sync_to_async
+from django.http import StreamingHttpResponse
+from django.test import TestCase, override_settings
+from django.test.client import AsyncRequestFactory
+
+from chatApplication.apis import async_message_api, async_user_api
+from chatApplication.caches.lru_cache import clear_caches
+from chatApplication.models import MessageRecord
+from chatApplication.models.Users import User
+
+
+# Pool size 0 runs the ORM calls on the test's own connection, inside its transaction
+@override_settings(ASYNC_DB_POOL_SIZE=0)
+class AsyncAPITest(TestCase):
+    def setUp(self):
+        # Rendered pages are cached by content version, which only moves when a send commits
+        clear_caches()
+        self.sender = User.objects.create(username='sender')
+        self.receiver = User.objects.create(username='receiver')
+        self.factory = AsyncRequestFactory()
+        utc_now = datetime.now(pytz.UTC).replace(microsecond=0)
+        for i in range(0, 5):
+            MessageRecord(date_sent=utc_now - timedelta(hours=i), message=f'message {i}',
+                          sender=self.sender, receiver=self.receiver).save()
+
+    async def test_send_message(self):
+        request = self.factory.post('/message/send/receiver', data=dict(sender='sender', message='async'),
+                                    content_type='application/json')
+        response = await async_message_api.send_message(request, receiver_username='receiver')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['status'], 'success')
+
+    async def test_send_message_errors_are_handled(self):
+        request = self.factory.post('/message/send/receiver', data=dict(), content_type='application/json')
+        response = await async_message_api.send_message(request, receiver_username='receiver')
+        self.assertEqual(response.status_code, 400)
+
+    async def test_wrong_method_is_rejected(self):
+        request = self.factory.get('/message/send/receiver')
+        response = await async_message_api.send_message(request, receiver_username='receiver')
+        self.assertEqual(response.status_code, 405)
+
+    async def test_send_message_batch(self):
+        request = self.factory.post('/message/send/batch/',
+                                    data=dict(messages=[dict(sender='sender', receiver='other', message='hi')]),
+                                    content_type='application/json')
+        response = await async_message_api.send_message_batch(request)
+        self.assertEqual(json.loads(response.content)['results'][0]['status'], 'success')
+
+    async def test_retrieve_messages(self):
+        request = self.factory.generic('GET', '/message/retrieve/?per_page=2', data='sender=sender&receiver=receiver',
+                                       content_type='application/x-www-form-urlencoded')
+        response = await async_message_api.retrieve_messages(request)
+        self.assertEqual([x['message'] for x in json.loads(response.content)], ['message 0', 'message 1'])
+
+    async def test_retrieve_all_messages_with_cursor(self):
+        request = self.factory.get('/message/retrieve/all/?per_page=3&cursor=')
+        response = await async_message_api.retrieve_all_messages(request)
+        body = json.loads(response.content)
+        self.assertEqual(len(body['results']), 3)
+        self.assertIsNotNone(body['next_cursor'])
+
+    async def test_user_views(self):
+        response = await async_user_api.create_user(self.factory.post('/user/create-user/new-user'), 'new-user')
+        self.assertEqual(response.status_code, 201)
+        response = await async_user_api.get_user(self.factory.get('/user/get-user/new-user'), 'new-user')
+        self.assertEqual(json.loads(response.content)['username'], 'new-user')
+        response = await async_user_api.get_user(self.factory.get('/user/get-user/missing'), 'missing')
+        self.assertEqual(response.status_code, 404)
+        response = await async_user_api.all_users(self.factory.get('/user/all-users/'))
+        self.assertIsInstance(response, StreamingHttpResponse)
+        users = await sync_to_async(b''.join)(response.streaming_content)
+        self.assertEqual({x['username'] for x in json.loads(users)}, {'sender', 'receiver', 'new-user'})
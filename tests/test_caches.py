@@ -0,0 +1,189 @@
+import time
+
+from django.db import connection
+from django.test import TestCase, Client, SimpleTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from chatApplication.caches.lru_cache import LRUCache, clear_caches
+from chatApplication.caches.versions import LocalVersionStore
+from chatApplication.models import MessageRecord
+from chatApplication.models.MessageRecords import with_usernames
+from chatApplication.models.Users import User, username_cache
+
+
+class LRUCacheTest(SimpleTestCase):
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = LRUCache(max_size=2, ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        cache.set('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('c'), 3)
+        self.assertEqual(cache.stats(), dict(hits=3, misses=1, evictions=1, size=2))
+
+    def test_entries_expire(self):
+        cache = LRUCache(max_size=2, ttl=0.01)
+        cache.set('a', 1)
+        time.sleep(0.02)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(len(cache), 0)
+
+    def test_clear_caches(self):
+        cache = LRUCache(max_size=2, ttl=60)
+        cache.set('a', 1)
+        clear_caches()
+        self.assertIsNone(cache.get('a'))
+
+
+class UserCacheTest(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.client = Client()
+
+    def tearDown(self):
+        # Callbacks run by captureOnCommitCallbacks cached rows this test's rollback removes
+        clear_caches()
+
+    def _send(self, receiver='receiver'):
+        return self.client.post(f'/message/send/{receiver}', data=dict(sender='sender', message='hello'),
+                                content_type='application/json')
+
+    def test_steady_state_send_does_no_lookups_and_one_insert(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self._send().status_code, 200)
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self._send().status_code, 200)
+        statements = [query['sql'] for query in ctx.captured_queries]
+        self.assertFalse([sql for sql in statements if 'chatApplication_user' in sql
+                          or 'chatApplication_conversation' in sql])
+        self.assertEqual(len([sql for sql in statements
+                              if sql.startswith('INSERT INTO "chatApplication_messagerecord"')]), 1)
+        self.assertEqual(MessageRecord.objects.count(), 2)
+
+    def test_uncommitted_rows_are_not_cached(self):
+        self.assertEqual(self._send().status_code, 200)
+        self.assertIsNone(User.objects.cached('sender'))
+
+    def test_get_user_is_served_from_cache(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            user = User.objects.create(username='cached-user')
+        with self.assertNumQueries(0):
+            response = self.client.get('/user/get-user/cached-user')
+        self.assertEqual(response.json(), dict(id=user.id, username='cached-user'))
+
+    def test_deleted_user_is_evicted(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            user = User.objects.create(username='deleted-user')
+        self.assertIsNotNone(User.objects.cached('deleted-user'))
+        with self.captureOnCommitCallbacks(execute=True):
+            user.delete()
+        self.assertIsNone(User.objects.cached('deleted-user'))
+        self.assertEqual(self.client.get('/user/get-user/deleted-user').status_code, 404)
+
+    def test_renamed_user_is_evicted_under_old_name(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            user = User.objects.create(username='old-name')
+            user.username = 'new-name'
+            user.save()
+        self.assertIsNone(username_cache.get('old-name'))
+        self.assertEqual(User.objects.cached('new-name').id, user.id)
+        self.assertEqual(User.objects.cached_username(user.id), 'new-name')
+
+    def test_usernames_of_message_rows_are_served_from_cache(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self._send().status_code, 200)
+        other = User.objects.create(username='not-cached')
+        row = MessageRecord.objects.values('sender', 'receiver').get()
+        with self.assertNumQueries(0):
+            self.assertEqual(with_usernames([dict(row)]), [dict(sender='sender', receiver='receiver')])
+        with self.assertNumQueries(1):
+            self.assertEqual(User.objects.usernames([row['sender'], other.id, -1]),
+                             {row['sender']: 'sender', other.id: 'not-cached'})
+
+
+class VersionStoreTest(SimpleTestCase):
+    def test_tokens_change_on_bump_and_differ_between_processes(self):
+        store = LocalVersionStore()
+        token = store.token('a')
+        store.bump(['a'])
+        self.assertNotEqual(store.token('a'), token)
+        self.assertEqual(store.token('b'), store.token('b'))
+        self.assertNotEqual(LocalVersionStore().token('a'), token)  # new epoch after a restart
+
+
+@override_settings(VERSION_STORE_BACKEND='chatApplication.caches.versions.LocalVersionStore')
+class ConditionalRetrieveTest(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.client = Client()
+
+    def tearDown(self):
+        # Sends below commit their callbacks, which cache rows rolled back after the test
+        clear_caches()
+
+    def _send(self, sender, receiver, message):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/message/send/{receiver}', data=dict(sender=sender, message=message),
+                             content_type='application/json')
+
+    def _retrieve(self, **headers):
+        return self.client.generic('GET', '/message/retrieve/?per_page=5', data='sender=alice&receiver=bob',
+                                   content_type='application/x-www-form-urlencoded', **headers)
+
+    def test_unchanged_conversation_costs_no_queries(self):
+        self._send('alice', 'bob', 'hi')
+        first = self._retrieve()
+        self.assertEqual(first.status_code, 200)
+        etag = first['ETag']
+
+        with self.assertNumQueries(0):
+            not_modified = self._retrieve(HTTP_IF_NONE_MATCH=etag)
+            cached = self._retrieve()
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified['ETag'], etag)
+        self.assertEqual(cached.status_code, 200)
+        self.assertEqual(cached.content, first.content)
+        self.assertEqual(self._retrieve(HTTP_IF_NONE_MATCH=f'W/{etag}').status_code, 304)
+
+    def test_send_invalidates_the_conversation_only(self):
+        self._send('alice', 'bob', 'hi')
+        self._send('carol', 'dave', 'hi')
+        etag = self._retrieve()['ETag']
+        other = self.client.generic('GET', '/message/retrieve/?per_page=5', data='sender=carol&receiver=dave',
+                                    content_type='application/x-www-form-urlencoded')
+
+        self._send('alice', 'bob', 'again')
+        response = self._retrieve(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(len(response.json()), 2)
+        unchanged = self.client.generic('GET', '/message/retrieve/?per_page=5', data='sender=carol&receiver=dave',
+                                        content_type='application/x-www-form-urlencoded',
+                                        HTTP_IF_NONE_MATCH=other['ETag'])
+        self.assertEqual(unchanged.status_code, 304)
+
+    def test_pages_have_their_own_etags(self):
+        self._send('alice', 'bob', 'hi')
+        first = self.client.get('/message/retrieve/all/?per_page=1')
+        second = self.client.get('/message/retrieve/all/?per_page=2')
+        self.assertNotEqual(first['ETag'], second['ETag'])
+        self.assertEqual(self.client.get('/message/retrieve/all/?per_page=1', HTTP_IF_NONE_MATCH=first['ETag'])
+                         .status_code, 304)
+        self._send('carol', 'dave', 'hi')
+        self.assertEqual(self.client.get('/message/retrieve/all/?per_page=1', HTTP_IF_NONE_MATCH=first['ETag'])
+                         .status_code, 200)
+
+    @override_settings(VERSION_STORE_BACKEND=None)
+    def test_without_a_version_store_pages_are_tagged_by_content(self):
+        self._send('alice', 'bob', 'hi')
+        etag = self._retrieve()['ETag']
+        with CaptureQueriesContext(connection) as ctx:
+            not_modified = self._retrieve(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((not_modified.status_code, not_modified['ETag']), (304, etag))
+        # Rendered again, not cached
+        self.assertTrue(ctx.captured_queries)
+        self._send('alice', 'bob', 'again')
+        self.assertEqual(self._retrieve(HTTP_IF_NONE_MATCH=etag).status_code, 200)
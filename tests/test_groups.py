@@ -0,0 +1,101 @@
+import json
+
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from chatApplication.caches.lru_cache import clear_caches
+from chatApplication.models import GroupMessage, MessageRecord
+
+
+class GroupTest(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.client = Client()
+        self._post('/group/create/team', dict(members=['alice', 'bob', 'carol']), status=201)
+
+    def tearDown(self):
+        clear_caches()
+
+    def _post(self, url, data, status=200):
+        response = self.client.post(url, data=data, content_type='application/json')
+        self.assertEqual(response.status_code, status, response.content)
+        return json.loads(response.content)
+
+    def _get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        return json.loads(response.content)
+
+    def _send(self, group, sender, message):
+        return self._post(f'/group/{group}/send', dict(sender=sender, message=message))
+
+    def _feed(self, user, per_page=50):
+        rows, cursor = [], ''
+        while cursor is not None:
+            page = self._get(f'/message/feed/?user={user}&per_page={per_page}&cursor={cursor}')
+            rows += page['results']
+            cursor = page['next_cursor']
+        return [(row['sender'], row['group'], row['message']) for row in rows]
+
+    def test_a_group_message_is_stored_once_whatever_the_number_of_members(self):
+        with CaptureQueriesContext(connection) as small:
+            self._send('team', 'alice', 'hello')
+        self._post('/group/create/crowd', dict(members=['alice'] + [f'member{i}' for i in range(50)]), status=201)
+        with CaptureQueriesContext(connection) as large:
+            self._send('crowd', 'alice', 'hello')
+        self.assertEqual(len(large.captured_queries), len(small.captured_queries))
+        self.assertEqual(GroupMessage.objects.count(), 2)
+        self.assertEqual(self._feed('member7'), [('alice', 'crowd', 'hello')])
+
+    def test_feed_merges_direct_and_group_messages_newest_first(self):
+        self._send('team', 'alice', 'one')
+        self.client.post('/message/send/bob', data=dict(sender='carol', message='two'), content_type='application/json')
+        self._send('team', 'carol', 'three')
+        self._post('/group/create/pair', dict(members=['bob', 'dave']), status=201)
+        self._send('pair', 'dave', 'four')
+        self.client.post('/message/send/bob', data=dict(sender='alice', message='five'),
+                         content_type='application/json')
+        expected = [('alice', None, 'five'), ('dave', 'pair', 'four'), ('carol', 'team', 'three'),
+                    ('carol', None, 'two'), ('alice', 'team', 'one')]
+        self.assertEqual(self._feed('bob'), expected)
+        self.assertEqual(self._feed('bob', per_page=2), expected)
+
+    def test_members_see_the_messages_sent_while_they_are_members(self):
+        self._send('team', 'alice', 'before')
+        self._post('/group/team/members', dict(add=['dave'], remove=['carol']))
+        self._send('team', 'alice', 'after')
+        self.assertEqual(self._feed('dave'), [('alice', 'team', 'after')])
+        self.assertEqual(self._feed('carol'), [])
+        self.assertEqual(self._feed('bob'), [('alice', 'team', 'after'), ('alice', 'team', 'before')])
+
+    def test_feed_reads_only_the_groups_that_can_make_the_page(self):
+        for i in range(30):
+            self._post(f'/group/create/quiet{i}', dict(members=['alice', 'bob']), status=201)
+            self._send(f'quiet{i}', 'alice', f'message {i}')
+        with CaptureQueriesContext(connection) as ctx:
+            page = self._get('/message/feed/?user=bob&per_page=3')
+        self.assertEqual([row['message'] for row in page['results']], ['message 29', 'message 28', 'message 27'])
+        group_reads = [query for query in ctx.captured_queries if 'groupmessage' in query['sql'].lower()]
+        self.assertEqual(len(group_reads), 4)
+
+    def test_read_cursors_are_per_member(self):
+        self._send('team', 'alice', 'hello')
+        self.assertEqual(self._get('/group/list/bob')['results'][0]['unread'], True)
+        self._post('/group/team/read', dict(member='bob'))
+        self.assertEqual(self._get('/group/list/bob')['results'][0]['unread'], False)
+        self.assertEqual(self._get('/group/list/carol')['results'][0]['unread'], True)
+        self._send('team', 'carol', 'hi')
+        self.assertEqual(self._get('/group/list/bob')['results'][0]['unread'], True)
+
+    def test_non_members_can_not_send(self):
+        self._post('/group/team/send', dict(sender='dave', message='hello'), status=403)
+        self._post('/group/nowhere/send', dict(sender='alice', message='hello'), status=404)
+        self.assertFalse(GroupMessage.objects.exists())
+        self.assertFalse(MessageRecord.objects.exists())
+
+    @override_settings(MAX_GROUPS_PER_USER=2)
+    def test_memberships_per_user_are_capped(self):
+        self._post('/group/create/second', dict(members=['alice']), status=201)
+        self._post('/group/create/third', dict(members=['alice']), status=409)
+        self._post('/group/create/bad!', dict(), status=400)
@@ -0,0 +1,158 @@
+import json
+from datetime import datetime, timedelta
+from unittest import mock
+
+import pytz
+from asgiref.sync import sync_to_async
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.client import AsyncRequestFactory
+from django.test.utils import CaptureQueriesContext
+
+from chatApplication.apis import async_message_api
+from chatApplication.apis.message_api import create_message
+from chatApplication.caches.lru_cache import clear_caches
+from chatApplication.errors.api_errors import APIError
+from chatApplication.ingest.idempotency import get_idempotency_keys, key_scope, running
+from chatApplication.ingest.write_buffer import get_write_buffer
+from chatApplication.models import GroupMessage, IdempotencyKey, MessageRecord
+
+
+class IdempotentSendTest(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.client = Client()
+
+    def tearDown(self):
+        clear_caches()
+
+    def _post(self, url, data, key):
+        return self.client.post(url, data=data, content_type='application/json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_storm_sends_once(self):
+        stats = get_idempotency_keys().stats()
+        first = self._post('/message/send/bob', dict(sender='alice', message='hi'), 'key-1')
+        retries = [self._post('/message/send/bob', dict(sender='alice', message='hi'), 'key-1') for _ in range(20)]
+        # Another worker answers from the database
+        clear_caches()
+        retries.append(self._post('/message/send/bob', dict(sender='alice', message='hi'), 'key-1'))
+
+        self.assertEqual(MessageRecord.objects.count(), 1)
+        self.assertEqual({(response.status_code, response.content) for response in retries},
+                         {(200, first.content)})
+        self.assertTrue(all(response['Idempotent-Replayed'] == 'true' for response in retries))
+        after = get_idempotency_keys().stats()
+        self.assertEqual(after['requests'] - stats['requests'], 22)
+        self.assertEqual(after['replayed_from_cache'] - stats['replayed_from_cache'], 20)
+        self.assertEqual(after['replayed_from_database'] - stats['replayed_from_database'], 1)
+
+    def test_replays_do_not_insert(self):
+        self._post('/message/send/bob', dict(sender='alice', message='hi'), 'key-1')
+        with CaptureQueriesContext(connection) as ctx:
+            self._post('/message/send/bob', dict(sender='alice', message='hi'), 'key-1')
+        self.assertEqual(ctx.captured_queries, [])
+
+    def test_batch_retry_storm_sends_once(self):
+        batch = dict(messages=[dict(sender='alice', receiver=receiver, message='hi') for receiver in ('bob', 'carol')])
+        responses = [self._post('/message/send/batch/', batch, 'batch-1') for _ in range(10)]
+        self.assertEqual(MessageRecord.objects.count(), 2)
+        self.assertEqual(len({response.content for response in responses}), 1)
+
+    def test_group_send_retry_sends_once(self):
+        self.client.post('/group/create/team', data=dict(members=['alice', 'bob']), content_type='application/json')
+        for _ in range(5):
+            self._post('/group/team/send', dict(sender='alice', message='hi'), 'group-1')
+        self.assertEqual(GroupMessage.objects.count(), 1)
+
+    def test_request_in_progress_is_not_sent_again(self):
+        IdempotencyKey.objects.create(scope=key_scope(['alice']), key='key-1', fingerprint='',
+                                      created_at=datetime.now(pytz.UTC))
+        response = self._post('/message/send/bob', dict(sender='alice', message='hi'), 'key-1')
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(MessageRecord.objects.exists())
+
+    def test_abandoned_and_expired_keys_are_claimed_again(self):
+        now = datetime.now(pytz.UTC)
+        scope = key_scope(['alice'])
+        IdempotencyKey.objects.create(scope=scope, key='abandoned', fingerprint='',
+                                      created_at=now - timedelta(minutes=5))
+        IdempotencyKey.objects.create(scope=scope, key='expired', fingerprint='', created_at=now - timedelta(days=2),
+                                      status=200, body='{}')
+        for key in ('abandoned', 'expired'):
+            self.assertEqual(self._post('/message/send/bob', dict(sender='alice', message=key), key).status_code, 200)
+        self.assertEqual(MessageRecord.objects.count(), 2)
+
+    def test_key_reused_for_another_request_is_refused(self):
+        self._post('/message/send/bob', dict(sender='alice', message='hi'), 'key-1')
+        self.assertEqual(self._post('/message/send/bob', dict(sender='alice', message='bye'), 'key-1').status_code, 422)
+        self.assertEqual(self._post('/message/send/carol', dict(sender='alice', message='hi'), 'key-1').status_code,
+                         422)
+        self.assertEqual(MessageRecord.objects.count(), 1)
+
+    def test_keys_are_scoped_by_sender(self):
+        for sender in ('alice', 'carol'):
+            response = self._post('/message/send/bob', dict(sender=sender, message='hi'), 'key-1')
+            self.assertFalse(response.has_header('Idempotent-Replayed'))
+        self.assertEqual(MessageRecord.objects.count(), 2)
+
+    def test_response_commits_with_the_message(self):
+        # The message is sent, then the request fails: its retry gets the response stored with the message
+        with mock.patch('chatApplication.apis.message_api.JsonResponse', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError), self.assertLogs('django.request', 'ERROR'):
+                self._post('/message/send/bob', dict(sender='alice', message='hi'), 'key-1')
+        clear_caches()
+        response = self._post('/message/send/bob', dict(sender='alice', message='hi'), 'key-1')
+        self.assertEqual((response.status_code, response['Idempotent-Replayed']), (200, 'true'))
+        self.assertEqual(json.loads(response.content)['date_sent'],
+                         MessageRecord.objects.get().date_sent.isoformat())
+
+    def test_request_whose_claim_was_taken_over_sends_nothing(self):
+        claim = get_idempotency_keys().claim(key_scope(['alice']), 'key-1', 'fingerprint')
+        # A retry took the abandoned claim over
+        IdempotencyKey.objects.update(created_at=datetime.now(pytz.UTC) + timedelta(seconds=1))
+        with running(claim), self.assertRaises(APIError) as raised:
+            create_message('alice', 'bob', 'hi', datetime.now(pytz.UTC))
+        self.assertEqual(raised.exception.status, 409)
+        self.assertFalse(MessageRecord.objects.exists())
+
+    @override_settings(MESSAGE_WRITE_BUFFER=True)
+    def test_keyed_sends_skip_the_write_buffer(self):
+        flushed = get_write_buffer().stats()['flushed_items']
+        self.assertEqual(self._post('/message/send/bob', dict(sender='alice', message='hi'), 'key-1').status_code, 200)
+        self.assertEqual(MessageRecord.objects.count(), 1)
+        self.assertEqual(IdempotencyKey.objects.get().status, 200)
+        self.assertEqual(get_write_buffer().stats()['flushed_items'], flushed)
+
+    def test_refused_request_gives_its_key_back(self):
+        self.assertEqual(self._post('/message/send/bob', dict(sender='alice'), 'key-1').status_code, 400)
+        self.assertEqual(self._post('/message/send/bob', dict(sender='alice', message='hi'), 'key-1').status_code,
+                         200)
+        self.assertEqual(MessageRecord.objects.count(), 1)
+
+    def test_invalid_key_is_refused(self):
+        self.assertEqual(self._post('/message/send/bob', dict(sender='alice', message='hi'), 'k' * 129).status_code,
+                         400)
+
+    def test_counters_are_exported(self):
+        self.assertIn('chat_idempotency_hit_ratio', self.client.get('/metrics/').content.decode())
+
+
+# Pool size 0 runs the ORM calls on the test's own connection, inside its transaction
+@override_settings(ASYNC_DB_POOL_SIZE=0)
+class AsyncIdempotentSendTest(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.factory = AsyncRequestFactory()
+
+    def tearDown(self):
+        clear_caches()
+
+    async def test_retry_storm_sends_once(self):
+        responses = []
+        for _ in range(5):
+            request = self.factory.post('/message/send/bob', data=dict(sender='alice', message='hi'),
+                                        content_type='application/json', **{'idempotency-key': 'key-1'})
+            responses.append(await async_message_api.send_message(request, receiver_username='bob'))
+        self.assertEqual({response.status_code for response in responses}, {200})
+        self.assertEqual(len({json.loads(response.content)['date_sent'] for response in responses}), 1)
+        self.assertEqual(await sync_to_async(MessageRecord.objects.count)(), 1)
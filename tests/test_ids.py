@@ -0,0 +1,98 @@
+import os
+import threading
+from datetime import datetime, timedelta
+
+import pytz
+from django.core.exceptions import ImproperlyConfigured
+from django.test import Client, SimpleTestCase, TestCase, override_settings
+
+from chatApplication.models import MessageRecord, SearchToken
+from chatApplication.storage import ids
+from chatApplication.storage.ids import IdGenerator, MAX_SEQUENCE, id_range, id_time
+
+MOMENT = datetime(2026, 3, 1, 12, 30, 15, 123456, tzinfo=pytz.UTC)
+
+
+class IdGeneratorTest(SimpleTestCase):
+    def test_layout(self):
+        generator = IdGenerator(worker_id=5, table_size=100)
+        first, second = generator.next_ids([MOMENT, MOMENT])
+        self.assertEqual(id_time(first), MOMENT.replace(microsecond=123000))
+        self.assertEqual(((first >> 12) & 1023, first & 4095), (5, 0))
+        self.assertEqual(second, first + 1)
+        self.assertLess(first, 1 << 63)
+        self.assertEqual(id_time(generator.next_id(ids.EPOCH - timedelta(days=1))), ids.EPOCH - timedelta(days=1))
+
+    def test_ids_stand_for_their_time_in_any_order(self):
+        generator = IdGenerator(worker_id=0, table_size=100)
+        times = [MOMENT - timedelta(days=day) for day in (0, 3, 1, 2, 0)]
+        made = generator.next_ids(times)
+        self.assertEqual([id_time(made_id) for made_id in made], [moment.replace(microsecond=123000)
+                                                                  for moment in times])
+        self.assertEqual(sorted(made), [made[1], made[3], made[2], made[0], made[4]])
+        start, end = id_range(times[3], times[2])
+        self.assertEqual([start <= made_id <= end for made_id in made], [False, False, True, True, False])
+
+    def test_used_up_millisecond_moves_to_the_next(self):
+        generator = IdGenerator(worker_id=0, table_size=100)
+        made = generator.next_ids([MOMENT] * (MAX_SEQUENCE + 2))
+        self.assertEqual(len(set(made)), len(made))
+        self.assertEqual(id_time(made[-1]) - id_time(made[0]), timedelta(milliseconds=1))
+
+    def test_forgotten_milliseconds_are_not_reused(self):
+        generator = IdGenerator(worker_id=0, table_size=4)
+        made = [generator.next_id(MOMENT + timedelta(milliseconds=ms)) for ms in range(5)]
+        # Sequences of the earlier milliseconds were dropped: an id of theirs now goes to a later millisecond
+        again = generator.next_id(MOMENT)
+        self.assertNotIn(again, made)
+        self.assertGreater(id_time(again), id_time(made[0]))
+
+    def test_unique_across_threads_and_workers(self):
+        generators = [IdGenerator(worker_id=worker_id, table_size=100) for worker_id in (1, 2)]
+        made = []
+
+        def make(generator):
+            made.extend(generator.next_id(MOMENT) for _ in range(2000))
+
+        threads = [threading.Thread(target=make, args=(generator,)) for generator in generators * 2]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(set(made)), 8000)
+
+    def test_worker_id_is_checked(self):
+        with self.assertRaises(ValueError):
+            IdGenerator(worker_id=1024, table_size=100)
+
+
+class WorkerIdTest(SimpleTestCase):
+    def setUp(self):
+        ids._reset_after_fork()
+        self.addCleanup(ids._reset_after_fork)
+
+    @override_settings(DEBUG=False, MESSAGE_ID_WORKER_ID=None)
+    def test_worker_id_is_required_outside_debug(self):
+        self.assertEqual([error.id for error in ids.check_worker_id(None)], ['chatApplication.E001'])
+        with self.assertRaises(ImproperlyConfigured):
+            ids.next_id()
+
+    @override_settings(DEBUG=True, MESSAGE_ID_WORKER_ID=None)
+    def test_debug_falls_back_to_the_process_id(self):
+        self.assertEqual(ids.check_worker_id(None), [])
+        self.assertEqual(ids.get_id_generator().worker_id, os.getpid() % (ids.MAX_WORKER_ID + 1))
+
+
+class MessageIdsTest(TestCase):
+    def test_messages_get_ids_of_their_date_sent(self):
+        Client().post('/message/send/bob', data=dict(sender='alice', message='hello'), content_type='application/json')
+        Client().post('/message/send/batch/', content_type='application/json', data=dict(messages=[
+            dict(sender='alice', receiver='bob', message=f'batch {i}') for i in range(3)]))
+        records = list(MessageRecord.objects.order_by('id'))
+        self.assertEqual([record.message for record in records], ['hello', 'batch 0', 'batch 1', 'batch 2'])
+        for record in records:
+            # date_sent keeps its microseconds, the id its millisecond
+            self.assertEqual(id_time(record.id), record.date_sent.replace(microsecond=record.date_sent.microsecond
+                                                                          // 1000 * 1000))
+        self.assertEqual(set(SearchToken.objects.values_list('message_id', flat=True)),
+                         {record.id for record in records})
@@ -0,0 +1,90 @@
+import json
+import logging
+
+from django.test import TestCase, Client, SimpleTestCase, override_settings
+from django.test.client import AsyncClient
+
+from chatApplication.metrics.histograms import Histogram, HistogramFamily
+from chatApplication.metrics.middleware import DB_QUERIES, REQUEST_SECONDS, RESPONSE_BYTES
+from chatApplication.models.Users import User
+
+
+class HistogramTest(SimpleTestCase):
+    def test_cumulative_buckets_across_threads(self):
+        import threading
+
+        histogram = Histogram((1, 5, 10))
+        histogram.observe(1)
+        threads = [threading.Thread(target=lambda: [histogram.observe(v) for v in (3, 7, 50)]) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        counts, total = histogram.snapshot()
+        self.assertEqual(counts, [1, 5, 9, 13])
+        self.assertEqual(total, 1 + 4 * 60)
+
+    def test_render_prometheus_text(self):
+        family = HistogramFamily('test_seconds', 'help text', ('view',), (0.5, 1))
+        family.labels('se"nd').observe(0.7)
+        lines = family.render()
+        self.assertEqual(lines[:2], ['# HELP test_seconds help text', '# TYPE test_seconds histogram'])
+        self.assertIn('test_seconds_bucket{view="se\\"nd",le="0.5"} 0', lines)
+        self.assertIn('test_seconds_bucket{view="se\\"nd",le="+Inf"} 1', lines)
+        self.assertIn('test_seconds_count{view="se\\"nd"} 1', lines)
+
+
+class InstrumentationMiddlewareTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        User.objects.create(username='alice')
+
+    def test_server_timing_header_reports_queries(self):
+        response = self.client.get('/user/get-user/nobody')
+        self.assertEqual(response.status_code, 404)
+        self.assertRegex(response['Server-Timing'],
+                         r'^db;dur=[\d.]+;desc="1 queries", ser;dur=[\d.]+, total;dur=[\d.]+$')
+
+    def test_requests_are_recorded_per_url_name(self):
+        before = REQUEST_SECONDS.labels('get-user', 'GET', '200').snapshot()[0][-1]
+        queries_before = DB_QUERIES.labels('get-user').snapshot()[1]
+        for _ in range(3):
+            self.assertEqual(self.client.get('/user/get-user/alice').status_code, 200)
+        self.assertEqual(REQUEST_SECONDS.labels('get-user', 'GET', '200').snapshot()[0][-1], before + 3)
+        # the user cache only fills on commit, so inside the test transaction every lookup is a query
+        self.assertEqual(DB_QUERIES.labels('get-user').snapshot()[1], queries_before + 3)
+
+    def test_streamed_response_size_is_recorded(self):
+        count_before = RESPONSE_BYTES.labels('all-users').snapshot()[0][-1]
+        response = self.client.get('/user/all-users/')
+        body = b''.join(response.streaming_content)
+        self.assertEqual(json.loads(body), [dict(id=User.objects.get().id, username='alice')])
+        self.assertEqual(RESPONSE_BYTES.labels('all-users').snapshot()[0][-1], count_before + 1)
+
+    def test_metrics_endpoint(self):
+        self.client.get('/user/get-user/alice')
+        response = self.client.get('/metrics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        text = response.content.decode()
+        self.assertIn('# TYPE chat_request_duration_seconds histogram', text)
+        self.assertIn('chat_request_db_queries_count{view="get-user"}', text)
+        self.assertIn('chat_cache_hits{cache="username"}', text)
+        self.assertIn('chat_push_subscribers ', text)
+
+    @override_settings(METRICS_SLOW_QUERY_MS=0.000001)
+    def test_slow_queries_are_logged(self):
+        with self.assertLogs('chatApplication.metrics.instrumentation', logging.WARNING) as logs:
+            self.client.get('/user/get-user/alice')
+        self.assertIn('Slow query', logs.output[0])
+
+    @override_settings(METRICS_SERVER_TIMING=False)
+    def test_server_timing_can_be_turned_off(self):
+        self.assertNotIn('Server-Timing', self.client.get('/user/get-user/alice'))
+
+
+@override_settings(ASYNC_DB_POOL_SIZE=0)
+class AsyncInstrumentationTest(TestCase):
+    async def test_async_requests_count_queries_run_in_other_threads(self):
+        response = await AsyncClient().get('/user/get-user/nobody')
+        self.assertIn('desc="1 queries"', response['Server-Timing'])
@@ -0,0 +1,70 @@
+from datetime import datetime, timedelta
+from io import StringIO
+
+import pytz
+from django.core.management import call_command, CommandError
+from django.db import connection
+from django.test import TestCase
+
+from chatApplication.models import MessageRecord
+from chatApplication.models.Users import User
+from chatApplication.storage import partitions
+
+
+class PartitionHelpersTest(TestCase):
+    def test_month_arithmetic(self):
+        month = partitions.month_start(datetime(2025, 11, 17, 13, 5, tzinfo=pytz.UTC))
+        self.assertEqual(month, datetime(2025, 11, 1, tzinfo=pytz.UTC))
+        self.assertEqual(partitions.add_months(month, 2), datetime(2026, 1, 1, tzinfo=pytz.UTC))
+        self.assertEqual(partitions.add_months(month, -11), datetime(2024, 12, 1, tzinfo=pytz.UTC))
+        name = partitions.partition_name(month)
+        self.assertEqual(name, 'chatApplication_messagerecord_p2025_11')
+        self.assertEqual(partitions.month_of_partition(name), month)
+
+
+class ManagePartitionsCommandTest(TestCase):
+    def setUp(self):
+        self.sender = User.objects.create(username='sender')
+        self.receiver = User.objects.create(username='receiver')
+        now = datetime.now(pytz.UTC)
+        self.old = [self.send(now - timedelta(days=days)) for days in (500, 480, 470)]
+        self.recent = [self.send(now - timedelta(days=days)) for days in (40, 1)]
+
+    def send(self, date_sent):
+        return MessageRecord.objects.create(sender=self.sender, receiver=self.receiver,
+                                            message=str(date_sent), date_sent=date_sent)
+
+    def call(self, *args):
+        out = StringIO()
+        call_command('manage_partitions', *args, stdout=out)
+        return out.getvalue()
+
+    def test_expired_months_are_moved_to_archive_tables(self):
+        self.call('--retention-days', '365')
+
+        self.assertEqual(sorted(MessageRecord.objects.values_list('id', flat=True)),
+                         sorted(record.id for record in self.recent))
+        archived = 0
+        with connection.cursor() as cursor:
+            for name in partitions.bucket_tables(connection):
+                cursor.execute(f'SELECT COUNT(*) FROM {connection.ops.quote_name(name)}')
+                archived += cursor.fetchone()[0]
+        self.assertEqual(archived, len(self.old))
+
+        # a second run finds nothing left to expire
+        self.assertNotIn('archived', self.call('--retention-days', '365'))
+
+    def test_drop_deletes_without_archiving(self):
+        self.call('--retention-days', '365', '--drop')
+        self.assertEqual(MessageRecord.objects.count(), len(self.recent))
+        self.assertEqual(partitions.bucket_tables(connection), [])
+
+    def test_dry_run_changes_nothing(self):
+        out = self.call('--retention-days', '365', '--dry-run')
+        self.assertIn('would archive', out)
+        self.assertEqual(MessageRecord.objects.count(), len(self.old) + len(self.recent))
+        self.assertEqual(partitions.bucket_tables(connection), [])
+
+    def test_retention_shorter_than_default_range_is_rejected(self):
+        with self.assertRaises(CommandError):
+            self.call('--retention-days', '7')
@@ -0,0 +1,250 @@
+import asyncio
+import json
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytz
+from asgiref.sync import sync_to_async
+from django.test import SimpleTestCase, TestCase, Client, override_settings
+from django.test.client import AsyncRequestFactory
+
+from chatApplication.apis import async_message_api
+from chatApplication.caches.lru_cache import clear_caches
+from chatApplication.models import MessageRecord
+from chatApplication.models.Users import User
+from chatApplication.realtime.consumers import realtime_router
+from chatApplication.realtime.hub import InMemoryHub, get_hub
+from chatApplication.realtime.waiters import waiters
+
+
+class HubTest(SimpleTestCase):
+    async def test_fan_out_reaches_every_subscriber_of_the_receiver(self):
+        hub = InMemoryHub()
+        first, second = hub.subscribe('receiver'), hub.subscribe('receiver')
+        other = hub.subscribe('other')
+        hub.publish('receiver', dict(message='hello'))
+        self.assertEqual(await asyncio.wait_for(first.get(), 1), dict(message='hello'))
+        self.assertEqual(await asyncio.wait_for(second.get(), 1), dict(message='hello'))
+        await asyncio.sleep(0)
+        self.assertTrue(other.queue.empty())
+        self.assertEqual(hub.stats()['delivered'], 2)
+
+    async def test_publish_from_another_thread(self):
+        hub = InMemoryHub()
+        subscription = hub.subscribe('receiver')
+        threading.Thread(target=hub.publish, args=('receiver', dict(message='threaded'))).start()
+        self.assertEqual(await asyncio.wait_for(subscription.get(), 1), dict(message='threaded'))
+
+    @override_settings(PUSH_QUEUE_SIZE=2, PUSH_SLOW_CONSUMER_POLICY='drop')
+    async def test_slow_consumer_drops_oldest(self):
+        hub = InMemoryHub()
+        subscription = hub.subscribe('receiver')
+        for i in range(5):
+            hub.publish('receiver', dict(message=i))
+        await asyncio.sleep(0)
+        self.assertEqual([await subscription.get(), await subscription.get()], [dict(message=3), dict(message=4)])
+        self.assertEqual(subscription.dropped, 3)
+
+    @override_settings(PUSH_QUEUE_SIZE=2, PUSH_SLOW_CONSUMER_POLICY='disconnect')
+    async def test_slow_consumer_is_disconnected(self):
+        hub = InMemoryHub()
+        subscription = hub.subscribe('receiver')
+        for i in range(3):
+            hub.publish('receiver', dict(message=i))
+        await asyncio.sleep(0)
+        self.assertIsNone(await subscription.get())
+        self.assertEqual(hub.subscriber_count(), 0)
+        self.assertEqual(hub.stats()['disconnected'], 1)
+
+
+class ASGIChannelTest(SimpleTestCase):
+    async def _connect(self, scope, first_event):
+        """Runs the router for scope and returns (client events queue, sent events queue, task)"""
+        incoming, outgoing = asyncio.Queue(), asyncio.Queue()
+        if first_event:
+            incoming.put_nowait(first_event)
+        router = realtime_router(None)
+        task = asyncio.ensure_future(router(scope, incoming.get, outgoing.put))
+        return incoming, outgoing, task
+
+    async def _wait_for_subscriber(self, username):
+        hub = get_hub()
+        for _ in range(100):
+            if hub._subscriptions.get(username):
+                return
+            await asyncio.sleep(0.01)
+        self.fail('no subscriber')
+
+    async def test_websocket_receives_published_messages(self):
+        incoming, outgoing, task = await self._connect(
+            dict(type='websocket', path='/ws/messages/ws-receiver'), dict(type='websocket.connect'))
+        self.assertEqual((await asyncio.wait_for(outgoing.get(), 1))['type'], 'websocket.accept')
+        await self._wait_for_subscriber('ws-receiver')
+
+        get_hub().publish('ws-receiver', dict(id=1, message='pushed'))
+        frame = await asyncio.wait_for(outgoing.get(), 1)
+        self.assertEqual(json.loads(frame['text']), dict(id=1, message='pushed'))
+
+        incoming.put_nowait(dict(type='websocket.disconnect'))
+        await asyncio.wait_for(task, 1)
+        self.assertFalse(get_hub()._subscriptions.get('ws-receiver'))
+
+    async def test_sse_streams_published_messages(self):
+        incoming, outgoing, task = await self._connect(
+            dict(type='http', method='GET', path='/message/stream/sse-receiver'), None)
+        start = await asyncio.wait_for(outgoing.get(), 1)
+        self.assertEqual(start['status'], 200)
+        self.assertIn((b'content-type', b'text/event-stream'), start['headers'])
+        await self._wait_for_subscriber('sse-receiver')
+
+        get_hub().publish('sse-receiver', dict(id=7, message='pushed'))
+        event = await asyncio.wait_for(outgoing.get(), 1)
+        self.assertTrue(event['body'].startswith(b'id: 7\nevent: message\ndata: '))
+
+        incoming.put_nowait(dict(type='http.disconnect'))
+        await asyncio.wait_for(task, 1)
+        self.assertFalse(get_hub()._subscriptions.get('sse-receiver'))
+
+
+class SendPublishesTest(TestCase):
+    def tearDown(self):
+        # Callbacks run by captureOnCommitCallbacks cached rows this test's rollback removes
+        clear_caches()
+
+    def test_send_message_publishes_to_receiver_after_commit(self):
+        loop = asyncio.new_event_loop()
+        try:
+            subscription = get_hub().subscribe('push-receiver', loop=loop)
+            with self.captureOnCommitCallbacks(execute=True):
+                response = Client().post('/message/send/push-receiver', data=dict(sender='sender', message='hi'),
+                                         content_type='application/json')
+            self.assertEqual(response.status_code, 200)
+            payload = loop.run_until_complete(asyncio.wait_for(subscription.get(), 1))
+            self.assertEqual(payload['message'], 'hi')
+            self.assertEqual(payload['sender'], 'sender')
+            self.assertEqual(payload['receiver'], 'push-receiver')
+            get_hub().unsubscribe(subscription)
+        finally:
+            loop.close()
+
+    def test_nothing_is_published_before_commit(self):
+        hub = get_hub()
+        published = hub.published
+        Client().post('/message/send/push-receiver', data=dict(sender='sender', message='hi'),
+                      content_type='application/json')
+        self.assertEqual(hub.published, published)
+
+
+class SyncAPITest(TestCase):
+    def setUp(self):
+        self.sender = User.objects.create(username='sender')
+        self.receiver = User.objects.create(username='receiver')
+        self.client = Client()
+        self.utc_now = datetime.now(pytz.UTC).replace(microsecond=0)
+        for i in range(0, 5):
+            self._save(f'message {i}', self.utc_now - timedelta(hours=5 - i))
+        # Outside the default date range
+        self._save('too old', self.utc_now - timedelta(days=90))
+
+    def tearDown(self):
+        clear_caches()
+
+    def _save(self, message, date_sent=None):
+        MessageRecord(date_sent=date_sent or self.utc_now, message=message,
+                      sender=self.sender, receiver=self.receiver).save()
+
+    def _sync(self, query=''):
+        response = self.client.get(f'/message/sync/?receiver=receiver{query}')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_sync_returns_only_messages_after_the_cursor(self):
+        body = self._sync()
+        self.assertEqual([x['message'] for x in body['results']], [f'message {i}' for i in range(5)])
+        self.assertFalse(body['has_more'])
+
+        self.assertEqual(self._sync(f'&since={body["cursor"]}')['results'], [])
+        self._save('new message', self.utc_now - timedelta(minutes=1))
+        newer = self._sync(f'&since={body["cursor"]}')
+        self.assertEqual([x['message'] for x in newer['results']], ['new message'])
+        self.assertNotEqual(newer['cursor'], body['cursor'])
+
+    def test_sync_pages_with_has_more(self):
+        body = self._sync('&per_page=3')
+        self.assertEqual(len(body['results']), 3)
+        self.assertTrue(body['has_more'])
+        body = self._sync(f'&per_page=3&since={body["cursor"]}')
+        self.assertEqual([x['message'] for x in body['results']], ['message 3', 'message 4'])
+        self.assertFalse(body['has_more'])
+
+    def test_idle_long_poll_times_out_with_one_query(self):
+        cursor = self._sync()['cursor']
+        started = time.monotonic()
+        with self.assertNumQueries(1):
+            body = self._sync(f'&since={cursor}&wait=0.2')
+        self.assertGreaterEqual(time.monotonic() - started, 0.2)
+        self.assertEqual(body, dict(results=[], cursor=cursor, has_more=False))
+
+    @override_settings(SYNC_SETTLE_MS=100)
+    def test_long_poll_is_woken_by_a_send(self):
+        cursor = self._sync()['cursor']
+        timer = threading.Timer(0.1, waiters.notify, args=('receiver',))
+        timer.start()
+        started = time.monotonic()
+        with self.assertNumQueries(2):
+            self._sync(f'&since={cursor}&wait=10')
+        timer.join()
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertEqual(waiters.waiting(), 0)
+
+    @override_settings(SYNC_SETTLE_MS=300)
+    def test_message_committed_late_is_not_skipped(self):
+        now = datetime.now(pytz.UTC)
+        self._save('recent', now)
+        body = self._sync()
+        self.assertEqual([x['message'] for x in body['results']], [f'message {i}' for i in range(5)])
+        # Sent before 'recent', committed after the position was handed out
+        self._save('late', now - timedelta(milliseconds=100))
+        time.sleep(0.35)
+        body = self._sync(f'&since={body["cursor"]}')
+        self.assertEqual([x['message'] for x in body['results']], ['late', 'recent'])
+
+    @override_settings(SYNC_SETTLE_MS=300)
+    def test_long_poll_returns_a_held_back_message_once_it_settled(self):
+        self._save('recent', datetime.now(pytz.UTC))
+        cursor = self._sync()['cursor']
+        started = time.monotonic()
+        body = self._sync(f'&since={cursor}&wait=10')
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertEqual([x['message'] for x in body['results']], ['recent'])
+
+    def test_send_wakes_waiters_after_commit(self):
+        with waiters.waiter('receiver') as waiter:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post('/message/send/receiver', data=dict(sender='sender', message='hi'),
+                                 content_type='application/json')
+            self.assertTrue(waiter.wait(0))
+
+    def test_bad_params(self):
+        self.assertEqual(self.client.get('/message/sync/').status_code, 400)
+        self.assertEqual(self.client.get('/message/sync/?receiver=receiver&since=nope').status_code, 400)
+        self.assertEqual(self.client.get('/message/sync/?receiver=receiver&wait=soon').status_code, 400)
+
+    @override_settings(ASYNC_DB_POOL_SIZE=0, SYNC_SETTLE_MS=200)
+    async def test_async_long_poll_returns_the_new_message(self):
+        factory = AsyncRequestFactory()
+        response = await async_message_api.sync_messages(factory.get('/message/sync/?receiver=receiver'))
+        cursor = json.loads(response.content)['cursor']
+
+        task = asyncio.ensure_future(async_message_api.sync_messages(
+            factory.get(f'/message/sync/?receiver=receiver&since={cursor}&wait=10')))
+        for _ in range(100):
+            if waiters.waiting():
+                break
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.05)  # let the first (empty) query finish
+        await sync_to_async(self._save)('pushed')
+        waiters.notify('receiver')
+        response = await asyncio.wait_for(task, 5)
+        self.assertEqual([x['message'] for x in json.loads(response.content)['results']], ['pushed'])
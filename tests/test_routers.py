@@ -0,0 +1,106 @@
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections
+from django.test import Client, SimpleTestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from chatApplication.caches.lru_cache import clear_caches
+from chatApplication.models.Users import User
+from chatApplication.storage import routers
+from chatApplication.storage.routers import ReplicaPool, ReplicaRouter, get_replica_pool
+
+
+class ReplicaPoolTest(SimpleTestCase):
+    def test_round_robin(self):
+        pool = ReplicaPool(['a', 'b'])
+        self.assertEqual([pool.candidates()[0] for _ in range(4)], ['a', 'b', 'a', 'b'])
+
+    def test_ejected_replica_is_skipped_until_it_is_retried(self):
+        pool = ReplicaPool(['a', 'b'])
+        pool.eject('a')
+        self.assertEqual(pool.candidates(), ['b'])
+        self.assertEqual(pool.healthy(), ['b'])
+        with override_settings(REPLICA_EJECT_SECONDS=0):
+            pool.eject('a')
+            self.assertEqual(pool.healthy(), ['a', 'b'])
+
+    @override_settings(DATABASE_REPLICAS=['replica'])
+    def test_replicas_are_not_migrated(self):
+        router = ReplicaRouter()
+        self.assertFalse(router.allow_migrate('replica', 'chatApplication'))
+        self.assertIsNone(router.allow_migrate(DEFAULT_DB_ALIAS, 'chatApplication'))
+
+    @override_settings(DATABASE_REPLICAS=['replica'])
+    def test_instances_read_from_a_replica_are_saved_to_the_primary(self):
+        user = User(username='someone')
+        user._state.db = 'replica'
+        self.assertEqual(ReplicaRouter().db_for_write(User, instance=user), DEFAULT_DB_ALIAS)
+
+
+HAS_REPLICA = 'replica' in settings.DATABASES
+
+
+@skipUnless(HAS_REPLICA, 'needs a replica alias, e.g. --settings=tests.sqlite_settings')
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRoutingTest(TransactionTestCase):
+    # The replica mirrors the default test database; it sees committed rows only, hence TransactionTestCase
+    databases = {'default', 'replica'} if HAS_REPLICA else {'default'}
+
+    def setUp(self):
+        self.addCleanup(setattr, routers, '_pool', None)
+        User.objects.create(username='someone')
+        # get_user must read the database, not the user cache
+        clear_caches()
+        self.client = Client()
+
+    def _get_user(self, client=None):
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections['replica']) as replica:
+            response = (client or self.client).get('/user/get-user/someone')
+        self.assertEqual(response.status_code, 200)
+        return len(primary), len(replica)
+
+    def test_reads_go_to_the_replica(self):
+        self.assertEqual(self._get_user(), (0, 1))
+
+    def test_writes_go_to_the_primary_and_pin_the_client(self):
+        with CaptureQueriesContext(connections['replica']) as replica:
+            response = self.client.post('/user/create-user/another')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(replica), 0)
+        self.assertIn(settings.REPLICA_PIN_COOKIE, response.cookies)
+        self.assertEqual(self._get_user(), (1, 0))
+
+    def test_clients_sharing_the_address_are_not_pinned(self):
+        self.client.post('/user/create-user/another')
+        self.assertEqual(self._get_user(Client()), (0, 1))
+
+    def test_pages_missing_from_the_cache_are_rendered_on_the_replica(self):
+        self.client.post('/message/send/bob', data=dict(sender='someone', message='hi'),
+                         content_type='application/json')
+        reader = Client()
+        with CaptureQueriesContext(connections['default']) as primary:
+            with CaptureQueriesContext(connections['replica']) as first_reads:
+                first = reader.get('/message/retrieve/all/')
+            # Not cached: answering the unchanged page reads the replica again
+            with CaptureQueriesContext(connections['replica']) as unchanged_reads:
+                unchanged = reader.get('/message/retrieve/all/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(len(primary), 0)
+        self.assertEqual((first.status_code, unchanged.status_code), (200, 304))
+        self.assertEqual(unchanged['ETag'], first['ETag'])
+        self.assertEqual(len(unchanged_reads), len(first_reads))
+
+    def test_unreachable_replica_is_ejected(self):
+        with mock.patch('chatApplication.storage.routers.ensure_connection', return_value=False):
+            self.assertEqual(self._get_user(), (1, 0))
+        self.assertEqual(get_replica_pool().healthy(), [])
+
+    def test_failed_query_is_retried_on_the_primary(self):
+        def fail(execute, sql, params, many, context):
+            raise OperationalError('replica went away')
+
+        with connections['replica'].execute_wrapper(fail):
+            primary, _ = self._get_user()
+        self.assertEqual(primary, 1)
+        self.assertEqual(get_replica_pool().healthy(), [])
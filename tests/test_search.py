@@ -0,0 +1,82 @@
+import json
+from datetime import datetime, timedelta
+
+import pytz
+from django.test import TestCase, Client
+
+from chatApplication.models import MessageRecord, SearchToken
+from chatApplication.models.SearchTokens import tokenize
+
+
+class SearchAPITest(TestCase):
+    def setUp(self):
+        self.client = Client()
+
+    def _send(self, sender, receiver, message):
+        response = self.client.post(f'/message/send/{receiver}', data=dict(sender=sender, message=message),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+
+    def _search(self, **params):
+        response = self.client.get('/message/search/', data=params)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content)
+
+    def test_tokenize(self):
+        self.assertEqual(tokenize('Lunch at 12? lunch!'), ['lunch', 'at', '12', 'lunch'])
+
+    def test_every_term_must_match_and_results_are_ranked(self):
+        self._send('alice', 'bob', 'lunch today?')
+        self._send('bob', 'alice', 'lunch lunch lunch today')
+        self._send('alice', 'bob', 'dinner today')
+        self._send('carol', 'dave', 'lunch today')  # not alice's
+
+        results = self._search(user='alice', q='Today LUNCH')['results']
+        self.assertEqual([x['message'] for x in results], ['lunch lunch lunch today', 'lunch today?'])
+        self.assertGreater(results[0]['rank'], results[1]['rank'])
+        self.assertEqual(self._search(user='alice', q='breakfast')['results'], [])
+
+    def test_scoped_to_a_counterpart(self):
+        self._send('alice', 'bob', 'see you')
+        self._send('carol', 'alice', 'see you')
+        results = self._search(user='alice', q='see', counterpart='carol')['results']
+        self.assertEqual([(x['sender'], x['receiver']) for x in results], [('carol', 'alice')])
+
+    def test_scoped_to_a_date_range(self):
+        self._send('alice', 'bob', 'recent news')
+        old = MessageRecord.objects.get()
+        old.date_sent -= timedelta(days=3)
+        old.save()
+        SearchToken.objects.update(date_sent=old.date_sent)
+        self._send('alice', 'bob', 'new news')
+
+        start = (datetime.now(pytz.UTC) - timedelta(days=1)).isoformat()
+        self.assertEqual([x['message'] for x in self._search(user='alice', q='news', start=start)['results']],
+                         ['new news'])
+        self.assertEqual(len(self._search(user='alice', q='news')['results']), 2)
+
+    def test_keyset_pagination_visits_every_match_once(self):
+        for i in range(7):
+            self._send('alice', 'bob', 'ping ' * (i % 3 + 1) + str(i))
+        seen, cursor = [], ''
+        while cursor is not None:
+            page = self._search(user='alice', q='ping', per_page=3, cursor=cursor)
+            seen += [x['message'] for x in page['results']]
+            cursor = page['next_cursor']
+        self.assertEqual(len(seen), 7)
+        self.assertEqual(len(set(seen)), 7)
+
+    def test_batch_sends_are_indexed(self):
+        self.client.post('/message/send/batch/', content_type='application/json', data=dict(messages=[
+            dict(sender='alice', receiver='bob', message=f'batch message {i}') for i in range(3)]))
+        results = self._search(user='bob', q='batch 2')['results']
+        self.assertEqual([x['message'] for x in results], ['batch message 2'])
+        self.assertEqual(results[0]['id'], MessageRecord.objects.get(message='batch message 2').id)
+
+    def test_bad_params(self):
+        self.assertEqual(self.client.get('/message/search/', data=dict(user='alice')).status_code, 400)
+        self.assertEqual(self.client.get('/message/search/', data=dict(user='alice', q='?!')).status_code, 400)
+        self.assertEqual(self.client.get('/message/search/', data=dict(user='alice', q='x', start='soon')).status_code,
+                         400)
+        self.assertEqual(self.client.get('/message/search/', data=dict(user='alice', q='x', cursor='bad')).status_code,
+                         400)
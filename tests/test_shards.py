@@ -0,0 +1,206 @@
+import json
+import time
+from io import StringIO
+from unittest import skipUnless
+
+from django.conf import settings
+from django.core.management import call_command
+from django.test import Client, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+
+from chatApplication.caches.lru_cache import clear_caches
+from chatApplication.models import Conversation, InboxEntry, MessageRecord, SearchToken
+from chatApplication.models.Users import User
+from chatApplication.storage import transfer
+from chatApplication.storage.shards import jump_hash, shard_for
+
+SHARDS = ['default', 'shard_2']
+HAS_SHARD = 'shard_2' in settings.DATABASES
+
+
+def pair_on(shard: str) -> tuple:
+    """(sender, receiver) usernames whose conversation is stored on shard"""
+    for index in range(1000):
+        pair = (f'sender{index}', f'receiver{index}')
+        if shard_for(*pair) == shard:
+            return pair
+
+
+class JumpHashTest(SimpleTestCase):
+    def test_keys_spread_over_every_bucket(self):
+        buckets = [jump_hash(key * 7919, 4) for key in range(1000)]
+        self.assertEqual(set(buckets), {0, 1, 2, 3})
+        self.assertTrue(all(150 < buckets.count(bucket) < 350 for bucket in range(4)))
+
+    def test_a_new_bucket_only_takes_keys(self):
+        moved = [key for key in range(1000) if jump_hash(key, 4) != jump_hash(key, 5)]
+        self.assertTrue(all(jump_hash(key, 5) == 4 for key in moved))
+        self.assertTrue(150 < len(moved) < 250)
+
+    def test_shard_for_is_stable(self):
+        self.assertEqual(shard_for('alice', 'bob'), 'default')
+        with override_settings(MESSAGE_SHARDS=SHARDS):
+            self.assertIn(shard_for('alice', 'bob'), SHARDS)
+            self.assertEqual(shard_for('alice', 'bob'), shard_for('alice', 'bob'))
+            self.assertEqual({shard_for(*pair_on(shard)) for shard in SHARDS}, set(SHARDS))
+
+
+@skipUnless(HAS_SHARD, 'needs a shard_2 alias, e.g. --settings=tests.sqlite_settings')
+@override_settings(MESSAGE_SHARDS=SHARDS, SHARD_SCATTER_POOL_SIZE=0)
+class ShardedAPITest(TestCase):
+    databases = {'default', 'shard_2'} if HAS_SHARD else {'default'}
+
+    def setUp(self):
+        clear_caches()
+        self.client = Client()
+        self.on_default = pair_on('default')
+        self.on_shard = pair_on('shard_2')
+
+    def _send(self, pair, message):
+        response = self.client.post(f'/message/send/{pair[1]}', data=dict(sender=pair[0], message=message),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+
+    def _get(self, url, data=None, **params):
+        response = self.client.generic('GET', url, data=data or '', content_type='application/x-www-form-urlencoded',
+                                       QUERY_STRING='&'.join(f'{key}={value}' for key, value in params.items()))
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content)
+
+    def test_a_conversation_is_stored_on_its_shard(self):
+        self._send(self.on_default, 'one')
+        self._send(self.on_shard, 'two')
+        self.assertEqual(list(MessageRecord.objects.using('default').values_list('message', flat=True)), ['one'])
+        self.assertEqual(list(MessageRecord.objects.using('shard_2').values_list('message', flat=True)), ['two'])
+        self.assertEqual(Conversation.objects.using('shard_2').count(), 1)
+        self.assertEqual(SearchToken.objects.using('shard_2').get().token, 'two')
+        # Users keep their ids on the shard; the inbox stays on the default database
+        self.assertEqual(set(User.objects.using('shard_2').values_list('id', 'username')),
+                         set(User.objects.filter(username__in=self.on_shard).values_list('id', 'username')))
+        self.assertEqual(InboxEntry.objects.count(), 4)
+
+    def test_retrieve_reads_the_conversations_shard(self):
+        self._send(self.on_default, 'one')
+        self._send(self.on_shard, 'two')
+        data = f'sender={self.on_shard[0]}&receiver={self.on_shard[1]}'
+        self.assertEqual([x['message'] for x in self._get('/message/retrieve/', data, cursor='')['results']],
+                         ['two'])
+
+    def test_retrieve_all_merges_every_shard(self):
+        messages = []
+        for index in range(5):
+            for pair in (self.on_default, self.on_shard):
+                messages.append(f'{pair[0]} {index}')
+                self._send(pair, messages[-1])
+        seen, cursor = [], ''
+        while cursor is not None:
+            page = self._get('/message/retrieve/all/', cursor=cursor, per_page=3)
+            seen += page['results']
+            cursor = page['next_cursor']
+        self.assertEqual(sorted(x['message'] for x in seen), sorted(messages))
+        # Ids are unique across shards, so they order the merged pages on their own
+        self.assertEqual(seen, sorted(seen, key=lambda x: x['id'], reverse=True))
+        self.assertEqual(len({x['id'] for x in seen}), len(messages))
+
+        self.assertEqual(len(self._get('/message/retrieve/all/', page=2, per_page=4)), 4)
+        columnar = self._get('/message/retrieve/all/', format='columnar', per_page=4)
+        self.assertEqual((columnar['count'], columnar['num_pages']), (4, 3))
+
+    @override_settings(SYNC_SETTLE_MS=50)
+    def test_sync_keeps_a_position_per_shard(self):
+        receiver = self.on_shard[1]
+        sender = next(f'other{index}' for index in range(1000) if shard_for(f'other{index}', receiver) == 'default')
+        self._send(self.on_shard, 'one')
+        self._send((sender, receiver), 'two')
+        time.sleep(0.1)  # sync holds back what is not settled yet
+        page = self._get('/message/sync/', receiver=receiver, per_page=1)
+        self.assertTrue(page['has_more'])
+        page = self._get('/message/sync/', receiver=receiver, since=page['cursor'])
+        self.assertEqual(len(page['results']), 1)
+        self.assertFalse(page['has_more'])
+        self.assertEqual(self._get('/message/sync/', receiver=receiver, since=page['cursor'])['results'], [])
+        # A position from a single shard setup does not fit two shards
+        response = self.client.get(f'/message/sync/?receiver={receiver}&since=WzFd')
+        self.assertEqual(response.status_code, 400)
+
+    def test_search_merges_every_shard(self):
+        sender = self.on_shard[0]
+        receiver = next(f'other{index}' for index in range(1000) if shard_for(sender, f'other{index}') == 'default')
+        self._send(self.on_shard, 'lunch lunch')
+        self._send((sender, receiver), 'lunch')
+        results = self._get('/message/search/', user=sender, q='lunch')['results']
+        self.assertEqual([x['message'] for x in results], ['lunch lunch', 'lunch'])
+
+    def test_batch_spans_shards(self):
+        items = [dict(sender=pair[0], receiver=pair[1], message='hi') for pair in (self.on_default, self.on_shard)]
+        response = self.client.post('/message/send/batch/', data=dict(messages=items), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(MessageRecord.objects.using('default').count(), 1)
+        self.assertEqual(MessageRecord.objects.using('shard_2').count(), 1)
+
+    def test_export_merges_every_shard(self):
+        self._send(self.on_shard, 'one')
+        self._send(self.on_default, 'two')
+        rows = list(transfer.export_rows('messages'))
+        self.assertEqual([row['message'] for row in rows], ['one', 'two'])
+
+
+@skipUnless(HAS_SHARD, 'needs a shard_2 alias, e.g. --settings=tests.sqlite_settings')
+@override_settings(SHARD_SCATTER_POOL_SIZE=0)
+class RebalanceShardsTest(TestCase):
+    databases = {'default', 'shard_2'} if HAS_SHARD else {'default'}
+
+    def setUp(self):
+        clear_caches()
+        self.client = Client()
+        with override_settings(MESSAGE_SHARDS=SHARDS):
+            self.moving = pair_on('shard_2')
+            self.staying = pair_on('default')
+        # Sent while default was the only shard
+        for pair in (self.moving, self.staying):
+            for message in ('hello there', 'again'):
+                self.client.post(f'/message/send/{pair[1]}', data=dict(sender=pair[0], message=message),
+                                 content_type='application/json')
+
+    def call(self, *args):
+        out = StringIO()
+        with override_settings(MESSAGE_SHARDS=SHARDS):
+            call_command('rebalance_shards', *args, stdout=out)
+        return out.getvalue()
+
+    def test_dry_run_changes_nothing(self):
+        self.assertIn('would move 1 conversations, 2 messages', self.call('--dry-run'))
+        self.assertEqual(MessageRecord.objects.using('shard_2').count(), 0)
+
+    def test_conversations_move_to_their_new_shard(self):
+        self.assertIn('moved 1 conversations, 2 messages', self.call('--batch-size', '1'))
+        self.assertEqual(set(MessageRecord.objects.using('shard_2').values_list('sender__username', flat=True)),
+                         {self.moving[0]})
+        self.assertEqual(set(MessageRecord.objects.using('default').values_list('sender__username', flat=True)),
+                         {self.staying[0]})
+        self.assertFalse(Conversation.objects.filter(sender__username=self.moving[0]).exists())
+        self.assertEqual(SearchToken.objects.using('shard_2').filter(token='hello').count(), 1)
+        self.assertEqual(SearchToken.objects.using('default').filter(token='hello').count(), 1)
+        self.assertIn('moved 0 conversations', self.call())
+
+        with override_settings(MESSAGE_SHARDS=SHARDS):
+            response = self.client.generic('GET', '/message/retrieve/?cursor=',
+                                           data=f'sender={self.moving[0]}&receiver={self.moving[1]}',
+                                           content_type='application/x-www-form-urlencoded')
+        self.assertEqual([x['message'] for x in json.loads(response.content)['results']], ['again', 'hello there'])
+
+
+@skipUnless(HAS_SHARD, 'needs a shard_2 alias, e.g. --settings=tests.sqlite_settings')
+@override_settings(MESSAGE_SHARDS=SHARDS, SHARD_SCATTER_POOL_SIZE=2)
+class ParallelScatterTest(TransactionTestCase):
+    # Shards are read from pool threads, on their own connections, which only see committed rows
+    databases = {'default', 'shard_2'} if HAS_SHARD else {'default'}
+
+    def test_retrieve_all_reads_shards_in_parallel(self):
+        clear_caches()
+        client = Client()
+        for shard in SHARDS:
+            sender, receiver = pair_on(shard)
+            client.post(f'/message/send/{receiver}', data=dict(sender=sender, message=shard),
+                        content_type='application/json')
+        response = client.generic('GET', '/message/retrieve/all/', QUERY_STRING='cursor=')
+        self.assertEqual(sorted(x['message'] for x in json.loads(response.content)['results']), SHARDS)
@@ -0,0 +1,103 @@
+import json
+from datetime import datetime
+from importlib import import_module
+from io import StringIO
+from unittest import mock
+
+import pytz
+from django.apps import apps
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+
+from chatApplication.caches.lru_cache import clear_caches
+from chatApplication.models import DailyMessageVolume, HourlyMessageVolume, MessageRecord
+from chatApplication.models.Users import User
+from chatApplication.signals import messages_sent
+
+DAY_1 = datetime(2026, 3, 1, 10, 15, tzinfo=pytz.UTC)
+DAY_2 = datetime(2026, 3, 2, 8, 0, tzinfo=pytz.UTC)
+RANGE = 'start=2026-03-01T00:00:00&end=2026-03-03T00:00:00'
+
+backfill_message_volumes = import_module(
+    'chatApplication.migrations.0011_message_volumes').backfill_message_volumes
+
+
+class MessageStatsTest(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.client = Client()
+        self.users = {username: User.objects.create(username=username) for username in ('alice', 'bob', 'carol')}
+        self._send([('alice', 'bob', DAY_1), ('alice', 'bob', DAY_1.replace(minute=50)),
+                    ('alice', 'bob', DAY_1.replace(hour=11)), ('bob', 'alice', DAY_2), ('alice', 'carol', DAY_2)])
+
+    def _send(self, messages):
+        records = [MessageRecord(sender=self.users[sender], receiver=self.users[receiver], message='hi',
+                                 date_sent=date_sent) for sender, receiver, date_sent in messages]
+        for record in records:
+            record.save()
+        messages_sent.send(sender=MessageRecord, records=records)
+
+    def _get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content)
+
+    def test_volume_per_day_and_hour(self):
+        daily = self._get(f'/stats/volume/alice?{RANGE}')
+        self.assertEqual(daily['results'], [dict(bucket='2026-03-01T00:00:00+00:00', sent=3, received=0),
+                                            dict(bucket='2026-03-02T00:00:00+00:00', sent=1, received=1)])
+        hourly = self._get(f'/stats/volume/alice?granularity=hour&counterpart=bob&{RANGE}')
+        self.assertEqual(hourly['results'], [dict(bucket='2026-03-01T10:00:00+00:00', sent=2, received=0),
+                                             dict(bucket='2026-03-01T11:00:00+00:00', sent=1, received=0),
+                                             dict(bucket='2026-03-02T08:00:00+00:00', sent=0, received=1)])
+
+    def test_top_users_and_counterparts(self):
+        self.assertEqual(self._get(f'/stats/top/?{RANGE}')['results'],
+                         [dict(username='alice', count=4), dict(username='bob', count=1)])
+        self.assertEqual(self._get(f'/stats/top/?direction=received&limit=1&{RANGE}')['results'],
+                         [dict(username='bob', count=3)])
+        self.assertEqual(self._get(f'/stats/top/?user=alice&{RANGE}')['results'],
+                         [dict(username='bob', count=3), dict(username='carol', count=1)])
+
+    def test_stats_do_not_read_messages(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self._get(f'/stats/volume/alice?{RANGE}')
+            self._get(f'/stats/top/?user=alice&{RANGE}')
+        self.assertFalse([query['sql'] for query in ctx.captured_queries if 'messagerecord' in query['sql']])
+
+    def test_sends_update_the_rollups(self):
+        self.client.post('/message/send/carol', data=dict(sender='bob', message='hello'),
+                         content_type='application/json')
+        self.client.post('/message/send/batch/', content_type='application/json', data=dict(messages=[
+            dict(sender='bob', receiver='carol', message='again')]))
+        self.assertEqual(DailyMessageVolume.objects.get(sender=self.users['bob'], receiver=self.users['carol']).count,
+                         2)
+
+    def test_rebuild_repairs_the_rollups(self):
+        expected = [self._get(f'/stats/volume/alice?granularity={granularity}&{RANGE}')
+                    for granularity in ('hour', 'day')]
+        HourlyMessageVolume.objects.filter(bucket__gte=DAY_2.replace(hour=0)).delete()
+        DailyMessageVolume.objects.update(count=99)
+        out = StringIO()
+        call_command('rebuild_message_volumes', '--start', '2026-03-01', '--end', '2026-03-02', stdout=out)
+        self.assertIn('rebuilt 2 days, 5 messages', out.getvalue())
+        self.assertEqual([self._get(f'/stats/volume/alice?granularity={granularity}&{RANGE}')
+                          for granularity in ('hour', 'day')], expected)
+
+    def test_migration_counts_the_messages_sent_before_the_rollups(self):
+        expected = [self._get(f'/stats/volume/alice?granularity={granularity}&{RANGE}')
+                    for granularity in ('hour', 'day')]
+        HourlyMessageVolume.objects.all().delete()
+        DailyMessageVolume.objects.all().delete()
+        backfill_message_volumes(apps, mock.Mock(connection=connection))
+        self.assertEqual([self._get(f'/stats/volume/alice?granularity={granularity}&{RANGE}')
+                          for granularity in ('hour', 'day')], expected)
+
+    def test_invalid_params_are_rejected(self):
+        self.assertEqual(self.client.get('/stats/volume/nobody').status_code, 404)
+        self.assertEqual(self.client.get('/stats/volume/alice?counterpart=nobody').status_code, 404)
+        self.assertEqual(self.client.get('/stats/volume/alice?granularity=week').status_code, 400)
+        self.assertEqual(self.client.get('/stats/top/?direction=both').status_code, 400)
+        self.assertEqual(self.client.get('/stats/top/?limit=0').status_code, 400)
@@ -0,0 +1,111 @@
+import asyncio
+import json
+import tracemalloc
+
+from django.core.signals import request_started
+from django.db import close_old_connections
+from django.test import TestCase, Client, SimpleTestCase, override_settings
+
+from chatApplication.apis.streaming import json_array_chunks, StreamingASGIHandler
+from chatApplication.models.Users import User
+
+
+class JsonArrayChunksTest(SimpleTestCase):
+    def test_output_is_one_json_array(self):
+        rows = [dict(id=i, username=f'user-{i}') for i in range(100)]
+        chunks = list(json_array_chunks(iter(rows), buffer_size=100))
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(json.loads(b''.join(chunks)), rows)
+
+    def test_empty(self):
+        self.assertEqual(b''.join(json_array_chunks(iter([]))), b'[]')
+
+
+@override_settings(STREAM_CHUNK_SIZE=200, STREAM_BUFFER_BYTES=4096)
+class AllUsersStreamingTest(TestCase):
+    def _create_users(self, start, count):
+        User.objects.bulk_create([User(username=f'user-{i:06}') for i in range(start, start + count)])
+
+    def _peak_memory_of_streaming(self) -> int:
+        response = Client().get('/user/all-users/')
+        self.assertTrue(response.streaming)
+        tracemalloc.start()
+        try:
+            rows = 0
+            for chunk in response.streaming_content:
+                rows += chunk.count(b'"username"')
+            return tracemalloc.get_traced_memory()[1], rows
+        finally:
+            tracemalloc.stop()
+
+    def test_all_users_output_is_unchanged(self):
+        self._create_users(0, 3)
+        response = Client().get('/user/all-users/')
+        self.assertEqual(response['Content-Type'], 'application/json')
+        users = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(users, [dict(id=user.id, username=user.username) for user in User.objects.order_by('id')])
+
+    def test_peak_memory_is_constant_in_the_result_size(self):
+        self._create_users(0, 2000)
+        small_peak, rows = self._peak_memory_of_streaming()
+        self.assertEqual(rows, 2000)
+
+        self._create_users(2000, 18000)
+        large_peak, rows = self._peak_memory_of_streaming()
+        self.assertEqual(rows, 20000)
+
+        # 10x the rows, materialising them would need ~10x the memory
+        self.assertLess(large_peak, small_peak * 2)
+
+
+# Pool size 0 reads on the test's own connection, inside its transaction
+@override_settings(ASYNC_DB_POOL_SIZE=0, STREAM_CHUNK_SIZE=200, STREAM_BUFFER_BYTES=4096, STREAM_CHUNKS_AHEAD=1)
+class StreamingASGIHandlerTest(TestCase):
+    def setUp(self):
+        User.objects.bulk_create([User(username=f'user-{i:06}') for i in range(2000)])
+        # Like the test client: the request cycle must not close the connection holding the test's transaction
+        request_started.disconnect(close_old_connections)
+        self.addCleanup(request_started.connect, close_old_connections)
+
+    async def _request(self, path, send):
+        requested = asyncio.Queue()
+        requested.put_nowait(dict(type='http.request', body=b''))
+        scope = dict(type='http', method='GET', path=path, query_string=b'', headers=[])
+        await StreamingASGIHandler()(scope, requested.get, send)
+
+    async def test_streaming_response_is_read_off_the_event_loop(self):
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        await self._request('/user/all-users/', send)
+        self.assertEqual(sent[0]['status'], 200)
+        self.assertIn((b'Content-Type', b'application/json'), sent[0]['headers'])
+        self.assertGreater(len(sent), 3)
+        self.assertEqual(sent[-1], dict(type='http.response.body'))
+        users = json.loads(b''.join(message.get('body', b'') for message in sent[1:]))
+        self.assertEqual(len(users), 2000)
+        self.assertEqual(users[0]['username'], 'user-000000')
+
+    async def test_disconnected_client_stops_the_reader(self):
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+            if len(sent) == 3:
+                raise OSError('client disconnected')
+
+        with self.assertRaises(OSError):
+            await asyncio.wait_for(self._request('/user/all-users/', send), 5)
+        self.assertEqual(len(sent), 3)
+
+    async def test_other_responses_are_sent_as_usual(self):
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        await self._request('/user/get-user/user-000001', send)
+        self.assertEqual(sent[0]['status'], 200)
+        self.assertEqual(json.loads(sent[1]['body'])['username'], 'user-000001')
@@ -0,0 +1,108 @@
+import gzip
+import json
+import os
+import tempfile
+from datetime import datetime, timedelta
+from io import StringIO
+
+import pytz
+from django.core.management import CommandError, call_command
+from django.test import Client, TestCase
+
+from chatApplication.caches.lru_cache import clear_caches
+from chatApplication.models import Conversation, InboxEntry, MessageRecord, SearchToken
+from chatApplication.models.Users import User
+
+
+class HistoryTransferTest(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.client = Client()
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        for sender, receiver, message in (('alice', 'bob', 'hi bob'), ('bob', 'alice', 'hi, "alice"'),
+                                          ('carol', 'bob', '')):
+            self.client.post(f'/message/send/{receiver}', data=dict(sender=sender, message=message),
+                             content_type='application/json')
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory.name, name)
+
+    def call(self, *args) -> str:
+        out = StringIO()
+        call_command(*args, stdout=out)
+        return out.getvalue()
+
+    def clear_history(self):
+        SearchToken.objects.all().delete()
+        InboxEntry.objects.all().delete()
+        MessageRecord.objects.all().delete()
+        Conversation.objects.all().delete()
+        User.objects.all().delete()
+        clear_caches()
+
+    def history(self) -> list:
+        return sorted(MessageRecord.objects.values_list('sender__username', 'receiver__username', 'message',
+                                                        'date_sent'))
+
+    def test_round_trip(self):
+        history = self.history()
+        for name in ('messages.ndjson.gz', 'messages.csv'):
+            with self.subTest(name):
+                self.assertIn('exported 3 rows', self.call('export_history', 'messages', self.path(name)))
+                self.clear_history()
+                self.assertIn('imported 3 rows', self.call('import_history', 'messages', self.path(name),
+                                                           '--batch-size', '2'))
+                self.assertEqual(self.history(), history)
+                self.assertEqual(SearchToken.objects.filter(token='alice').count(), 1)
+                # Imported history counts as read
+                entry = InboxEntry.objects.get(owner__username='bob', counterpart__username='alice')
+                self.assertEqual((entry.last_message, entry.unread_count), ('hi, "alice"', 0))
+
+        with gzip.open(self.path('messages.ndjson.gz'), 'rt') as file:
+            self.assertEqual(set(json.loads(file.readline())), {'id', 'sender', 'receiver', 'date_sent', 'message'})
+
+    def test_filters(self):
+        self.call('export_history', 'messages', self.path('bob.ndjson'), '--user', 'alice')
+        with open(self.path('bob.ndjson')) as file:
+            self.assertEqual([json.loads(line)['message'] for line in file], ['hi bob', 'hi, "alice"'])
+        tomorrow = (datetime.now(pytz.UTC) + timedelta(days=1)).date().isoformat()
+        self.assertIn('exported 0 rows', self.call('export_history', 'messages', self.path('none.csv'),
+                                                   '--start', tomorrow))
+        self.assertIn('exported 3 rows', self.call('export_history', 'users', self.path('users.csv')))
+        with self.assertRaises(CommandError):
+            self.call('export_history', 'users', self.path('users.csv'), '--start', tomorrow)
+
+    def test_resumes_from_the_checkpoint(self):
+        self.call('export_history', 'messages', self.path('messages.ndjson'))
+        self.clear_history()
+        checkpoint = self.path('import.checkpoint')
+        with open(checkpoint, 'w') as file:
+            json.dump(dict(source=self.path('messages.ndjson'), rows=2), file)
+        self.assertIn('resuming after row 2', self.call('import_history', 'messages', self.path('messages.ndjson'),
+                                                        '--checkpoint', checkpoint))
+        self.assertEqual(list(MessageRecord.objects.values_list('sender__username', flat=True)), ['carol'])
+        with open(checkpoint) as file:
+            self.assertEqual(json.load(file)['rows'], 3)
+        with self.assertRaises(CommandError):
+            self.call('import_history', 'messages', self.path('other.ndjson'), '--checkpoint', checkpoint)
+
+    def test_resume_skips_the_batch_committed_after_the_checkpoint(self):
+        self.call('export_history', 'messages', self.path('messages.ndjson'))
+        history = self.history()
+        self.clear_history()
+        checkpoint = self.path('import.checkpoint')
+        self.call('import_history', 'messages', self.path('messages.ndjson'), '--batch-size', '2',
+                  '--checkpoint', checkpoint)
+        # Stopped after the last batch committed, before its checkpoint was saved
+        with open(checkpoint, 'w') as file:
+            json.dump(dict(source=self.path('messages.ndjson'), rows=2), file)
+        self.assertIn('imported 3 rows', self.call('import_history', 'messages', self.path('messages.ndjson'),
+                                                   '--batch-size', '2', '--checkpoint', checkpoint))
+        self.assertEqual(self.history(), history)
+
+    def test_invalid_rows_stop_the_import(self):
+        with open(self.path('bad.ndjson'), 'w') as file:
+            file.write(json.dumps(dict(sender='alice', receiver='b', message='hi', date_sent='2026-01-01')) + '\n')
+        with self.assertRaisesMessage(CommandError, 'row 1: b:'):
+            self.call('import_history', 'messages', self.path('bad.ndjson'))
@@ -0,0 +1,79 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.test import SimpleTestCase, TransactionTestCase, Client, override_settings
+
+from chatApplication.caches.lru_cache import clear_caches
+from chatApplication.ingest import write_buffer
+from chatApplication.ingest.write_buffer import WriteBuffer
+from chatApplication.models import MessageRecord
+
+
+class WriteBufferTest(SimpleTestCase):
+    def test_full_batches_flush_without_waiting_for_the_delay(self):
+        batches = []
+        gate = threading.Event()
+
+        def flush(items):
+            gate.wait(1)
+            batches.append(items)
+            return [item * 10 for item in items]
+
+        buffer = WriteBuffer(flush, max_batch=3, max_delay=60)
+        futures = [buffer.submit(i) for i in range(6)]
+        gate.set()
+        self.assertEqual([future.result(timeout=1) for future in futures], [0, 10, 20, 30, 40, 50])
+        self.assertEqual(batches[1:], [[3, 4, 5]])
+        self.assertEqual(buffer.stats()['flushed_items'], 6)
+        self.assertEqual(buffer.stats()['max_batch_size'], 3)
+
+    def test_partial_batch_flushes_after_the_delay(self):
+        buffer = WriteBuffer(lambda items: items, max_batch=100, max_delay=0.05)
+        started = time.monotonic()
+        futures = [buffer.submit(i) for i in range(3)]
+        self.assertEqual([future.result(timeout=1) for future in futures], [0, 1, 2])
+        self.assertGreaterEqual(time.monotonic() - started, 0.05)
+        self.assertEqual(buffer.stats()['flushes'], 1)
+        self.assertEqual(buffer.queue_depth(), 0)
+
+    def test_failed_flush_fails_every_future_of_the_batch(self):
+        def flush(items):
+            raise ValueError('database is down')
+
+        buffer = WriteBuffer(flush, max_batch=2, max_delay=0.01)
+        futures = [buffer.submit(i) for i in range(2)]
+        for future in futures:
+            with self.assertRaises(ValueError):
+                future.result(timeout=1)
+        self.assertEqual(buffer.stats()['failed_flushes'], 1)
+        self.assertEqual(buffer.submit(3).exception(timeout=1).args, ('database is down',))
+
+
+@override_settings(MESSAGE_WRITE_BUFFER=True)
+class BufferedSendTest(TransactionTestCase):
+    def setUp(self):
+        write_buffer._write_buffer = WriteBuffer(write_buffer.flush_messages, max_batch=50, max_delay=0.05)
+
+    def tearDown(self):
+        write_buffer._write_buffer = None
+        clear_caches()
+
+    def _send(self, i):
+        return Client().post(f'/message/send/receiver-{i % 3}', data=dict(sender='sender', message=f'message {i}'),
+                             content_type='application/json')
+
+    def test_concurrent_sends_are_group_committed(self):
+        with ThreadPoolExecutor(max_workers=10) as executor:
+            responses = list(executor.map(self._send, range(20)))
+        self.assertEqual({response.status_code for response in responses}, {200})
+        self.assertEqual(MessageRecord.objects.count(), 20)
+        stats = write_buffer.get_write_buffer().stats()
+        self.assertEqual(stats['flushed_items'], 20)
+        self.assertLess(stats['flushes'], 20)
+
+    def test_invalid_username_is_rejected_before_buffering(self):
+        response = Client().post('/message/send/x', data=dict(sender='sender', message='hi'),
+                                 content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(write_buffer.get_write_buffer().stats()['flushes'], 0)